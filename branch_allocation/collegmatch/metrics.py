@@ -0,0 +1,240 @@
+"""
+Request and application metrics in Prometheus text format.
+
+MetricsMiddleware times every request and, through
+connection.execute_wrapper(), the SQL it runs, and records per URL name
+and method:
+
+- collegmatch_request_duration_seconds: latency histogram
+- collegmatch_request_queries: histogram of SQL queries per request
+- collegmatch_request_sql_seconds: histogram of SQL time per request
+
+A streaming response is recorded when its body has been sent, so the
+time and queries spent producing it count.
+
+A request slower than METRICS_SLOW_REQUEST_SECONDS or running more than
+METRICS_MAX_QUERIES queries is also logged as a warning on the
+'collegmatch.metrics' logger.
+
+The app counts its own events with inc(): matching runs (by kind and
+outcome), preference saves and signups. metrics_view serves everything
+at /metrics to admins.
+
+Metrics live in process memory: each worker process reports its own,
+and they reset on restart.
+"""
+import logging
+import threading
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.db import connection
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+_lock = threading.Lock()
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing count per label set."""
+    kind = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in sorted(self.values.items()):
+            yield f'{self.name}{_labels(key)} {_number(value)}'
+
+
+class Histogram:
+    """Observations per label set, counted into cumulative buckets."""
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        # label set → [count per bucket (not cumulative), sum, count]
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [[0] * len(self.buckets), 0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        for key, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                yield f'{self.name}_bucket{_labels(key + (("le", _number(bound)),))} {cumulative}'
+            yield f'{self.name}_bucket{_labels(key + (("le", "+Inf"),))} {count}'
+            yield f'{self.name}_sum{_labels(key)} {_number(total)}'
+            yield f'{self.name}_count{_labels(key)} {count}'
+
+
+REQUEST_DURATION = Histogram(
+    'collegmatch_request_duration_seconds', 'Request latency by view.',
+    getattr(settings, 'METRICS_LATENCY_BUCKETS', LATENCY_BUCKETS),
+)
+REQUEST_QUERIES = Histogram(
+    'collegmatch_request_queries', 'SQL queries run per request, by view.', QUERY_BUCKETS,
+)
+REQUEST_SQL = Histogram(
+    'collegmatch_request_sql_seconds', 'Time spent in SQL per request, by view.',
+    getattr(settings, 'METRICS_LATENCY_BUCKETS', LATENCY_BUCKETS),
+)
+COUNTERS = {
+    'matching_runs': Counter('collegmatch_matching_runs_total', 'Matching jobs finished, by kind and status.'),
+    'preference_saves': Counter('collegmatch_preference_saves_total', 'Preference lists saved from the student page.'),
+    'signups': Counter('collegmatch_signups_total', 'Student accounts created through the signup form.'),
+}
+METRICS = [REQUEST_DURATION, REQUEST_QUERIES, REQUEST_SQL, *COUNTERS.values()]
+
+
+def inc(event, amount=1, **labels):
+    """Count an application event (a COUNTERS key)."""
+    COUNTERS[event].inc(amount, **labels)
+
+
+def render():
+    """Every metric in Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        for metric in METRICS:
+            lines.append(f'# HELP {metric.name} {metric.help_text}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+
+
+# ─────────────────────────────────────────────────────────────
+# Middleware
+# ─────────────────────────────────────────────────────────────
+
+class _QueryTimer:
+    """connection.execute_wrapper() hook counting queries and their time."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += perf_counter() - start
+
+
+class _TimedStream:
+    """
+    A streaming body whose chunks are produced under `timer`; calls
+    `record` once when the response closes it.
+    """
+
+    def __init__(self, content, timer, record):
+        self.iterator = iter(content)
+        self.content = content
+        self.timer = timer
+        self.record = record
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with connection.execute_wrapper(self.timer):
+            return next(self.iterator)
+
+    def close(self):
+        try:
+            if hasattr(self.content, 'close'):
+                self.content.close()
+        finally:
+            if self.record is not None:
+                self.record()
+                self.record = None
+
+
+class MetricsMiddleware:
+    """Records latency, query count and SQL time of each request by URL name."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_seconds = getattr(settings, 'METRICS_SLOW_REQUEST_SECONDS', 1.0)
+        self.max_queries = getattr(settings, 'METRICS_MAX_QUERIES', 50)
+
+    def __call__(self, request):
+        timer = _QueryTimer()
+        start = perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+
+        if response.streaming and not getattr(response, 'is_async', False):
+            response.streaming_content = _TimedStream(
+                response.streaming_content, timer,
+                lambda: self._record(request, perf_counter() - start, timer),
+            )
+        else:
+            self._record(request, perf_counter() - start, timer)
+        return response
+
+    def _record(self, request, elapsed, timer):
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name or match.view_name) if match else '<unresolved>'
+        REQUEST_DURATION.observe(elapsed, view=view, method=request.method)
+        REQUEST_QUERIES.observe(timer.count, view=view, method=request.method)
+        REQUEST_SQL.observe(timer.seconds, view=view, method=request.method)
+
+        if elapsed > self.slow_seconds or timer.count > self.max_queries:
+            logger.warning(
+                '%s %s (%s) took %.3fs with %d queries (%.3fs in SQL)',
+                request.method, request.path, view, elapsed, timer.count, timer.seconds,
+            )
+
+
+def _is_admin(user):
+    return user.is_staff or user.is_superuser
+
+
+@login_required
+@user_passes_test(_is_admin, login_url='/login/')
+def metrics_view(request):
+    """Admin: all metrics of this process, for Prometheus to scrape."""
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
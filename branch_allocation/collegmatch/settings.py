@@ -19,6 +19,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'collegmatch.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -68,3 +69,53 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/login/'
+
+# Matching engine
+MATCHING_LOAD_CHUNK_SIZE = 20000   # rows fetched per round-trip by the loader
+MATCHING_PERSIST_BATCH_SIZE = 5000  # Allotment rows per INSERT when saving a run
+MATCHING_JOB_WORKERS = 1               # background threads running matching jobs
+MATCHING_JOB_PROGRESS_INTERVAL = 0.5   # min seconds between progress writes
+MATCHING_JOB_STALE_AFTER = 900         # seconds without progress before a job counts as dead
+MATCHING_JOB_HEARTBEAT = 60            # seconds between a running job's liveness writes
+MATCHING_VERIFY = True                 # check each run's stability before it goes live (see matching/verify.py)
+# Opt-in captures stored with each run (see matching/profiling.py); both slow runs down
+MATCHING_PROFILE = False               # cProfile the run, downloadable from the results page
+MATCHING_TRACE_MEMORY = False          # tracemalloc peak of Python memory per phase (several times slower)
+
+ADMIN_PREFERENCES_PAGE_SIZE = 50   # students per page on the admin preferences list
+STUDENT_SEARCH_LIMIT = 10          # suggestions returned by the student autocomplete
+RESULTS_PAGE_SIZE = 100            # allotments per page on a branch's result page
+RESULTS_EXPORT_CHUNK_SIZE = 5000   # rows fetched per round-trip when exporting a result
+
+# Student allotment page cache (see matching/allotment_cache.py). Local
+# memory is per process: point ALLOTMENT_CACHE at a shared backend such as
+# django.core.cache.backends.filebased.FileBasedCache when running several
+# workers, so one warm-up serves them all.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'allotments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'allotments',
+        'TIMEOUT': 7 * 24 * 3600,
+        'OPTIONS': {'MAX_ENTRIES': 2_000_000},
+    },
+}
+ALLOTMENT_CACHE = 'allotments'
+ALLOTMENT_CACHE_VERSION_TTL = 30   # seconds a process trusts its idea of the active result
+BRANCH_IDS_CACHE_TTL = 60          # seconds the default branch order (matching/preferences.py) stays cached
+# Where submitted preference lists are stored (see matching/preferences.py):
+# 'packed' keeps each distinct list once as a binary PreferenceList that
+# students point at, 'rows' as one Preference row per branch. Switch with
+# `manage.py convert_preferences`.
+PREFERENCE_STORAGE = 'packed'
+PREFERENCE_BLOB_BATCH_SIZE = 1000  # students or packed lists handled per batch
+
+IMPORT_BATCH_SIZE = 5000           # records per transaction in manage.py import_counselling
+BENCHMARK_HISTORY = BASE_DIR / 'benchmark_history.json'  # runs recorded by manage.py benchmark
+BENCHMARK_TOLERANCE = 0.1          # slowdown or memory growth flagged by `benchmark --compare`
+
+# Request metrics served at /metrics (see collegmatch/metrics.py)
+METRICS_SLOW_REQUEST_SECONDS = 1.0  # requests slower than this are logged
+METRICS_MAX_QUERIES = 50            # ... as are requests running more SQL queries
@@ -1,16 +1,24 @@
 from django.contrib import admin
-from .models import Branch, StudentProfile, Preference, MatchingResult, Allotment
+from .models import (
+    Branch, StudentProfile, Preference, PreferenceList, MatchingResult, Allotment,
+    CounsellingRound, SeatChoice, SeatQuota, MatchingJob, BranchSummary, MatchingProfile,
+)
+
+class SeatQuotaInline(admin.TabularInline):
+    model = SeatQuota
+    extra = 0
 
 @admin.register(Branch)
 class BranchAdmin(admin.ModelAdmin):
-    list_display = ['college', 'branch', 'seats']
+    list_display = ['college', 'branch', 'seats', 'state']
     list_filter = ['college']
     search_fields = ['college', 'branch']
+    inlines = [SeatQuotaInline]
 
 @admin.register(StudentProfile)
 class StudentProfileAdmin(admin.ModelAdmin):
-    list_display = ['display_name', 'air_rank', 'has_submitted']
-    list_filter = ['has_submitted']
+    list_display = ['display_name', 'air_rank', 'category', 'gender', 'home_state', 'has_submitted']
+    list_filter = ['has_submitted', 'category', 'gender']
     search_fields = ['user__first_name', 'user__last_name', 'user__username']
 
 @admin.register(Preference)
@@ -18,11 +26,41 @@ class PreferenceAdmin(admin.ModelAdmin):
     list_display = ['student', 'rank', 'branch']
     list_filter = ['branch__college']
 
+@admin.register(PreferenceList)
+class PreferenceListAdmin(admin.ModelAdmin):
+    list_display = ['digest', 'length']
+    readonly_fields = ['digest', 'length']
+
 @admin.register(MatchingResult)
 class MatchingResultAdmin(admin.ModelAdmin):
     list_display = ['run_at', 'is_active', 'total_matched', 'total_unmatched', 'total_unfilled']
+    readonly_fields = ['stats']
+
+@admin.register(MatchingProfile)
+class MatchingProfileAdmin(admin.ModelAdmin):
+    list_display = ['result', 'created_at']
 
 @admin.register(Allotment)
 class AllotmentAdmin(admin.ModelAdmin):
-    list_display = ['student', 'branch', 'preference_rank', 'is_matched']
-    list_filter = ['is_matched', 'branch__college']
+    list_display = ['student', 'branch', 'quota', 'preference_rank', 'is_matched']
+    list_filter = ['is_matched', 'quota', 'branch__college']
+
+@admin.register(BranchSummary)
+class BranchSummaryAdmin(admin.ModelAdmin):
+    list_display = ['result', 'branch', 'quota', 'seats', 'filled', 'opening_air', 'closing_air', 'mean_preference_rank']
+    list_filter = ['quota', 'branch__college']
+
+@admin.register(CounsellingRound)
+class CounsellingRoundAdmin(admin.ModelAdmin):
+    list_display = ['number', 'result', 'created_at']
+
+@admin.register(SeatChoice)
+class SeatChoiceAdmin(admin.ModelAdmin):
+    list_display = ['student', 'round', 'choice', 'updated_at']
+    list_filter = ['round', 'choice']
+
+@admin.register(MatchingJob)
+class MatchingJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'status', 'phase', 'created_at', 'finished_at', 'result']
+    list_filter = ['kind', 'status']
+    readonly_fields = ['timings', 'error']
@@ -7,126 +7,639 @@ they can hold, displacing a weaker student if over capacity.
 
 The result is stable: no student and branch can both prefer
 each other over their current assignment.
+
+Each branch's seats may be split into quotas (SeatQuota). A student
+competes for every quota of a branch they are eligible for, OPEN first,
+and quota seats nobody eligible took are de-reserved to another
+category after the main run.
+
+A run is split into stages:
+- load_matching_input():   read the database into compact arrays
+- gale_shapley() (kernel): compute the matching, no database access
+- dereserve_seats():       move unfilled reserved seats, re-solving
+- persist_matching():      write a staging MatchingResult + Allotment rows
+- activate_result():       atomically publish the staging result
 """
+import json
+from array import array
+from bisect import bisect_left
+from hashlib import sha1
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .kernel import gale_shapley, rematch, dereserve, Applicants, UNMATCHED, UNRANKED_AIR
 from .models import (
-    Branch, StudentProfile, Preference,
-    MatchingResult, Allotment
+    Branch, StudentProfile, SeatQuota,
+    MatchingResult, Allotment, BranchSummary, quota_code
 )
+from .profiling import RunRecorder
 
 
-def run_gale_shapley():
+def no_progress(phase, done=0, total=0):
     """
-    Run the student-proposing Gale-Shapley algorithm.
-    Returns the MatchingResult instance.
+    Default progress callback. Stages call progress(phase) when a phase
+    starts and progress(phase, done, total) as it advances.
     """
-    students = list(StudentProfile.objects.all().select_related('user'))
-    branches = list(Branch.objects.all())
 
-    if not students or not branches:
-        return None
 
-    # Build preference list per student: {student_id: [branch_id, ...]}
-    prefs = {}
-    for s in students:
-        ordered = (
-            Preference.objects
-            .filter(student=s)
-            .order_by('rank')
-            .values_list('branch_id', flat=True)
-        )
-        if ordered:
-            prefs[s.id] = list(ordered)
-        else:
-            # No preferences submitted → default to all branches ordered by id
-            prefs[s.id] = [b.id for b in branches]
+class MatchingInput:
+    """
+    Everything the kernel needs, plus the ids to map positions back.
 
-    # College preference over students: lower AIR rank = better
-    # air_rank=None → treated as worst
-    def air(sid):
-        s = next((x for x in students if x.id == sid), None)
-        return s.air_rank if (s and s.air_rank) else 999999
+    The kernel works on seat buckets ("slots"): one per SeatQuota row of
+    a branch, or a single OPEN slot holding Branch.seats for a branch
+    without quotas. A student's choice of a branch expands to one entry
+    per slot of it they are eligible for, best-suited slot first.
 
-    # Proposal index per student
-    prop_idx = {s.id: 0 for s in students}
+    - student_ids[i], branch_ids[b]: database ids
+    - slot_branch[j], slot_quota[j]: branch position and quota code of slot j
+    - indptr, indices, air, seats: laid out as documented in kernel.py,
+      with slots in place of branches
+    - ranks[p]: preference rank (1-based) entry p came from
+    - dereserve: (source slot, target slot) de-reservation rules
+    - catalog: digest of everything besides seat counts that shapes the
+      slots, so a warm start can tell when the layout moved
+    """
 
-    # Current holders per branch slot: {branch_id: [student_id, ...]}
-    slots = {b.id: [] for b in branches}
-    branch_map = {b.id: b for b in branches}
+    def __init__(self, student_ids, branch_ids, slot_branch, slot_quota, indptr, indices, ranks,
+                 air, seats, dereserve=(), catalog='', loaded_at=None):
+        self.student_ids = student_ids
+        self.branch_ids = branch_ids
+        self.slot_branch = slot_branch
+        self.slot_quota = slot_quota
+        self.indptr = indptr
+        self.indices = indices
+        self.ranks = ranks
+        self.air = air
+        self.seats = seats
+        self.dereserve = dereserve
+        self.catalog = catalog
+        self.loaded_at = loaded_at
 
-    free = [s.id for s in students]
+    @property
+    def num_students(self):
+        return len(self.student_ids)
 
-    max_iter = len(students) * len(branches) + 10
-    it = 0
+    @property
+    def num_branches(self):
+        return len(self.branch_ids)
 
-    while free and it < max_iter:
-        it += 1
-        sid = free.pop(0)
-        pref_list = prefs.get(sid, [])
-        idx = prop_idx[sid]
+    @property
+    def num_slots(self):
+        return len(self.slot_branch)
 
-        if idx >= len(pref_list):
-            continue  # exhausted all preferences
+    def slot_key(self, j):
+        """Stable name of slot j across runs, e.g. '12:OBC-NCL-FO'."""
+        return f"{self.branch_ids[self.slot_branch[j]]}:{self.slot_quota[j]}"
 
-        bid = pref_list[idx]
-        prop_idx[sid] += 1
+    def find_entry(self, i, slot, pref_rank=None):
+        """
+        Position of student i's entry for `slot`, or UNMATCHED.
+        With `pref_rank`, only entries from that preference rank count.
+        """
+        lo, hi = self.indptr[i], self.indptr[i + 1]
+        if pref_rank is not None:
+            lo = bisect_left(self.ranks, pref_rank, lo, hi)
+        for p in range(lo, hi):
+            if pref_rank is not None and self.ranks[p] != pref_rank:
+                break
+            if self.indices[p] == slot:
+                return p
+        return UNMATCHED
 
-        branch = branch_map.get(bid)
-        if not branch:
-            free.append(sid)
-            continue
 
-        holders = slots[bid]
+# Order of a branch's slots in an eligible student's list: OPEN before
+# the student's own category, gender-neutral before female-only
+_DOMICILE_ORDER = {SeatQuota.HOME_STATE: 0, SeatQuota.OTHER_STATE: 1, SeatQuota.ALL_INDIA: 2}
 
-        if len(holders) < branch.seats:
-            holders.append(sid)
-        else:
-            # Find worst holder by AIR rank (higher rank number = worse)
-            worst = max(holders, key=lambda h: air(h))
-            if air(sid) < air(worst):
-                holders.remove(worst)
-                holders.append(sid)
-                free.append(worst)
+# Key of the default preference list among shared list keys
+_DEFAULT_LIST = 'default'
+
+
+def _slot_order(quota):
+    category, pool, domicile = quota[:3]
+    return (
+        category != StudentProfile.OPEN,
+        pool == SeatQuota.FEMALE_ONLY,
+        _DOMICILE_ORDER[domicile],
+    )
+
+
+def _eligible(quota, state, category, female, home_state):
+    q_category, pool, domicile = quota[:3]
+    if q_category != StudentProfile.OPEN and q_category != category:
+        return False
+    if pool == SeatQuota.FEMALE_ONLY and not female:
+        return False
+    at_home = bool(home_state) and home_state == state
+    if domicile == SeatQuota.HOME_STATE:
+        return at_home
+    if domicile == SeatQuota.OTHER_STATE:
+        return not at_home
+    return True
+
+
+def _normalize_state(state):
+    return (state or '').strip().lower()
+
+
+def load_matching_input(chunk_size=None):
+    """
+    Read students, branches and preferences into a MatchingInput.
+
+    Preferences come from a single query ordered by (student, rank),
+    streamed in chunks and appended straight into the CSR arrays, so
+    memory stays bounded by the arrays themselves. Students without
+    stored preferences get the default list. Slot lists are worked out
+    once per (category, gender, home state) and branch.
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'MATCHING_LOAD_CHUNK_SIZE', 20000)
+    loaded_at = timezone.now()
+
+    quotas = {}
+    for bid, *quota in (
+        SeatQuota.objects
+        .values_list('branch_id', 'category', 'pool', 'domicile', 'seats', 'dereserve_to')
+    ):
+        quotas.setdefault(bid, []).append(tuple(quota))
+
+    branch_ids = array('q')
+    states = []
+    slot_branch = array('l')
+    slot_quota = []
+    seats = array('l')
+    branch_slots = []   # per branch: [(slot, quota)]
+    dereserve = []
+    for b, (bid, bseats, state) in enumerate(
+        Branch.objects.order_by('id').values_list('id', 'seats', 'state')
+    ):
+        branch_ids.append(bid)
+        states.append(_normalize_state(state))
+        rows = sorted(quotas.get(bid, ()), key=_slot_order)
+        if not rows:
+            rows = [(StudentProfile.OPEN, SeatQuota.GENDER_NEUTRAL, SeatQuota.ALL_INDIA, bseats, '')]
+        slots = []
+        for quota in rows:
+            slots.append((len(slot_branch), quota))
+            slot_branch.append(b)
+            slot_quota.append(quota_code(*quota[:3]))
+            seats.append(quota[3])
+        by_bucket = {quota[:3]: j for j, quota in slots}
+        for j, (category, pool, domicile, _, target) in slots:
+            if target and pool != SeatQuota.FEMALE_ONLY:
+                k = by_bucket.get((target, pool, domicile))
+                if k is not None:
+                    dereserve.append((j, k))
+        branch_slots.append(slots)
+    branch_pos = {bid: b for b, bid in enumerate(branch_ids)}
+    # Students who never submitted a list rank the whole catalog in its
+    # default order (see preferences.default_order())
+    default_list = [branch_pos[bid] for bid in Branch.objects.values_list('id', flat=True)]
+
+    catalog = sha1(repr((
+        list(branch_ids), states, slot_quota, dereserve, default_list,
+    )).encode()).hexdigest()
+
+    # Without any quotas every branch is one slot open to everyone
+    plain = len(slot_branch) == len(branch_ids)
+    expansions = {}
+
+    def expansion(group):
+        # Slots of each branch a student of this group may take
+        slots = expansions.get(group)
+        if slots is None:
+            category, female, home_state = group
+            slots = expansions[group] = [
+                [j for j, quota in branch_slots[b] if _eligible(quota, states[b], category, female, home_state)]
+                for b in range(len(branch_ids))
+            ]
+        return slots
+
+    student_ids = array('q')
+    air = array('q')
+    groups = []
+    students = (
+        StudentProfile.objects
+        .order_by('id')
+        .values_list('id', 'air_rank', 'category', 'gender', 'home_state')
+        .iterator(chunk_size=chunk_size)
+    )
+    for sid, air_rank, category, gender, home_state in students:
+        student_ids.append(sid)
+        air.append(air_rank or UNRANKED_AIR)
+        if not plain:
+            groups.append((category, gender == 'F', _normalize_state(home_state)))
+    n = len(student_ids)
+
+    indptr = array('q', [0])
+    indices = array('l')
+    ranks = array('l')
+    # Students on the same stored list (or the default list) in the same
+    # eligibility group expand to the same row; expand it once and reuse
+    # it. Each student still gets their own copy in `indices`, since the
+    # kernel identifies a proposal by its position.
+    expanded = {}
+    seen = set()
+
+    def close_student(i, key=_DEFAULT_LIST, bids=None):
+        memo = (key, None if plain else groups[i])
+        row = expanded.get(memo)
+        if row is None:
+            listed = default_list
+            if bids is not None:
+                listed = [branch_pos[bid] for bid in bids if bid in branch_pos] or default_list
+            if plain:
+                row = (listed, range(1, len(listed) + 1))
             else:
-                free.append(sid)
+                slots = expansion(groups[i])
+                row = (
+                    [j for b in listed for j in slots[b]],
+                    [rank for rank, b in enumerate(listed, 1) for _ in slots[b]],
+                )
+            # Only rows met a second time are kept, so unshared lists cost nothing extra
+            if key is not None:
+                if memo in seen:
+                    expanded[memo] = row
+                seen.add(memo)
+        indices.extend(row[0])
+        ranks.extend(row[1])
+        indptr.append(len(indices))
 
-    # Deactivate old results
-    MatchingResult.objects.filter(is_active=True).update(is_active=False)
+    from .preferences import iter_stored_lists  # imports this module
 
-    # Count stats
-    matched_ids = set(sid for holders in slots.values() for sid in holders)
-    unmatched = [s for s in students if s.id not in matched_ids]
-    total_seats = sum(b.seats for b in branches)
+    i = 0
+    for sid, key, bids in iter_stored_lists():
+        while i < n and student_ids[i] < sid:
+            close_student(i)
+            i += 1
+        if i == n or student_ids[i] != sid:
+            continue  # student created after the snapshot above
+        close_student(i, key, bids)
+        i += 1
+    while i < n:
+        close_student(i)
+        i += 1
 
-    result = MatchingResult.objects.create(
-        is_active=True,
-        total_matched=len(matched_ids),
-        total_unmatched=len(unmatched),
-        total_unfilled=total_seats - len(matched_ids),
+    return MatchingInput(
+        student_ids=student_ids,
+        branch_ids=branch_ids,
+        slot_branch=slot_branch,
+        slot_quota=slot_quota,
+        indptr=indptr,
+        indices=indices,
+        ranks=ranks,
+        air=air,
+        seats=seats,
+        dereserve=dereserve,
+        catalog=catalog,
+        loaded_at=loaded_at,
     )
 
-    # Build allotments
-    allotments = []
 
-    for bid, holders in slots.items():
-        for sid in holders:
-            pref_list = prefs.get(sid, [])
-            pref_rank = pref_list.index(bid) + 1 if bid in pref_list else None
-            allotments.append(Allotment(
+def _batched(iterable, size):
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _iter_allotments(result, data, assignment):
+    # Merit order (AIR, unranked last, then student id), so allotment ids
+    # list every branch's students by rank
+    indices, ranks, air = data.indices, data.ranks, data.air
+    for i in sorted(range(data.num_students), key=lambda i: (air[i], i)):
+        p = assignment[i]
+        if p != UNMATCHED:
+            j = indices[p]
+            yield Allotment(
                 result=result,
-                student_id=sid,
-                branch_id=bid,
-                preference_rank=pref_rank,
+                student_id=data.student_ids[i],
+                branch_id=data.branch_ids[data.slot_branch[j]],
+                preference_rank=ranks[p],
+                quota=data.slot_quota[j],
                 is_matched=True,
-            ))
-
-    for s in unmatched:
-        allotments.append(Allotment(
-            result=result,
-            student=s,
-            branch=None,
-            preference_rank=None,
-            is_matched=False,
-        ))
-
-    Allotment.objects.bulk_create(allotments)
+            )
+        else:
+            yield Allotment(
+                result=result,
+                student_id=data.student_ids[i],
+                branch=None,
+                preference_rank=None,
+                is_matched=False,
+            )
+
+
+def _copy_allotments(result, previous, data, assignment, changed):
+    """
+    Write `result`'s allotments by copying `previous`'s rows inside the
+    database, except for the students at positions in `changed`, whose
+    rows are built from `assignment`. One INSERT ... SELECT keeps merit
+    order across both. Returns False (having written nothing) when the
+    copy can't be used: not SQLite, or a student changed after the run's
+    warm start so the copied rows don't line up with `data`.
+    """
+    if connection.vendor != 'sqlite':
+        return False
+    allotment = Allotment._meta.db_table
+    student = StudentProfile._meta.db_table
+    indices, ranks, air = data.indices, data.ranks, data.air
+    rows = []
+    for i in changed:
+        p = assignment[i]
+        if p == UNMATCHED:
+            rows.append([data.student_ids[i], air[i], None, None, '', 0])
+        else:
+            j = indices[p]
+            rows.append([
+                data.student_ids[i], air[i], data.branch_ids[data.slot_branch[j]],
+                ranks[p], data.slot_quota[j], 1,
+            ])
+    sql = (
+        f"INSERT INTO {allotment} (result_id, student_id, branch_id, preference_rank, quota, is_matched) "
+        f"SELECT %s, sid, bid, rank, quota, matched FROM ("
+        f"SELECT a.student_id AS sid, COALESCE(NULLIF(s.air_rank, 0), {UNRANKED_AIR}) AS air, "
+        f"a.branch_id AS bid, a.preference_rank AS rank, a.quota AS quota, a.is_matched AS matched "
+        f"FROM {allotment} a JOIN {student} s ON s.id = a.student_id "
+        f"WHERE a.result_id = %s AND s.updated_at <= %s "
+        f"AND a.student_id NOT IN (SELECT json_extract(value, '$[0]') FROM json_each(%s)) "
+        f"UNION ALL SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]'), "
+        f"json_extract(value, '$[2]'), json_extract(value, '$[3]'), json_extract(value, '$[4]'), "
+        f"json_extract(value, '$[5]') FROM json_each(%s)"
+        f") ORDER BY air, sid"
+    )
+    rows = json.dumps(rows)
+    stamp = connection.ops.adapt_datetimefield_value(previous.snapshot_at)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(sql, [result.pk, previous.pk, stamp, rows, rows])
+        if cursor.rowcount != data.num_students:
+            transaction.set_rollback(True)
+            return False
+    return True
+
+
+def _summarize(data, assignment, seats):
+    """One unsaved BranchSummary per slot, in slot order."""
+    m = data.num_slots
+    filled = [0] * m
+    opening = [None] * m
+    closing = [None] * m
+    rank_sum = [0] * m
+    indices, ranks, air = data.indices, data.ranks, data.air
+    for i, p in enumerate(assignment):
+        if p == UNMATCHED:
+            continue
+        j = indices[p]
+        filled[j] += 1
+        rank_sum[j] += ranks[p]
+        a = air[i]
+        if a != UNRANKED_AIR:
+            if opening[j] is None or a < opening[j]:
+                opening[j] = a
+            if closing[j] is None or a > closing[j]:
+                closing[j] = a
+    return [
+        BranchSummary(
+            branch_id=data.branch_ids[data.slot_branch[j]],
+            quota=data.slot_quota[j],
+            seats=seats[j],
+            filled=filled[j],
+            opening_air=opening[j],
+            closing_air=closing[j],
+            mean_preference_rank=rank_sum[j] / filled[j] if filled[j] else None,
+        )
+        for j in range(m)
+    ]
+
+
+def persist_matching(data, assignment, seats=None, batch_size=None, progress=no_progress,
+                     previous=None, changed=None):
+    """
+    Store a kernel assignment as a new, inactive (staging) MatchingResult
+    with its Allotment rows and a BranchSummary per slot.
+
+    `seats` is the slot capacity after de-reservation (data.seats if
+    omitted; counselling rounds can also run over it). Allotments are
+    written in batches of MATCHING_PERSIST_BATCH_SIZE inside one
+    transaction, so a failed write leaves nothing behind; progress is
+    reported after every batch. Call activate_result() to publish it.
+
+    A warm-started run passes the result it started from as `previous`
+    and the positions of students whose allotment may differ from it as
+    `changed`; only their rows are built here, the rest are copied over
+    by the database (see _copy_allotments()).
+    """
+    if batch_size is None:
+        batch_size = getattr(settings, 'MATCHING_PERSIST_BATCH_SIZE', 5000)
+    if seats is None:
+        seats = data.seats
+
+    progress('persist')
+    summaries = _summarize(data, assignment, seats)
+    filled = [summary.filled for summary in summaries]
+    total_matched = sum(filled)
+    total_seats = sum(seats)
+
+    with transaction.atomic():
+        result = MatchingResult.objects.create(
+            is_active=False,
+            total_matched=total_matched,
+            total_unmatched=data.num_students - total_matched,
+            total_unfilled=total_seats - total_matched,
+            snapshot_at=data.loaded_at,
+            seat_snapshot={
+                data.slot_key(j): [data.seats[j], seats[j], filled[j]]
+                for j in range(data.num_slots)
+            },
+            catalog_digest=data.catalog,
+        )
+        for summary in summaries:
+            summary.result = result
+        BranchSummary.objects.bulk_create(summaries, batch_size=batch_size)
+        written = 0
+        progress('persist', written, data.num_students)
+        if previous is not None and _copy_allotments(result, previous, data, assignment, changed):
+            progress('persist', data.num_students, data.num_students)
+            return result
+        for batch in _batched(_iter_allotments(result, data, assignment), batch_size):
+            Allotment.objects.bulk_create(batch)
+            written += len(batch)
+            progress('persist', written, data.num_students)
+
+    return result
+
+
+def activate_result(result):
+    """Make `result` the only active MatchingResult in one atomic flip."""
+    with transaction.atomic():
+        MatchingResult.objects.filter(is_active=True).exclude(pk=result.pk).update(is_active=False)
+        MatchingResult.objects.filter(pk=result.pk).update(is_active=True)
+    result.is_active = True
+    return result
+
+
+def _warm_start(data, previous, chunk_size=None):
+    """
+    Map the previous run onto `data` as kernel.rematch() arguments.
+
+    Students saved since the previous snapshot (or whose allotted entry
+    no longer matches their list) are dirty, as are new students.
+    Returns None when a full run is needed: the slot layout changed, or
+    the previous run de-reserved seats.
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'MATCHING_LOAD_CHUNK_SIZE', 20000)
+
+    snapshot = previous.seat_snapshot
+    if previous.snapshot_at is None or previous.catalog_digest != data.catalog:
+        return None
+    slot_pos = {data.slot_key(j): j for j in range(data.num_slots)}
+    if set(snapshot) != set(slot_pos):
+        return None
+
+    n, m = data.num_students, data.num_slots
+    student_pos = {sid: i for i, sid in enumerate(data.student_ids)}
+
+    changed = (
+        StudentProfile.objects
+        .filter(updated_at__gt=previous.snapshot_at)
+        .values_list('id', flat=True)
+        .iterator(chunk_size=chunk_size)
+    )
+    dirty = {student_pos[sid] for sid in changed if sid in student_pos}
+
+    seed = array('q', [UNMATCHED]) * n
+    seen = bytearray(n)
+    filled = [0] * m
+    vacated = set()
+    allotments = (
+        previous.allotments
+        .values_list('student_id', 'branch_id', 'quota', 'preference_rank')
+        .iterator(chunk_size=chunk_size)
+    )
+    for sid, bid, quota, pref_rank in allotments:
+        i = student_pos.get(sid)
+        if i is None:
+            continue
+        seen[i] = 1
+        if bid is None:
+            continue
+        j = slot_pos[f"{bid}:{quota}"]
+        filled[j] += 1
+        p = UNMATCHED if i in dirty else data.find_entry(i, j, pref_rank)
+        if p == UNMATCHED:
+            dirty.add(i)
+            vacated.add(j)
+        else:
+            seed[i] = p
+    dirty.update(i for i in range(n) if not seen[i])
+
+    prev_seats = array('l', [0]) * m
+    for j in range(m):
+        old_seats, old_effective, old_filled = snapshot[data.slot_key(j)]
+        if old_effective != old_seats:
+            # De-reservation depends on the whole run; it can't be patched
+            return None
+        prev_seats[j] = old_seats
+        # Fewer allotments than before means a student was deleted
+        if filled[j] < old_filled or data.seats[j] > old_seats:
+            vacated.add(j)
+
+    return {
+        'seed': seed,
+        'dirty': dirty,
+        'vacated': vacated,
+        'prev_seats': prev_seats,
+    }
+
+
+def dereserve_seats(data, assignment, stats=None, applicants=None):
+    """
+    Hand unfilled reserved seats on to their de-reservation category.
+    Each move re-solves with a warm-started rematch(), which only replays
+    the chains the new seats open; their counts go to `stats`. Pass the
+    run's kernel.Applicants as `applicants` if it has one. Returns
+    (seats, assignment).
+    """
+    if data.dereserve and applicants is None:
+        applicants = Applicants(data.indptr, data.indices, data.air)
+
+    def resolve(seats, prev_seats, assignment, vacated):
+        return rematch(
+            data.indptr, data.indices, data.air, seats,
+            seed=assignment, dirty=(), vacated=vacated, prev_seats=prev_seats, stats=stats,
+            applicants=applicants,
+        )
+
+    return dereserve(data.indices, data.seats, assignment, data.dereserve, resolve)
+
+
+def run_gale_shapley(incremental=False, progress=no_progress, profile=None):
+    """
+    Run the student-proposing Gale-Shapley algorithm.
+    Returns the MatchingResult instance.
+
+    With incremental=True the run warm-starts from the active result and
+    only replays the proposal chains touched by changes since then, and
+    only the allotments that changed are written out; the outcome is
+    identical to a full run.
+
+    `progress` is called as the run moves through its phases (load,
+    compute, persist, verify, activate); see no_progress(). Phase timings,
+    memory and kernel counters are stored as the result's stats, with a
+    cProfile of the run if `profile` (default MATCHING_PROFILE); see
+    profiling.py.
+
+    The result is checked by verify.verify_run() before it is activated;
+    if it fails, VerificationError is raised and the result is rolled
+    back with its allotments.
+    """
+    from .verify import verify_run  # imports this module
+
+    recorder = RunRecorder(progress, profile=profile)
+    try:
+        recorder('load')
+        data = load_matching_input()
+
+        if not data.num_students or not data.num_branches:
+            return None
+
+        recorder('compute')
+        warm = previous = None
+        if incremental:
+            previous = MatchingResult.objects.filter(is_active=True).first()
+            if previous:
+                warm = _warm_start(data, previous)
+
+        applicants = changed = None
+        if warm is None:
+            previous = None
+            assignment = gale_shapley(data.indptr, data.indices, data.air, data.seats, stats=recorder.kernel)
+        else:
+            applicants = Applicants(data.indptr, data.indices, data.air)
+            assignment = rematch(
+                data.indptr, data.indices, data.air, data.seats, stats=recorder.kernel,
+                applicants=applicants, **warm,
+            )
+        seats, assignment = dereserve_seats(data, assignment, stats=recorder.kernel, applicants=applicants)
+        if warm is not None:
+            seed = warm['seed']
+            changed = set(warm['dirty'])
+            changed.update(i for i, p in enumerate(assignment) if p != seed[i])
+        # One transaction, so a result failing verification leaves nothing behind
+        with transaction.atomic():
+            result = persist_matching(
+                data, assignment, seats, progress=recorder, previous=previous, changed=changed,
+            )
+            verification = verify_run(result, data, progress=recorder)
+            recorder('activate')
+            result = activate_result(result)
+    finally:
+        recorder.finish()
+    recorder.save(result, data, warm_start=warm is not None, verification=verification)
     return result
@@ -0,0 +1,228 @@
+"""
+Cache behind the student allotment page.
+
+Everything the page shows except the student's seat choice is fixed
+once a result is published, so it is cached per student under the
+active MatchingResult's id, used as the cache key version:
+
+- 'published' (unversioned, short TTL): the active result id and its
+  counselling round, if any
+- 'branches' (version = result id): each branch's name, seats and OPEN
+  closing AIR in that result
+- 'student:<id>' (version = result id): the student's allotment and top
+  stored preferences (none for a default list), stamped with the
+  profile's updated_at so a student who edits their list after
+  publication gets a fresh entry
+
+A new run only has to change 'published'; entries of the old result are
+never read again and age out. warm() fills the cache for a whole result
+in bulk when a job publishes it. A page view then costs one query (the
+profile) on a warm cache.
+
+The backend is the ALLOTMENT_CACHE alias in settings.CACHES. The stock
+local-memory cache is per process, which is why 'published' expires
+quickly; use a shared backend (file-based, Redis, Memcached) to warm
+once for every worker.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .algorithm import no_progress
+from .preferences import default_order, iter_stored_heads
+from .models import (
+    Branch, StudentProfile, MatchingResult, Allotment, BranchSummary, CounsellingRound,
+)
+
+PUBLISHED_KEY = 'published'
+BRANCHES_KEY = 'branches'
+# Preferences listed on the allotment page
+TOP_PREFS = 15
+
+
+def _cache():
+    return caches[getattr(settings, 'ALLOTMENT_CACHE', 'default')]
+
+
+def _student_key(student_id):
+    return f'student:{student_id}'
+
+
+def published():
+    """{'result_id', 'round'} of the active result; result_id is None before any run."""
+    cache = _cache()
+    state = cache.get(PUBLISHED_KEY)
+    if state is None:
+        state = {'result_id': None, 'round': None}
+        result_id = MatchingResult.objects.filter(is_active=True).values_list('id', flat=True).first()
+        if result_id is not None:
+            state['result_id'] = result_id
+            state['round'] = (
+                CounsellingRound.objects.filter(result_id=result_id).values('id', 'number').first()
+            )
+        cache.set(PUBLISHED_KEY, state, getattr(settings, 'ALLOTMENT_CACHE_VERSION_TTL', 30))
+    return state
+
+
+def _load_branches(result_id):
+    # branch id → (college, branch, seats, OPEN closing AIR)
+    closing = dict(
+        BranchSummary.objects
+        .filter(result_id=result_id, quota=StudentProfile.OPEN)
+        .values_list('branch_id', 'closing_air')
+    ) if result_id is not None else {}
+    return {
+        bid: (college, branch, seats, closing.get(bid))
+        for bid, college, branch, seats in Branch.objects.values_list('id', 'college', 'branch', 'seats')
+    }
+
+
+def _branches(result_id, refresh=False):
+    cache = _cache()
+    catalog = None if refresh else cache.get(BRANCHES_KEY, version=result_id)
+    if catalog is None:
+        catalog = _load_branches(result_id)
+        cache.set(BRANCHES_KEY, catalog, version=result_id)
+    return catalog
+
+
+def _entry(updated_at, allotment, head):
+    # allotment: (branch_id, preference_rank, quota, is_matched) or None;
+    # head: (first TOP_PREFS branch ids, list length) of the stored list
+    prefs, total = head
+    return updated_at, allotment, tuple(enumerate(prefs, start=1)), total
+
+
+def _head(profile):
+    for _, prefs, total in iter_stored_heads([profile.id], TOP_PREFS):
+        return prefs, total
+    return (), 0
+
+
+def _student_entry(result_id, profile):
+    cache = _cache()
+    entry = cache.get(_student_key(profile.id), version=result_id)
+    if entry is None or entry[0] != profile.updated_at:
+        allotment = (
+            Allotment.objects.filter(result_id=result_id, student=profile)
+            .values_list('branch_id', 'preference_rank', 'quota', 'is_matched')
+            .first()
+        )
+        entry = _entry(profile.updated_at, allotment, _head(profile))
+        cache.set(_student_key(profile.id), entry, version=result_id)
+    return entry
+
+
+def _branch(catalog, branch_id):
+    college, name, seats, closing_air = catalog[branch_id]
+    return {'id': branch_id, 'college': college, 'branch': name, 'seats': seats}, closing_air
+
+
+def allotment_page(profile):
+    """
+    Template context for `profile`'s allotment page: result (a dict, or
+    None before any run), allotment, top_prefs, total_prefs and round
+    (the counselling round whose choices are open on this result).
+    """
+    state = published()
+    result_id = state['result_id']
+    if result_id is None:
+        # Nothing published to cache against: just the preference list
+        _, allotment, prefs, total = _entry(None, None, _head(profile))
+    else:
+        _, allotment, prefs, total = _student_entry(result_id, profile)
+    if not total:
+        # Never submitted: the default order, ranked 1..n
+        order = default_order()
+        prefs, total = tuple(enumerate(order[:TOP_PREFS], start=1)), len(order)
+
+    if result_id is None:
+        catalog = _load_branches(None)
+    else:
+        catalog = _branches(result_id)
+        if any(branch_id not in catalog for _, branch_id in prefs):
+            catalog = _branches(result_id, refresh=True)  # branch added since publication
+
+    if allotment is not None:
+        branch_id, preference_rank, quota, is_matched = allotment
+        if is_matched and branch_id not in catalog:
+            allotment = None  # the branch, and with it the allotment, was deleted
+        else:
+            allotment = {'is_matched': is_matched, 'preference_rank': preference_rank, 'quota': quota}
+            if is_matched:
+                allotment['branch'] = _branch(catalog, branch_id)[0]
+
+    top_prefs = []
+    for rank, branch_id in prefs:
+        if branch_id in catalog:
+            branch, closing_air = _branch(catalog, branch_id)
+            top_prefs.append({'rank': rank, 'branch': branch, 'closing_air': closing_air})
+
+    return {
+        'result': {'id': result_id} if result_id is not None else None,
+        'allotment': allotment,
+        'top_prefs': top_prefs,
+        'total_prefs': total,
+        'round': state['round'],
+    }
+
+
+def warm(result, progress=no_progress, chunk_size=None):
+    """
+    Store every student's entry for `result` and publish it.
+    Reports ('cache', students done, total) to `progress`.
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'MATCHING_PERSIST_BATCH_SIZE', 5000)
+    cache = _cache()
+    _branches(result.pk, refresh=True)
+
+    total = result.total_matched + result.total_unmatched
+    progress('cache', 0, total)
+    allotments = (
+        result.allotments
+        .order_by('student_id')
+        .values_list('student_id', 'student__updated_at', 'branch_id', 'preference_rank', 'quota', 'is_matched')
+        .iterator(chunk_size=chunk_size)
+    )
+    heads = iter_stored_heads(result.allotments.values('student_id'), TOP_PREFS, chunk_size=chunk_size)
+    pending_id, *pending = next(heads, (None, (), 0))
+
+    done = 0
+    batch = {}
+    for student_id, updated_at, *allotment in allotments:
+        # Both streams are ordered by student id; students without a list are absent from prefs
+        while pending_id is not None and pending_id < student_id:
+            pending_id, *pending = next(heads, (None, (), 0))
+        head = pending if pending_id == student_id else ((), 0)
+        batch[_student_key(student_id)] = _entry(updated_at, tuple(allotment), head)
+        if len(batch) == chunk_size:
+            cache.set_many(batch, version=result.pk)
+            done += len(batch)
+            batch = {}
+            progress('cache', done, total)
+    cache.set_many(batch, version=result.pk)
+    progress('cache', done + len(batch), total)
+
+    cache.delete(PUBLISHED_KEY)
+    return published()
+
+
+# ─────────────────────────────────────────────────────────────
+# Invalidation
+# ─────────────────────────────────────────────────────────────
+
+@receiver(post_save, sender=CounsellingRound)
+@receiver(post_delete, sender=CounsellingRound)
+@receiver(post_delete, sender=MatchingResult)
+def _publication_changed(sender, **kwargs):
+    _cache().delete(PUBLISHED_KEY)
+
+
+@receiver(post_save, sender=Branch)
+@receiver(post_delete, sender=Branch)
+def _branch_changed(sender, **kwargs):
+    state = _cache().get(PUBLISHED_KEY)
+    if state and state['result_id'] is not None:
+        _cache().delete(BRANCHES_KEY, version=state['result_id'])
@@ -0,0 +1,14 @@
+from importlib import import_module
+
+from django.apps import AppConfig
+
+
+class MatchingConfig(AppConfig):
+    name = 'matching'
+    default_auto_field = 'django.db.models.BigAutoField'
+
+    def ready(self):
+        # Connects the signals keeping the student search index and cached
+        # lookups in sync
+        for module in ('allotment_cache', 'preferences', 'search'):
+            import_module(f'{self.name}.{module}')
@@ -0,0 +1,272 @@
+"""
+Benchmarks of the matching engine and the hot views.
+
+run_suite() builds a throwaway test database, fills it per scale with
+synthetic data (matching/synthetic.py, so NumPy is needed) and measures:
+
+- matching.full / matching.incremental: run_gale_shapley(), with the
+  time of each phase it reports (load, compute, persist, verify, activate)
+- the student preferences page (GET and a POST reordering the list),
+  the student allotment page, and the admin results and preferences
+  pages, through the Django test client
+
+Each benchmark is timed `repeat` times (the median, fastest run and
+spread are kept) and then run once more under tracemalloc and query
+capture for its peak Python memory and SQL query count, so the
+instrumentation never skews the timings.
+
+Runs are appended to a JSON history file; compare() flags what got
+slower, bigger or chattier than a baseline run. Timings are compared
+fastest run to fastest run, and only by more than the spread either run
+saw between its repeats, so scheduler noise doesn't fail the check.
+"""
+import json
+import os
+import platform
+import subprocess
+import tracemalloc
+from statistics import median
+from time import perf_counter
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from .algorithm import no_progress, run_gale_shapley
+from .models import Branch, MatchingResult, PreferenceList, StudentProfile
+from .preferences import stored_order
+
+# Students per scale, unless given
+SCALES = (1000, 10000)
+# Differences below these never count as regressions (timer and allocator noise)
+MIN_WALL_DELTA = 0.005  # seconds
+MIN_PEAK_DELTA = 256    # KiB
+# Timed runs both sides need before their timings are compared
+MIN_REPEAT = 3
+
+
+def branches_for(students):
+    """Branches generated for a scale of `students`."""
+    return max(60, students // 100)
+
+
+def measure(func, repeat=3, setup=None):
+    """
+    Time `func` `repeat` times, calling `setup` untimed before each call,
+    then once more for peak memory and queries. `func` may return a
+    {phase: seconds} split of its own time.
+    """
+    times = []
+    splits = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = perf_counter()
+        split = func()
+        times.append(perf_counter() - start)
+        if split:
+            splits.append(split)
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    measured = {
+        'wall': median(times),
+        'min': min(times),
+        'spread': max(times) - min(times),
+        'repeat': repeat,
+        'peak_kb': peak // 1024,
+        'queries': len(queries),
+    }
+    if splits:
+        by_phase = {phase: [split.get(phase, 0) for split in splits] for phase in splits[0]}
+        measured['phases'] = {phase: median(seconds) for phase, seconds in by_phase.items()}
+        measured['phase_min'] = {phase: min(seconds) for phase, seconds in by_phase.items()}
+        measured['phase_spread'] = {phase: max(seconds) - min(seconds) for phase, seconds in by_phase.items()}
+    return measured
+
+
+# ─────────────────────────────────────────────────────────────
+# Benchmarks
+# ─────────────────────────────────────────────────────────────
+
+def _matching(incremental=False):
+    def run():
+        marks = []
+
+        def progress(phase, done=0, total=0):
+            if not marks or marks[-1][0] != phase:
+                marks.append((phase, perf_counter()))
+
+        run_gale_shapley(incremental=incremental, progress=progress)
+        marks.append((None, perf_counter()))
+        return {phase: end - start for (phase, start), (_, end) in zip(marks, marks[1:])}
+    return run
+
+
+def _drop_inactive_results():
+    MatchingResult.objects.filter(is_active=False).delete()
+
+
+def _page(client, path, payloads=None):
+    # GET, or POST each of `payloads` in turn as JSON
+    turn = [0]
+
+    def request():
+        if payloads is None:
+            response = client.get(path)
+        else:
+            payload = payloads[turn[0] % len(payloads)]
+            turn[0] += 1
+            response = client.post(path, data=json.dumps(payload), content_type='application/json')
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} answered {response.status_code}")
+    return request
+
+
+def benchmarks():
+    """(name, func, setup) for every benchmark, on the data loaded."""
+    admin = User.objects.create_user('benchmark-admin', is_staff=True)
+    admin_client = Client()
+    admin_client.force_login(admin)
+
+    submitters = StudentProfile.objects.filter(has_submitted=True).order_by('air_rank')
+    student = submitters[submitters.count() // 2]
+    student_client = Client()
+    student_client.force_login(student.user)
+    order = stored_order(student)
+    # Alternate two orders so every POST saves a change
+    reorders = [{'ordered_ids': order[1:] + order[:1]}, {'ordered_ids': order}]
+
+    return [
+        ('matching.full', _matching(), lambda: MatchingResult.objects.all().delete()),
+        ('matching.incremental', _matching(incremental=True), _drop_inactive_results),
+        ('view.student_preferences.get', _page(student_client, '/student/preferences/'), None),
+        ('view.student_preferences.post', _page(student_client, '/student/preferences/', reorders), None),
+        ('view.student_allotment', _page(student_client, '/student/allotment/'), None),
+        ('view.admin_results', _page(admin_client, '/admin-portal/results/'), None),
+        ('view.admin_preferences', _page(admin_client, '/admin-portal/preferences/'), None),
+    ]
+
+
+def run_suite(scales=SCALES, repeat=3, seed=0, progress=no_progress):
+    """
+    Run every benchmark at each scale (students) in a test database that
+    is destroyed afterwards. Returns {'<name>@<scale>': measurements}.
+    Reports (benchmark, done, total) to `progress`.
+    """
+    from .synthetic import SyntheticData, load
+
+    results = {}
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        for scale in scales:
+            caches[getattr(settings, 'ALLOTMENT_CACHE', 'default')].clear()
+            progress(f'fixtures@{scale}')
+            load(SyntheticData(scale, branches_for(scale), seed=seed, submitted=0.9))
+            suite = benchmarks()
+            for done, (name, func, setup) in enumerate(suite):
+                progress(f'{name}@{scale}', done, len(suite))
+                results[f'{name}@{scale}'] = measure(func, repeat=repeat, setup=setup)
+            _reset_data()
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+    return results
+
+
+def _reset_data():
+    MatchingResult.objects.all().delete()
+    StudentProfile.objects.all().delete()
+    User.objects.all().delete()
+    Branch.objects.all().delete()
+    PreferenceList.objects.all().delete()
+
+
+# ─────────────────────────────────────────────────────────────
+# History
+# ─────────────────────────────────────────────────────────────
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def new_run(results, label=''):
+    """A history entry for `results`, stamped with time, commit and versions."""
+    return {
+        'at': timezone.now().isoformat(timespec='seconds'),
+        'label': label,
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'results': results,
+    }
+
+
+def load_history(path):
+    """The runs recorded in the history file at `path`, oldest first."""
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_history(path, history):
+    temp = f"{path}.tmp"
+    with open(temp, 'w') as f:
+        json.dump(history, f, indent=1)
+    os.replace(temp, path)
+
+
+def compare(baseline, current, tolerance=0.1):
+    """
+    Regressions of `current` results against `baseline` ones, as
+    (benchmark, metric, baseline value, current value): fastest wall time
+    (and each phase's) up by more than `tolerance` and by more than the
+    larger spread of the two runs' repeats, peak memory up by more than
+    `tolerance`, or any extra SQL query. Timings of a side with fewer
+    than MIN_REPEAT timed runs are not compared. Benchmarks missing from
+    either side are skipped.
+    """
+    regressions = []
+    for name, now in current.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if min(before.get('repeat', 1), now['repeat']) >= MIN_REPEAT:
+            walls = [('wall', before['min'], now['min'], max(before['spread'], now['spread']))]
+            walls += [
+                (
+                    f'wall[{phase}]', before['phase_min'][phase], seconds,
+                    max(before['phase_spread'][phase], now['phase_spread'][phase]),
+                )
+                for phase, seconds in now.get('phase_min', {}).items()
+                if phase in before.get('phase_min', {})
+            ]
+            for metric, old, new, noise in walls:
+                if new > old * (1 + tolerance) and new - old > max(noise, MIN_WALL_DELTA):
+                    regressions.append((name, metric, old, new))
+        if now['peak_kb'] > before['peak_kb'] * (1 + tolerance) and now['peak_kb'] - before['peak_kb'] > MIN_PEAK_DELTA:
+            regressions.append((name, 'peak_kb', before['peak_kb'], now['peak_kb']))
+        if now['queries'] > before['queries']:
+            regressions.append((name, 'queries', before['queries'], now['queries']))
+    return regressions
@@ -25,6 +25,9 @@ class StudentSignupForm(forms.Form):
         label='Confirm password',
         widget=forms.PasswordInput(attrs={'placeholder': 'Repeat password', 'autocomplete': 'new-password'})
     )
+    category = forms.ChoiceField(choices=StudentProfile.CATEGORY_CHOICES, initial=StudentProfile.OPEN)
+    gender = forms.ChoiceField(choices=StudentProfile.GENDER_CHOICES, required=False)
+    home_state = forms.CharField(max_length=100, required=False, widget=forms.TextInput(attrs={'placeholder': 'Home state'}))
 
     def clean_username(self):
         username = self.cleaned_data['username']
@@ -50,12 +53,12 @@ class StudentSignupForm(forms.Form):
         )
         profile = StudentProfile.objects.create(
             user=user,
+            category=data['category'],
+            gender=data.get('gender', ''),
+            home_state=data.get('home_state', '').strip(),
             has_submitted=False,
         )
-        # Auto-populate preferences with all branches in default order
-        from .models import Preference, Branch
-        for i, branch in enumerate(Branch.objects.all(), start=1):
-            Preference.objects.create(student=profile, branch=branch, rank=i)
+        # No Preference rows: the student starts on the default order
         return user, profile
 
 
@@ -71,11 +74,12 @@ class StudentLoginForm(AuthenticationForm):
 class BranchForm(forms.ModelForm):
     class Meta:
         model = Branch
-        fields = ['college', 'branch', 'seats']
+        fields = ['college', 'branch', 'seats', 'state']
         widgets = {
             'college': forms.TextInput(attrs={'placeholder': 'e.g. IIT Bombay'}),
             'branch': forms.TextInput(attrs={'placeholder': 'e.g. Computer Science & Engg'}),
             'seats': forms.NumberInput(attrs={'min': 1, 'max': 500}),
+            'state': forms.TextInput(attrs={'placeholder': 'e.g. Maharashtra'}),
         }
 
     def clean(self):
@@ -97,6 +101,9 @@ class AdminStudentForm(forms.Form):
     air_rank = forms.IntegerField(min_value=1, widget=forms.NumberInput(attrs={'placeholder': 'AIR rank'}))
     username = forms.CharField(max_length=150, widget=forms.TextInput(attrs={'placeholder': 'Username'}))
     password = forms.CharField(initial='jee2025', widget=forms.TextInput(attrs={'placeholder': 'jee2025'}))
+    category = forms.ChoiceField(choices=StudentProfile.CATEGORY_CHOICES, initial=StudentProfile.OPEN)
+    gender = forms.ChoiceField(choices=StudentProfile.GENDER_CHOICES, required=False)
+    home_state = forms.CharField(max_length=100, required=False, widget=forms.TextInput(attrs={'placeholder': 'Home state'}))
 
     def clean_username(self):
         username = self.cleaned_data['username']
@@ -115,10 +122,10 @@ class AdminStudentForm(forms.Form):
         profile = StudentProfile.objects.create(
             user=user,
             air_rank=data['air_rank'],
+            category=data['category'],
+            gender=data.get('gender', ''),
+            home_state=data.get('home_state', '').strip(),
         )
-        from .models import Preference, Branch
-        for i, branch in enumerate(Branch.objects.all(), start=1):
-            Preference.objects.create(student=profile, branch=branch, rank=i)
         return user, profile
 
 
@@ -0,0 +1,347 @@
+"""
+Bulk import of branches, students and preference lists.
+
+Each kind is read from a .csv file (header row first) or a .jsonl file
+(one JSON object per line) as a stream, and written in batches of
+IMPORT_BATCH_SIZE records, each one transaction of bulk inserts:
+
+- branches: college, branch, seats, state
+- students: username, first_name, last_name, air_rank, category,
+  gender, home_state and optionally password_hash
+- preferences: username and, in JSONL, "preferences": [[college,
+  branch], ...] in order; in CSV one row per choice with username,
+  rank, college and branch, each student's rows next to each other
+
+Branches are matched on (college, branch) and students on username, so
+importing a record again updates it rather than duplicating it.
+Passwords are never hashed per student: each gets their record's
+password_hash, else one hash shared by the whole import, else an
+unusable password.
+
+After every committed batch the byte offset reached in the file is
+saved to a Checkpoint; running the import again with the same
+checkpoint resumes after the last committed batch.
+"""
+import csv
+import json
+import os
+from itertools import groupby
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .algorithm import no_progress
+from .models import Branch, StudentProfile
+from .preferences import append_branch, default_order, has_stored_lists, store_lists
+from .search import index_students
+
+KINDS = ('branches', 'students', 'preferences')
+
+
+class RecordFile:
+    """
+    The records of a .csv or .jsonl file as dicts, from byte `offset` on.
+    Iterating yields (record, byte offset just past the record).
+    """
+
+    def __init__(self, path, offset=0):
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in ('.csv', '.jsonl', '.ndjson'):
+            raise ValueError(f"{path}: expected a .csv or .jsonl file")
+        self.path = path
+        self.is_csv = extension == '.csv'
+        self.offset = offset
+        self.position = 0
+
+    def _lines(self, f):
+        for raw in f:
+            self.position += len(raw)
+            yield raw.decode('utf-8-sig')
+
+    def __iter__(self):
+        with open(self.path, 'rb') as f:
+            fields = None
+            if self.is_csv:
+                header = next(csv.reader([f.readline().decode('utf-8-sig')]), [])
+                fields = [name.strip() for name in header]
+            f.seek(max(self.offset, f.tell()))
+            self.position = f.tell()
+            lines = self._lines(f)
+            if self.is_csv:
+                for row in csv.DictReader(lines, fieldnames=fields):
+                    yield row, self.position
+                return
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    raise ValueError(f"bad JSON before byte {self.position}")
+                yield record, self.position
+
+
+class Checkpoint:
+    """Byte offset reached in each imported file, kept in a JSON file."""
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path) as f:
+                self.state = json.load(f)
+        except FileNotFoundError:
+            self.state = {}
+
+    def _key(self, kind, source):
+        return f"{kind}:{os.path.abspath(source)}"
+
+    def _stamp(self, source):
+        # A file changed since the checkpoint starts over
+        stat = os.stat(source)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def offset(self, kind, source):
+        entry = self.state.get(self._key(kind, source))
+        return entry['offset'] if entry and entry['stamp'] == self._stamp(source) else 0
+
+    def save(self, kind, source, offset):
+        self.state[self._key(kind, source)] = {'stamp': self._stamp(source), 'offset': offset}
+        temp = f"{self.path}.tmp"
+        with open(temp, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(temp, self.path)
+
+    def clear(self):
+        self.state = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# ─────────────────────────────────────────────────────────────
+# Record batches
+# ─────────────────────────────────────────────────────────────
+
+def _text(record, field, required=False):
+    value = record.get(field)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ValueError(f"{field} missing in {record!r}")
+    return value
+
+
+def _number(record, field, default=None):
+    value = _text(record, field)
+    if not value:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        number = -1
+    if number < 0:
+        raise ValueError(f"{field} must be a whole number ≥ 0 in {record!r}")
+    return number
+
+
+def _choice(record, field, choices, default):
+    value = _text(record, field) or default
+    if value not in {code for code, _ in choices}:
+        raise ValueError(f"unknown {field} {value!r} in {record!r}")
+    return value
+
+
+def import_branches(records):
+    """
+    Create or update branches from records; returns the new ones. Stored
+    preference lists get each new branch appended, as when an admin adds
+    one.
+    """
+    branches = {}
+    for record in records:
+        college, name = _text(record, 'college', required=True), _text(record, 'branch', required=True)
+        branches[college, name] = Branch(
+            college=college, branch=name, seats=_number(record, 'seats', default=5), state=_text(record, 'state'),
+        )
+    named = Branch.objects.filter(
+        college__in={college for college, _ in branches}, branch__in={name for _, name in branches},
+    )
+    existing = set(named.values_list('college', 'branch'))
+    Branch.objects.bulk_create(
+        list(branches.values()),
+        update_conflicts=True, unique_fields=['college', 'branch'], update_fields=['seats', 'state'],
+    )
+    default_order(refresh=True)
+
+    new = [branch for branch in named if (branch.college, branch.branch) not in existing]
+    if new and has_stored_lists():
+        for branch in new:
+            append_branch(branch)
+    return new
+
+
+def import_students(records, password_hash=None):
+    """Create or update students (user and profile) from records; returns profile ids."""
+    students = {}
+    for record in records:
+        username = _text(record, 'username', required=True)
+        students[username] = {
+            'first_name': _text(record, 'first_name'),
+            'last_name': _text(record, 'last_name'),
+            'password': _text(record, 'password_hash') or password_hash,
+            'air_rank': _number(record, 'air_rank') or None,
+            'category': _choice(record, 'category', StudentProfile.CATEGORY_CHOICES, StudentProfile.OPEN),
+            'gender': _choice(record, 'gender', StudentProfile.GENDER_CHOICES, ''),
+            'home_state': _text(record, 'home_state'),
+        }
+    staff = User.objects.filter(username__in=students, is_staff=True).values_list('username', flat=True).first()
+    if staff is not None:
+        raise ValueError(f"{staff!r} is a staff account")
+
+    User.objects.bulk_create(
+        [
+            User(
+                username=username,
+                first_name=student['first_name'],
+                last_name=student['last_name'],
+                password=student['password'] or make_password(None),
+            )
+            for username, student in students.items()
+        ],
+        update_conflicts=True, unique_fields=['username'], update_fields=['first_name', 'last_name'],
+    )
+    user_ids = dict(User.objects.filter(username__in=students).values_list('username', 'id'))
+    StudentProfile.objects.bulk_create(
+        [
+            StudentProfile(
+                user_id=user_ids[username],
+                air_rank=student['air_rank'],
+                category=student['category'],
+                gender=student['gender'],
+                home_state=student['home_state'],
+            )
+            for username, student in students.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['air_rank', 'category', 'gender', 'home_state', 'updated_at'],
+    )
+    # Bulk inserts skip the signals that keep the search index current
+    profile_ids = list(StudentProfile.objects.filter(user_id__in=user_ids.values()).values_list('id', flat=True))
+    index_students(profile_ids)
+    return profile_ids
+
+
+def import_preferences(records, catalog=None):
+    """
+    Store the preference lists of records with a username and
+    "preferences": [[college, branch], ...], marking the students
+    submitted. `catalog` maps (college, branch) to a branch id.
+    """
+    if catalog is None:
+        catalog = {(college, name): bid for bid, college, name in Branch.objects.values_list('id', 'college', 'branch')}
+    choices = {}
+    for record in records:
+        username = _text(record, 'username', required=True)
+        ranked = []
+        for choice in record.get('preferences') or []:
+            try:
+                ranked.append(catalog[str(choice[0]).strip(), str(choice[1]).strip()])
+            except (KeyError, IndexError, TypeError):
+                raise ValueError(f"unknown branch {choice!r} for {username!r}")
+        choices[username] = list(dict.fromkeys(ranked))
+
+    profile_ids = dict(StudentProfile.objects.filter(user__username__in=choices).values_list('user__username', 'id'))
+    missing = next((username for username in choices if username not in profile_ids), None)
+    if missing is not None:
+        raise ValueError(f"no student {missing!r}")
+    store_lists({profile_ids[username]: ranked for username, ranked in choices.items()})
+    StudentProfile.objects.filter(id__in=profile_ids.values()).update(has_submitted=True)
+
+
+def _preference_rows(records):
+    # CSV: one row per choice → one record per student
+    for username, rows in groupby(records, key=lambda item: _text(item[0], 'username', required=True)):
+        rows = list(rows)
+        if any(_text(row, 'rank') for row, _ in rows):
+            rows.sort(key=lambda item: _number(item[0], 'rank', default=0))
+        yield {
+            'username': username,
+            'preferences': [[row.get('college'), row.get('branch')] for row, _ in rows],
+        }, rows[-1][1]
+
+
+# ─────────────────────────────────────────────────────────────
+# Files
+# ─────────────────────────────────────────────────────────────
+
+def _import_batches(kind, items, batch_size=None, password_hash=None, progress=no_progress, committed=None):
+    # items: (record, position) pairs; committed(position) runs after each batch commits
+    if kind not in KINDS:
+        raise ValueError(f"unknown kind {kind!r}")
+    if batch_size is None:
+        batch_size = getattr(settings, 'IMPORT_BATCH_SIZE', 5000)
+
+    catalog = None
+    if kind == 'preferences':
+        catalog = {(college, name): bid for bid, college, name in Branch.objects.values_list('id', 'college', 'branch')}
+
+    def write(batch):
+        if kind == 'branches':
+            import_branches(batch)
+        elif kind == 'students':
+            import_students(batch, password_hash=password_hash)
+        else:
+            import_preferences(batch, catalog=catalog)
+
+    done = 0
+    batch = []
+    position = None
+    progress(kind, 0)
+    while True:
+        item = next(items, None)
+        if item is not None:
+            batch.append(item[0])
+            position = item[1]
+        if batch and (item is None or len(batch) == batch_size):
+            with transaction.atomic():
+                write(batch)
+            # Saved only once the batch is committed; a batch written
+            # again after a crash in between just updates itself
+            if committed is not None:
+                committed(position)
+            done += len(batch)
+            batch = []
+            progress(kind, done)
+        if item is None:
+            return done
+
+
+def import_records(kind, records, batch_size=None, password_hash=None, progress=no_progress):
+    """
+    Import an iterable of `kind` records (dicts, see KINDS) in batches.
+    Reports (kind, records done) to `progress` after each batch; returns
+    records imported.
+    """
+    return _import_batches(
+        kind, ((record, None) for record in records),
+        batch_size=batch_size, password_hash=password_hash, progress=progress,
+    )
+
+
+def import_file(kind, path, checkpoint=None, batch_size=None, password_hash=None, progress=no_progress):
+    """
+    Import the `kind` records (see KINDS) of the file at `path`,
+    resuming from `checkpoint` if given. Reports (kind, records done)
+    to `progress` after each batch; returns records imported.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"unknown kind {kind!r}")
+    source = RecordFile(path, checkpoint.offset(kind, path) if checkpoint else 0)
+    items = iter(source)
+    if kind == 'preferences' and source.is_csv:
+        items = _preference_rows(items)
+    return _import_batches(
+        kind, items, batch_size=batch_size, password_hash=password_hash, progress=progress,
+        committed=(lambda position: checkpoint.save(kind, path, position)) if checkpoint is not None else None,
+    )
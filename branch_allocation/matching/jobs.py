@@ -0,0 +1,235 @@
+"""
+Background matching jobs.
+
+The results page submits a job instead of running the matching inside
+the request, and adding a branch queues one that appends it to every
+student's preference list. Jobs run on a local thread pool, one at a
+time, and record their phase, progress and per-phase timings on a
+MatchingJob row that the pages poll through a JSON endpoint. A
+published result is loaded into the student allotment cache before the
+job counts as done.
+
+Progress inside a database transaction (writing allotments) can't be
+committed as it happens, so the latest figures are also kept in memory
+and job_status() overlays them for jobs running in this process.
+
+A job that stops reporting is expired so a new one can start. Phases
+can run long without progress calls (the kernel, a transaction), so
+each running job also gets a heartbeat thread that touches its row
+every MATCHING_JOB_HEARTBEAT seconds on its own connection, and jobs
+whose future is still pending in this process are never expired.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.utils import timezone
+
+from collegmatch import metrics
+
+from .algorithm import run_gale_shapley
+from .allotment_cache import warm
+from .models import MatchingJob
+from .preferences import append_branch, prune_lists
+from .rounds import run_next_round
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+# job id → latest {'phase', 'done', 'total'} for jobs running in this process
+_live = {}
+# job id → Future of jobs submitted from this process
+_futures = {}
+
+
+class JobAlreadyRunning(Exception):
+    """Raised by submit_job() while another job is queued or running."""
+
+    def __init__(self, job):
+        self.job = job
+        super().__init__(f"Matching job #{job.pk if job else '?'} is still running")
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'MATCHING_JOB_WORKERS', 1),
+                thread_name_prefix='matching-job',
+            )
+        return _executor
+
+
+def active_job():
+    """The queued or running MatchingJob, or None."""
+    return MatchingJob.objects.filter(active=True).first()
+
+
+def _pending_here():
+    # Ids of jobs queued or running on this process's executor
+    for job_id, future in list(_futures.items()):
+        if future.done():
+            _futures.pop(job_id, None)
+    return list(_futures)
+
+
+def _expire_stale():
+    # A job whose worker died never clears its `active` flag
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'MATCHING_JOB_STALE_AFTER', 900))
+    stale = MatchingJob.objects.filter(active=True, updated_at__lt=cutoff).exclude(pk__in=_pending_here())
+    stale.update(
+        active=None,
+        status=MatchingJob.FAILED,
+        error='Abandoned: the job stopped reporting progress.',
+        finished_at=timezone.now(),
+    )
+
+
+def submit_job(kind, user=None, branch=None):
+    """
+    Queue a matching job of `kind` (a MatchingJob.KIND_CHOICES value);
+    ADD_BRANCH jobs also take the new `branch`. Returns the MatchingJob;
+    raises JobAlreadyRunning if one is active.
+    """
+    _expire_stale()
+    try:
+        with transaction.atomic():
+            job = MatchingJob.objects.create(kind=kind, requested_by=user, branch=branch)
+    except IntegrityError:
+        raise JobAlreadyRunning(active_job())
+
+    def start():
+        _futures[job.pk] = _get_executor().submit(run_job, job.pk)
+
+    transaction.on_commit(start)
+    return job
+
+
+def job_status(job):
+    """JSON-ready state of `job`, including live progress if it runs here."""
+    status = job.as_dict()
+    live = _live.get(job.pk)
+    if live and not job.is_finished:
+        status.update(live)
+    return status
+
+
+class JobProgress:
+    """
+    Progress callback handed to the matching pipeline.
+
+    Closes the previous phase's timer whenever a new phase starts. Rows
+    are written on phase changes and at most every
+    MATCHING_JOB_PROGRESS_INTERVAL seconds in between, and never from
+    inside a transaction.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.phase = None
+        self.started = None
+        self.last_write = 0.0
+        self.interval = getattr(settings, 'MATCHING_JOB_PROGRESS_INTERVAL', 0.5)
+
+    def __call__(self, phase, done=0, total=0):
+        now = time.monotonic()
+        changed = phase != self.phase
+        if changed:
+            self._close_phase(now)
+            self.phase, self.started = phase, now
+
+        job = self.job
+        job.phase, job.done, job.total = phase, done, total
+        _live[job.pk] = {'phase': phase, 'done': done, 'total': total}
+        if (changed or now - self.last_write >= self.interval) and not connection.in_atomic_block:
+            self.last_write = now
+            job.save(update_fields=['phase', 'done', 'total', 'timings', 'updated_at'])
+
+    def _close_phase(self, now):
+        if self.phase is not None:
+            self.job.timings[self.phase] = round(now - self.started, 3)
+
+    def finish(self):
+        self._close_phase(time.monotonic())
+        self.phase = None
+
+
+class Heartbeat(threading.Thread):
+    """
+    Touches a running job's `updated_at` every `interval` seconds until
+    stopped. It runs on its own thread, and so its own connection, to
+    keep beating while the job computes or holds a transaction open; a
+    beat refused because the database is locked is retried on the next.
+    """
+
+    def __init__(self, job_id, interval=None):
+        super().__init__(name=f'matching-job-{job_id}-heartbeat', daemon=True)
+        self.job_id = job_id
+        self.interval = interval or getattr(settings, 'MATCHING_JOB_HEARTBEAT', 60)
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                try:
+                    MatchingJob.objects.filter(pk=self.job_id, active=True).update(updated_at=timezone.now())
+                except DatabaseError:
+                    logger.warning('Heartbeat of matching job #%s failed', self.job_id, exc_info=True)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_job(job_id):
+    """Execute a queued job. Runs on a pool thread."""
+    job = MatchingJob.objects.get(pk=job_id)
+    progress = JobProgress(job)
+    heartbeat = Heartbeat(job_id)
+    heartbeat.start()
+    try:
+        job.status = MatchingJob.RUNNING
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'started_at', 'updated_at'])
+
+        if job.kind == MatchingJob.ADD_BRANCH:
+            if job.branch is None:
+                raise ValueError('The branch was deleted before its job ran.')
+            append_branch(job.branch, progress=progress)
+            job.status = MatchingJob.DONE
+            return
+        if job.kind == MatchingJob.ROUND:
+            counselling_round = run_next_round(progress=progress)
+            result = counselling_round.result if counselling_round else None
+        else:
+            result = run_gale_shapley(incremental=job.kind == MatchingJob.INCREMENTAL, progress=progress)
+
+        if result is None:
+            job.status = MatchingJob.FAILED
+            job.error = 'Add students and branches first.'
+        else:
+            warm(result, progress=progress)
+            prune_lists()  # lists left unused by bulk edits since the last run
+            job.status = MatchingJob.DONE
+            job.result = result
+    except Exception as exc:
+        logger.exception('Matching job #%s failed', job_id)
+        job.status = MatchingJob.FAILED
+        job.error = f'{type(exc).__name__}: {exc}'
+    finally:
+        heartbeat.stop()
+        progress.finish()
+        job.active = None
+        job.finished_at = timezone.now()
+        job.save()
+        _live.pop(job_id, None)
+        metrics.inc('matching_runs', kind=job.kind, status=job.status)
+        connection.close()
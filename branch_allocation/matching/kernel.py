@@ -0,0 +1,442 @@
+"""
+Pure Gale-Shapley kernel.
+
+Works only on compact integer arrays and never touches Django, so it
+can be benchmarked, profiled and reused by simulations on its own.
+
+Input layout (CSR, as in scipy.sparse):
+- indptr:  length n + 1; student i's preference list is
+           indices[indptr[i]:indptr[i + 1]], most preferred first.
+- indices: branch positions, 0 <= j < len(seats).
+- air:     length n; lower = better. Ties are broken by student
+           position so the matching is unique and order-independent.
+- seats:   length m; capacity of each branch.
+
+A "branch" here is any bucket of seats with its own capacity; the app
+passes one per seat quota of a real branch (see algorithm.py).
+"""
+import re
+from array import array
+from bisect import bisect_right
+from collections import deque
+from heapq import heapify, heappop, heappush, heapreplace
+
+# Entry in the assignment array for a student who exhausted their list
+UNMATCHED = -1
+# AIR of a student without a rank: worse than every ranked student
+UNRANKED_AIR = 2 ** 31 - 1
+
+
+def _propose(free, nxt, indptr, indices, key, seats, heaps, assignment, home=None, stats=None):
+    """
+    Let every student in `free` propose down their list until settled.
+    Adds to `stats` if given (see gale_shapley()).
+    """
+    n = len(key)
+    # Guaranteed keys sit below every ordinary key but stay ≡ i (mod n)
+    shift = (max(key) // n + 1) * n if home is not None and n else 0
+    # Displacements leading up to each student's current proposal
+    depth = [0] * n if stats is not None else None
+    proposals = refused = displaced = longest = 0
+
+    while free:
+        i = free.popleft()
+        end = indptr[i + 1]
+        p = start = nxt[i]
+
+        while p < end:
+            j = indices[p]
+            p += 1
+
+            k = key[i]
+            if shift and home[i] == j:
+                k -= shift
+
+            heap = heaps[j]
+            if len(heap) < seats[j]:
+                heappush(heap, -k)
+                assignment[i] = p - 1
+                break
+
+            # Weakest holder sits at the top of the heap
+            if heap and k < -heap[0]:
+                worst = (-heapreplace(heap, -k)) % n
+                assignment[i] = p - 1
+                assignment[worst] = UNMATCHED
+                free.append(worst)
+                if depth is not None:
+                    displaced += 1
+                    depth[worst] = depth[i] + 1
+                    if depth[worst] > longest:
+                        longest = depth[worst]
+                break
+
+        nxt[i] = p
+        if depth is not None:
+            proposals += p - start
+            refused += p - start - (assignment[i] != UNMATCHED)
+
+    if stats is not None:
+        stats['proposals'] = stats.get('proposals', 0) + proposals
+        stats['rejections'] = stats.get('rejections', 0) + refused + displaced
+        stats['longest_chain'] = max(stats.get('longest_chain', 0), longest)
+
+
+def _priority(air):
+    # Strict priority: lower key = better
+    n = len(air)
+    return [air[i] * n + i for i in range(n)]
+
+
+def gale_shapley(indptr, indices, air, seats, home=None, stats=None):
+    """
+    Run student-proposing deferred acceptance.
+
+    Returns an array of length n holding, for every student, the position
+    in `indices` of the entry they were accepted on, or UNMATCHED. The
+    branch is indices[pos] and the preference rank is pos - indptr[i] + 1.
+
+    `home` optionally gives each student a branch (or -1) where they rank
+    ahead of everyone without a guarantee there, as for a seat retained
+    from an earlier counselling round.
+
+    If a `stats` dict is given, the run adds its counts to it:
+    'proposals', 'rejections' (proposals turned down at once, plus
+    holders displaced later) and 'longest_chain', the most displacements
+    one proposal set off in a row.
+
+    Cost is O(total proposals · log seats).
+    """
+    n = len(indptr) - 1
+    key = _priority(air)
+
+    # Next entry each student will propose to
+    nxt = list(indptr[:n])
+    assignment = array('q', [UNMATCHED]) * n
+    # Holders per branch as a max-heap on key (stored negated)
+    heaps = [[] for _ in range(len(seats))]
+
+    _propose(deque(range(n)), nxt, indptr, indices, key, seats, heaps, assignment, home, stats)
+    return assignment
+
+
+def rematch(indptr, indices, air, seats, seed, dirty, vacated, prev_seats, home=None, stats=None,
+            applicants=None):
+    """
+    Update a previous student-optimal matching after small changes.
+
+    The arguments describe the new instance, plus:
+    - seed:       previous assignment mapped onto the new `indices`, with
+                  UNMATCHED for every student in `dirty`.
+    - dirty:      students whose list or AIR changed, or who are new.
+    - vacated:    branches that may have gained a free seat (a holder
+                  left, or seats went up).
+    - prev_seats: seat vector of the previous run.
+    - home:       as in gale_shapley(). Every student outside `dirty`
+                  with a home must hold it (or better) in the seed, as
+                  in counselling rounds.
+    - applicants: an Applicants over the same lists and AIRs, to share
+                  between calls; one is made if omitted.
+
+    Returns the same assignment gale_shapley() would on the new instance.
+
+    Works in two phases. First dirty students are taken out and every
+    freed seat is offered to the best student who ranks that branch above
+    their current seat; the move frees their old seat and so on (a
+    vacancy chain). Then seat cuts evict the weakest holders and the
+    evicted and dirty students propose as usual. With `home`, priorities
+    differ between branches and the result so far is stable but may not
+    be student-optimal, so a third phase carries out exposed rotations
+    until none is left (see _improve()).
+
+    Only what the changes reach is touched: a branch's heap of holders is
+    built the first time a chain or proposal lands on it, its applicant
+    list likewise (see Applicants), and only students who move get a
+    proposal pointer. Besides one pass over `seed` grouping holders by
+    branch, cost is proportional to the chains replayed.
+
+    `stats` is filled as by gale_shapley(), plus 'vacancy_moves': seats
+    taken over in the first phase, and with `home` 'rotation_moves':
+    students moved up in the third.
+    """
+    n = len(indptr) - 1
+    m = len(seats)
+    if applicants is None:
+        applicants = Applicants(indptr, indices, air)
+    key = applicants.key
+    shift = (max(key) // n + 1) * n if home is not None and n else 0
+
+    def key_at(i, j):
+        return key[i] - shift if shift and home[i] == j else key[i]
+
+    assignment = array('q', seed)
+    pending = set(dirty)
+    members = [[] for _ in range(m)]
+    for i, p in enumerate(assignment):
+        if p != UNMATCHED:
+            members[indices[p]].append(i)
+    heaps = _Heaps(members, key_at)
+    # Proposal pointers of students who never move stay implied by the seed
+    nxt = _Pointers(indptr, seed)
+
+    # Phase 1: vacancy chains under the larger of old and new capacity
+    cap = [max(a, b) for a, b in zip(prev_seats, seats)]
+    work = deque(sorted(set(vacated)))
+    moves = 0
+
+    while work:
+        j = work.popleft()
+        heap = heaps[j]
+        while len(heap) < cap[j]:
+            p = _best_applicant(applicants, j, heap, pending, assignment)
+            if p is None:
+                break
+            i = applicants.owner(p)
+            old = assignment[i]
+            if old != UNMATCHED:
+                old_heap = heaps[indices[old]]
+                old_heap.remove(-key_at(i, indices[old]))
+                heapify(old_heap)
+                work.append(indices[old])
+            heappush(heap, -key_at(i, j))
+            assignment[i] = p
+            nxt[i] = p + 1
+            moves += 1
+
+    # Phase 2: seat cuts and dirty students, as ordinary proposals
+    free = deque()
+    for j in range(m):
+        if seats[j] >= cap[j]:
+            continue  # only cut branches can be over capacity
+        heap = heaps[j]
+        while len(heap) > seats[j]:
+            worst = (-heappop(heap)) % n
+            nxt[worst] = assignment[worst] + 1
+            assignment[worst] = UNMATCHED
+            free.append(worst)
+    for i in sorted(pending):
+        nxt[i] = indptr[i]
+        free.append(i)
+
+    if stats is not None:
+        stats['vacancy_moves'] = stats.get('vacancy_moves', 0) + moves
+    _propose(free, nxt, indptr, indices, key, seats, heaps, assignment, home, stats)
+
+    # Phase 3: with homes, students may each be waiting on the next one's seat
+    if shift:
+        moved = _improve(indptr, indices, key, m, assignment)
+        if stats is not None:
+            stats['rotation_moves'] = stats.get('rotation_moves', 0) + moved
+    return assignment
+
+
+def _improve(indptr, indices, key, m, assignment):
+    """
+    Move a stable `assignment` up to the student-optimal one, in place.
+
+    Each branch's rival is the best student ranking it above their seat.
+    Following branch → its rival's branch round a cycle, every rival can
+    take the branch they wait on at once: each branch gives up one
+    student and takes one, and stays stable as nobody better wanted it.
+    Cycles are carried out until none is left, which only holds for the
+    student-optimal matching. Each pass costs one look at every entry
+    ahead of a student's seat. Returns the number of students moved.
+    """
+    n = len(indptr) - 1
+    order = sorted(range(n), key=key.__getitem__)
+    moved = 0
+    while True:
+        # Entry of each branch's rival, found best student first
+        rival = [-1] * m
+        owner = [-1] * m
+        for i in order:
+            p = assignment[i]
+            end = indptr[i + 1] if p == UNMATCHED else p
+            for q in range(indptr[i], end):
+                j = indices[q]
+                if rival[j] < 0:
+                    rival[j] = q
+                    owner[j] = i
+
+        # Branch → branch of its rival; unmatched rivals end a path
+        nxt = [-1] * m
+        for j in range(m):
+            i = owner[j]
+            if i >= 0 and assignment[i] != UNMATCHED:
+                nxt[j] = indices[assignment[i]]
+        cycles = []
+        # 0: unvisited, 1: on the current path, 2: done
+        state = bytearray(m)
+        for s in range(m):
+            path = []
+            j = s
+            while j >= 0 and not state[j]:
+                state[j] = 1
+                path.append(j)
+                j = nxt[j]
+            if j >= 0 and state[j] == 1:
+                cycles.append(path[path.index(j):])
+            for j in path:
+                state[j] = 2
+        if not cycles:
+            return moved
+
+        for cycle in cycles:
+            for j in cycle:
+                assignment[owner[j]] = rival[j]
+            moved += len(cycle)
+
+
+class _Heaps(dict):
+    """Heap of holders per branch, as in gale_shapley(), built from `members` on first use."""
+
+    def __init__(self, members, key_at):
+        super().__init__()
+        self.members = members
+        self.key_at = key_at
+
+    def __missing__(self, j):
+        heap = self[j] = [-self.key_at(i, j) for i in self.members[j]]
+        heapify(heap)
+        return heap
+
+
+class _Pointers(dict):
+    """Next entry per student; a student not yet set resumes just past their seed seat."""
+
+    def __init__(self, indptr, seed):
+        super().__init__()
+        self.indptr = indptr
+        self.seed = seed
+
+    def __missing__(self, i):
+        p = self.seed[i]
+        return p + 1 if p != UNMATCHED else self.indptr[i + 1]
+
+
+def dereserve(indices, seats, assignment, rules, resolve):
+    """
+    Move unfilled seats along de-reservation rules until nothing moves.
+
+    `rules` holds (source, target) branch pairs; a source's seats left
+    empty by its own applicants move to the target. `resolve(seats,
+    prev_seats, assignment, vacated)` re-solves after each move, which
+    may fill or empty further seats. Seats only travel along rule
+    chains, so the number of passes is capped at the number of branches.
+
+    Returns (seats, assignment) after the last move.
+    """
+    if not rules:
+        return seats, assignment
+    for _ in range(len(seats)):
+        filled = [0] * len(seats)
+        for p in assignment:
+            if p != UNMATCHED:
+                filled[indices[p]] += 1
+
+        moved = array('l', seats)
+        vacated = set()
+        for source, target in rules:
+            spare = seats[source] - filled[source]
+            if spare > 0:
+                moved[source] -= spare
+                moved[target] += spare
+                vacated.add(target)
+        if not vacated:
+            break
+        assignment = resolve(moved, seats, assignment, vacated)
+        seats = moved
+    return seats, assignment
+
+
+class Applicants:
+    """
+    Branch → applicant entries (positions in `indices` naming it), best
+    student first, as rematch() needs them to fill freed seats.
+
+    A branch's list is found the first time it is asked for, by searching
+    the raw bytes of `indices` for the branch number (a C-speed scan, not
+    a Python loop over every entry), so a warm start only pays for the
+    branches its vacancy chains reach. Callers re-solving the same lists
+    many times can index every branch once with index_applicants() and
+    pass the result as `index`.
+    """
+
+    def __init__(self, indptr, indices, air, index=None):
+        self.indptr = indptr
+        self.indices = indices
+        self.key = _priority(air)
+        self.index = None if index is None else (index[0], memoryview(index[1]))
+        self.lists = {}
+        self._raw = None
+
+    def owner(self, p):
+        """Student of entry p."""
+        return bisect_right(self.indptr, p) - 1
+
+    def __getitem__(self, j):
+        if self.index is not None:
+            ptr, entries = self.index
+            return entries[ptr[j]:ptr[j + 1]]
+        entries = self.lists.get(j)
+        if entries is None:
+            entries = self.lists[j] = array('q', sorted(self._find(j), key=lambda p: self.key[self.owner(p)]))
+        return entries
+
+    def _find(self, j):
+        # Aligned occurrences of j's bytes in the buffer of `indices`
+        if self._raw is None:
+            self._raw = memoryview(self.indices).cast('B')
+        size = self.indices.itemsize
+        typecode = getattr(self.indices, 'typecode', None) or self.indices.format
+        pattern = re.compile(re.escape(array(typecode, [j]).tobytes()))
+        found = pattern.search(self._raw)
+        while found:
+            at = found.start()
+            if at % size:
+                found = pattern.search(self._raw, at + 1)
+                continue
+            yield at // size
+            found = pattern.search(self._raw, at + size)
+
+
+def index_applicants(indptr, indices, air, m):
+    """
+    Applicant lists of all `m` branches at once, as (ptr, entries): branch
+    j's entries are entries[ptr[j]:ptr[j + 1]]. O(entries + n log n).
+    """
+    n = len(indptr) - 1
+    key = _priority(air)
+    lists = [array('q') for _ in range(m)]
+    for i in sorted(range(n), key=key.__getitem__):
+        for p in range(indptr[i], indptr[i + 1]):
+            lists[indices[p]].append(p)
+    ptr = array('q', [0])
+    entries = array('q')
+    for entries_of in lists:
+        entries.extend(entries_of)
+        ptr.append(len(entries))
+    return ptr, entries
+
+
+def _best_applicant(applicants, j, heap, pending, assignment):
+    """
+    Best student who ranks branch j above their current seat.
+
+    Everyone who wanted the branch and is better than its weakest holder
+    already holds it, so the scan starts just past that holder.
+    """
+    entries = applicants[j]
+    key, owner = applicants.key, applicants.owner
+    start = 0
+    if heap:
+        start = bisect_right(entries, -heap[0], key=lambda p: key[owner(p)])
+    for idx in range(start, len(entries)):
+        p = entries[idx]
+        i = owner(p)
+        if i in pending:
+            continue
+        current = assignment[i]
+        if current == UNMATCHED or p < current:
+            return p
+    return None
@@ -0,0 +1,104 @@
+from importlib.util import find_spec
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from matching.benchmarks import MIN_REPEAT, SCALES
+
+
+def _format(metric, value):
+    if metric.startswith('wall'):
+        return f'{value * 1000:.1f} ms'
+    if metric == 'peak_kb':
+        return f'{value} KiB'
+    return str(value)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark matching runs and the hot views on synthetic data (needs NumPy); nothing touches your database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-s', '--scale', type=int, action='append', metavar='STUDENTS',
+            help=f'Students per fixture. Repeatable (default: {", ".join(map(str, SCALES))})',
+        )
+        parser.add_argument('-r', '--repeat', type=int, default=3, help='Timed runs per benchmark (default: %(default)s)')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the generated fixtures')
+        parser.add_argument(
+            '--history', default=getattr(settings, 'BENCHMARK_HISTORY', 'benchmark_history.json'),
+            help='JSON file the run is appended to (default: %(default)s)',
+        )
+        parser.add_argument('--label', default='', help='Note stored with the run, e.g. a branch name')
+        parser.add_argument('--no-save', action='store_true', help='Do not append the run to the history')
+        parser.add_argument(
+            '--compare', action='store_true',
+            help=(
+                f'Flag regressions against the last run in the history; exits with an error if there are any '
+                f'(needs --repeat {MIN_REPEAT} or more)'
+            ),
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=getattr(settings, 'BENCHMARK_TOLERANCE', 0.1),
+            help='Allowed slowdown or memory growth as a fraction (default: %(default)s)',
+        )
+
+    def handle(self, *args, **options):
+        # The fixtures come from matching.synthetic
+        if find_spec('numpy') is None:
+            raise CommandError('NumPy is required: pip install -r requirements-dev.txt')
+        from matching.benchmarks import compare, load_history, new_run, run_suite, save_history
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1.')
+        if options['compare'] and options['repeat'] < MIN_REPEAT:
+            raise CommandError(f'--compare needs --repeat {MIN_REPEAT} or more to tell slowdowns from noise.')
+
+        try:
+            history = load_history(options['history'])
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Cannot read {options["history"]}: {exc}')
+
+        def progress(name, done=0, total=0):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  {name}…')
+
+        results = run_suite(options['scale'] or SCALES, repeat=options['repeat'], seed=options['seed'], progress=progress)
+
+        for name, measured in results.items():
+            phases = ', '.join(f'{phase} {seconds * 1000:.1f}' for phase, seconds in measured.get('phases', {}).items())
+            self.stdout.write(
+                f"{name:<40} {_format('wall', measured['wall']):>11}  {measured['peak_kb']:>8} KiB  "
+                f"{measured['queries']:>5} queries" + (f'  ({phases} ms)' if phases else '')
+            )
+
+        regressions = []
+        compared = options['compare'] and bool(history)
+        if options['compare']:
+            if not history:
+                self.stdout.write(self.style.WARNING('No earlier run to compare with.'))
+            else:
+                baseline = history[-1]
+                regressions = compare(baseline['results'], results, tolerance=options['tolerance'])
+                self.stdout.write(self.style.MIGRATE_HEADING(
+                    f"Against {baseline['at']} {baseline.get('commit', '')} {baseline.get('label', '')}".rstrip()
+                ))
+                if any(measured.get('repeat', 1) < MIN_REPEAT for measured in baseline['results'].values()):
+                    self.stdout.write(self.style.WARNING(
+                        f'  The baseline has fewer than {MIN_REPEAT} timed runs; its timings are not compared.'
+                    ))
+                for name, metric, old, new in regressions:
+                    self.stdout.write(self.style.ERROR(
+                        f'  {name} {metric}: {_format(metric, old)} → {_format(metric, new)}'
+                    ))
+
+        if not options['no_save']:
+            history.append(new_run(results, label=options['label']))
+            try:
+                save_history(options['history'], history)
+            except OSError as exc:
+                raise CommandError(f'Cannot write {options["history"]}: {exc}')
+            self.stdout.write(self.style.SUCCESS(f'✅ Run saved to {options["history"]}'))
+
+        if regressions:
+            raise CommandError(f'{len(regressions)} regression(s) beyond {options["tolerance"]:.0%}')
+        if compared:
+            self.stdout.write(self.style.SUCCESS('✅ No regressions'))
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from matching.preferences import PACKED, ROWS, convert_storage
+
+
+class Command(BaseCommand):
+    help = 'Move stored preference lists between packed and row storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--to', required=True, choices=[PACKED, ROWS], help='Storage to move the lists into')
+
+    def handle(self, *args, **options):
+        to = options['to']
+        moved = convert_storage(to)
+        self.stdout.write(self.style.SUCCESS(f'✅ {moved} preference lists moved to {to} storage'))
+        if getattr(settings, 'PREFERENCE_STORAGE', PACKED) != to:
+            self.stdout.write(self.style.WARNING(f"Set PREFERENCE_STORAGE = '{to}' in settings to use them."))
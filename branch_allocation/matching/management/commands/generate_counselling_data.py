@@ -0,0 +1,75 @@
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from matching.models import Branch, MatchingResult, StudentProfile
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic students, branches and preference lists for scale testing (needs NumPy)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--students', type=int, default=10_000, help='Students (default: %(default)s)')
+        parser.add_argument('-m', '--branches', type=int, default=500, help='Branches (default: %(default)s)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed gives the same data')
+        parser.add_argument(
+            '--seat-ratio', type=float, default=0.5, help='Total seats per student (default: %(default)s)',
+        )
+        parser.add_argument(
+            '--submitted', type=float, default=0.9,
+            help='Share of students with a preference list; the rest keep the default order (default: %(default)s)',
+        )
+        parser.add_argument(
+            '-o', '--output', metavar='DIR',
+            help='Write CSV/JSONL files for import_counselling into DIR instead of the database',
+        )
+        parser.add_argument('--password', help='Password of generated students (default: none, login disabled)')
+        parser.add_argument('--batch-size', type=int, help='Records per transaction (default IMPORT_BATCH_SIZE)')
+        parser.add_argument(
+            '--flush', action='store_true',
+            help='Delete all results, students and branches first, like "Reset all" on the setup page',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            from matching.synthetic import SyntheticData, load, write_files
+        except ImportError:
+            raise CommandError('NumPy is required: pip install -r requirements-dev.txt')
+        if not 0 <= options['submitted'] <= 1 or options['seat_ratio'] <= 0:
+            raise CommandError('--submitted must be between 0 and 1 and --seat-ratio above 0.')
+
+        try:
+            data = SyntheticData(
+                options['students'], options['branches'], seed=options['seed'],
+                seat_ratio=options['seat_ratio'], submitted=options['submitted'],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        def progress(kind, done=0, total=0):
+            if done and options['verbosity'] > 1:
+                self.stdout.write(f'  {kind}: {done} records')
+
+        if options['output']:
+            try:
+                paths = write_files(data, options['output'], progress=progress)
+            except OSError as exc:
+                raise CommandError(str(exc))
+            for kind, path in paths.items():
+                self.stdout.write(self.style.SUCCESS(f'✅ Wrote {kind} to {path}'))
+            return
+
+        if options['flush']:
+            MatchingResult.objects.all().delete()
+            StudentProfile.objects.all().delete()
+            User.objects.filter(is_staff=False, is_superuser=False).delete()
+            Branch.objects.all().delete()
+        password_hash = make_password(options['password']) if options['password'] else None
+        try:
+            counts = load(data, password_hash=password_hash, batch_size=options['batch_size'], progress=progress)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Generated {counts['students']} students ({counts['preferences']} with a list) "
+            f"across {counts['branches']} branches"
+        ))
@@ -0,0 +1,56 @@
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+
+from matching.importer import KINDS, Checkpoint, import_file
+
+
+class Command(BaseCommand):
+    help = 'Bulk import branches, students and preference lists from CSV or JSONL files (see matching/importer.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--branches', metavar='FILE', help='college, branch, seats, state')
+        parser.add_argument(
+            '--students', metavar='FILE',
+            help='username, first_name, last_name, air_rank, category, gender, home_state[, password_hash]',
+        )
+        parser.add_argument(
+            '--preferences', metavar='FILE',
+            help='CSV: username, rank, college, branch per choice; JSONL: {"username", "preferences": [[college, branch], ...]}',
+        )
+        passwords = parser.add_mutually_exclusive_group()
+        passwords.add_argument('--password', help='Initial password of imported students, hashed once')
+        passwords.add_argument('--password-hash', help='Precomputed hash (as stored by Django) for imported students')
+        parser.add_argument('--batch-size', type=int, help='Records per transaction (default IMPORT_BATCH_SIZE)')
+        parser.add_argument(
+            '--checkpoint', default='import_counselling.checkpoint.json',
+            help='File recording progress, so an interrupted import resumes (default: %(default)s)',
+        )
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and import every file from the top')
+
+    def handle(self, *args, **options):
+        files = [(kind, options[kind]) for kind in KINDS if options[kind]]
+        if not files:
+            raise CommandError('Give at least one of --branches, --students, --preferences.')
+
+        password_hash = options['password_hash']
+        if options['password']:
+            password_hash = make_password(options['password'])
+
+        checkpoint = Checkpoint(options['checkpoint'])
+        if options['restart']:
+            checkpoint.clear()
+
+        def progress(kind, done=0, total=0):
+            if done and options['verbosity'] > 1:
+                self.stdout.write(f'  {kind}: {done} records')
+
+        for kind, path in files:
+            try:
+                count = import_file(
+                    kind, path, checkpoint,
+                    batch_size=options['batch_size'], password_hash=password_hash, progress=progress,
+                )
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'{path}: {exc}. Batches committed so far are kept; run again to resume.')
+            self.stdout.write(self.style.SUCCESS(f'✅ Imported {count} {kind} records from {path}'))
+        checkpoint.clear()
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from matching.search import index_available, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the student search index (needed after bulk imports that skip signals)'
+
+    def handle(self, *args, **options):
+        if not index_available():
+            self.stdout.write(self.style.WARNING('No search index on this database; search uses plain filters.'))
+            return
+        count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'✅ Indexed {count} students'))
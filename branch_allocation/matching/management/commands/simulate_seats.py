@@ -0,0 +1,74 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from matching.algorithm import load_matching_input
+from matching.models import Branch
+from matching.simulation import Scenario, simulate
+
+
+def _parse_changes(spec):
+    # "12=+10,15:OBC-NCL=-2" → {'12': 10, '15:OBC-NCL': -2}
+    changes = {}
+    for part in spec.split(','):
+        key, sep, delta = part.strip().partition('=')
+        try:
+            changes[key.strip()] = int(delta)
+        except ValueError:
+            raise CommandError(f'Bad seat change {part!r}; expected BRANCH_ID[:QUOTA]=DELTA')
+    return changes
+
+
+class Command(BaseCommand):
+    help = 'Simulate seat-matrix changes without touching the stored results'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-s', '--scenario', action='append', default=[], metavar='CHANGES',
+            help='Seat changes, e.g. "12=+10,15:OBC-NCL=-2" (branch id, optional quota, delta). Repeatable.',
+        )
+        parser.add_argument(
+            '-f', '--file',
+            help='JSON file: [{"name": "...", "changes": {"12": 10, "15:OBC-NCL": -2}}, ...]',
+        )
+        parser.add_argument('-w', '--workers', type=int, help='Worker processes (default: CPU count)')
+        parser.add_argument('--json', action='store_true', help='Print the full report as JSON')
+
+    def handle(self, *args, **options):
+        scenarios = [Scenario(spec, _parse_changes(spec)) for spec in options['scenario']]
+        if options['file']:
+            try:
+                with open(options['file']) as f:
+                    entries = json.load(f)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'Cannot read {options["file"]}: {exc}')
+            scenarios += [Scenario(entry['name'], entry['changes']) for entry in entries]
+        if not scenarios:
+            raise CommandError('Give at least one --scenario or a --file.')
+
+        data = load_matching_input()
+        if not data.num_students or not data.num_branches:
+            raise CommandError('Add students and branches first.')
+
+        try:
+            report = simulate(data, scenarios, workers=options['workers'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        labels = {b.id: b.label() for b in Branch.objects.all()}
+        for scenario in report['scenarios']:
+            self.stdout.write(self.style.MIGRATE_HEADING(scenario['name']))
+            if not scenario['rows']:
+                self.stdout.write('  no change')
+            for row in scenario['rows']:
+                closing = row['closing_air'] if row['closing_air'] is not None else '—'
+                delta = row['closing_delta']
+                self.stdout.write(
+                    f"  {labels.get(row['branch_id'], row['branch_id'])} [{row['quota']}]: "
+                    f"{row['filled']}/{row['seats']} filled ({row['filled_delta']:+d}), "
+                    f"closing AIR {closing}" + (f" ({delta:+d})" if delta else '')
+                )
@@ -0,0 +1,49 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from matching.models import MatchingResult
+from matching.verify import describe, verify_result
+
+
+class Command(BaseCommand):
+    help = 'Check a matching result for blocking pairs, seat caps and student optimality'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-r', '--result', type=int, help='MatchingResult id (default: the active result)')
+        parser.add_argument(
+            '--resolve', action='store_true',
+            help='Also re-run the matching and require the same allotments (as slow as a run)',
+        )
+        parser.add_argument('--json', action='store_true', help='Print the full report as JSON')
+
+    def handle(self, *args, **options):
+        results = MatchingResult.objects.all()
+        if options['result'] is not None:
+            result = results.filter(pk=options['result']).first()
+            if result is None:
+                raise CommandError(f'No matching result #{options["result"]}.')
+        else:
+            result = results.filter(is_active=True).first()
+            if result is None:
+                raise CommandError('No active matching result; give --result.')
+
+        try:
+            report = verify_result(result, resolve=options['resolve'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            for example in report['examples']:
+                self.stdout.write(f'  {example}')
+            if report['stale']:
+                self.stdout.write(f"  {report['stale']} students changed since the run were not checked")
+        if not report['ok']:
+            raise CommandError(f'Result #{result.pk} failed verification: {describe(report)}.')
+        if not options['json']:
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Result #{result.pk} is stable and student-optimal: {report['checked']} students, "
+                f"{report['entries']} entries checked in {report['seconds']:.2f}s"
+            ))
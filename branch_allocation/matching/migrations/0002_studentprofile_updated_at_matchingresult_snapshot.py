@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matchingresult',
+            name='seat_snapshot',
+            field=models.JSONField(blank=True, default=dict, help_text='{branch_id: [seats, filled]}'),
+        ),
+        migrations.AddField(
+            model_name='matchingresult',
+            name='snapshot_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='studentprofile',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
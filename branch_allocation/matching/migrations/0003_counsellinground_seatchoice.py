@@ -0,0 +1,37 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0002_studentprofile_updated_at_matchingresult_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CounsellingRound',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField(unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('result', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='counselling_round', to='matching.matchingresult')),
+            ],
+            options={
+                'ordering': ['number'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SeatChoice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('choice', models.CharField(choices=[('freeze', 'Freeze — accept this seat, no further rounds'), ('float', 'Float — keep this seat, upgrade to any better choice'), ('slide', 'Slide — keep this seat, upgrade within the same college'), ('withdraw', 'Withdraw — give up this seat and leave counselling')], default='float', max_length=10)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('round', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='choices', to='matching.counsellinground')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seat_choices', to='matching.studentprofile')),
+            ],
+            options={
+                'unique_together': {('round', 'student')},
+            },
+        ),
+    ]
@@ -0,0 +1,63 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0003_counsellinground_seatchoice'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='allotment',
+            name='quota',
+            field=models.CharField(blank=True, help_text='Seat bucket, e.g. OPEN or OBC-NCL-FO', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='branch',
+            name='state',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='matchingresult',
+            name='catalog_digest',
+            field=models.CharField(blank=True, max_length=40),
+        ),
+        migrations.AddField(
+            model_name='studentprofile',
+            name='category',
+            field=models.CharField(choices=[('OPEN', 'General (OPEN)'), ('EWS', 'EWS'), ('OBC-NCL', 'OBC-NCL'), ('SC', 'SC'), ('ST', 'ST')], default='OPEN', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='studentprofile',
+            name='gender',
+            field=models.CharField(blank=True, choices=[('', 'Not specified'), ('M', 'Male'), ('F', 'Female')], max_length=1),
+        ),
+        migrations.AddField(
+            model_name='studentprofile',
+            name='home_state',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='matchingresult',
+            name='seat_snapshot',
+            field=models.JSONField(blank=True, default=dict, help_text="{'branch_id:quota': [seats, seats after de-reservation, filled]}"),
+        ),
+        migrations.CreateModel(
+            name='SeatQuota',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(choices=[('OPEN', 'General (OPEN)'), ('EWS', 'EWS'), ('OBC-NCL', 'OBC-NCL'), ('SC', 'SC'), ('ST', 'ST')], default='OPEN', max_length=10)),
+                ('pool', models.CharField(choices=[('GN', 'Gender-neutral'), ('FO', 'Female-only (supernumerary)')], default='GN', max_length=2)),
+                ('domicile', models.CharField(choices=[('AI', 'All India'), ('HS', 'Home state'), ('OS', 'Other state')], default='AI', max_length=2)),
+                ('seats', models.PositiveIntegerField(default=0)),
+                ('dereserve_to', models.CharField(blank=True, choices=[('OPEN', 'General (OPEN)'), ('EWS', 'EWS'), ('OBC-NCL', 'OBC-NCL'), ('SC', 'SC'), ('ST', 'ST')], max_length=10)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quotas', to='matching.branch')),
+            ],
+            options={
+                'ordering': ['branch', 'category', 'pool', 'domicile'],
+                'unique_together': {('branch', 'category', 'pool', 'domicile')},
+            },
+        ),
+    ]
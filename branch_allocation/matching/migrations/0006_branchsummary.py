@@ -0,0 +1,67 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Avg, Count, Max, Min
+
+
+def backfill_summaries(apps, schema_editor):
+    """
+    Summaries for results saved before this migration, rebuilt from their
+    allotments. Uses today's AIRs, and buckets nobody filled get no row.
+    """
+    MatchingResult = apps.get_model('matching', 'MatchingResult')
+    Allotment = apps.get_model('matching', 'Allotment')
+    BranchSummary = apps.get_model('matching', 'BranchSummary')
+    Branch = apps.get_model('matching', 'Branch')
+    branch_seats = dict(Branch.objects.values_list('id', 'seats'))
+
+    for result in MatchingResult.objects.iterator():
+        snapshot = result.seat_snapshot or {}
+        rows = (
+            Allotment.objects
+            .filter(result=result, is_matched=True)
+            .values('branch_id', 'quota')
+            .annotate(
+                filled=Count('id'),
+                opening_air=Min('student__air_rank'),
+                closing_air=Max('student__air_rank'),
+                mean_preference_rank=Avg('preference_rank'),
+            )
+        )
+        summaries = []
+        for row in rows:
+            counts = snapshot.get(f"{row['branch_id']}:{row['quota']}") or snapshot.get(str(row['branch_id']))
+            if counts:
+                seats = counts[1] if len(counts) == 3 else counts[0]
+            else:
+                seats = branch_seats.get(row['branch_id'], 0)
+            summaries.append(BranchSummary(result=result, seats=seats, **row))
+        BranchSummary.objects.bulk_create(summaries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0005_matchingjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BranchSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quota', models.CharField(blank=True, max_length=32)),
+                ('seats', models.PositiveIntegerField(default=0)),
+                ('filled', models.PositiveIntegerField(default=0)),
+                ('opening_air', models.PositiveIntegerField(blank=True, null=True)),
+                ('closing_air', models.PositiveIntegerField(blank=True, null=True)),
+                ('mean_preference_rank', models.FloatField(blank=True, null=True)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='summaries', to='matching.branch')),
+                ('result', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='branch_summaries', to='matching.matchingresult')),
+            ],
+            options={
+                'ordering': ['branch', 'quota'],
+                'unique_together': {('result', 'branch', 'quota')},
+            },
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+TABLE = 'matching_student_search'
+
+
+def create_search_index(apps, schema_editor):
+    """FTS5 side table for student search; skipped where FTS5 isn't available."""
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if not cursor.fetchone()[0]:
+            return
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+            "name, username, tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3')"
+        )
+        cursor.execute(
+            f"INSERT INTO {TABLE} (rowid, name, username) "
+            "SELECT p.id, TRIM(u.first_name || ' ' || u.last_name), u.username "
+            "FROM matching_studentprofile p JOIN auth_user u ON u.id = p.user_id"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0007_student_air_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
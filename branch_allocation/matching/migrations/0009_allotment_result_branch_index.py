@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0008_student_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='allotment',
+            index=models.Index(fields=['result', 'branch', 'id'], name='allotment_result_branch_idx'),
+        ),
+    ]
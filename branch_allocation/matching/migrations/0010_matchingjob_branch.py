@@ -0,0 +1,22 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0009_allotment_result_branch_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matchingjob',
+            name='branch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='matching.branch'),
+        ),
+        migrations.AlterField(
+            model_name='matchingjob',
+            name='kind',
+            field=models.CharField(choices=[('full', 'Stable matching'), ('incremental', 'Re-run changes only'), ('round', 'Next counselling round'), ('add_branch', 'Preference list update')], default='full', max_length=12),
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+
+def drop_default_lists(apps, schema_editor):
+    """
+    Students who never submitted only have the list filled in at signup;
+    drop it so they follow the default order like new students.
+    """
+    Preference = apps.get_model('matching', 'Preference')
+    Preference.objects.filter(student__has_submitted=False).delete()
+
+
+def fill_default_lists(apps, schema_editor):
+    """
+    Give every student without a stored list one row per branch in the
+    default order (preferences.default_order(), i.e. Branch.Meta ordering),
+    as signup used to.
+    """
+    Branch = apps.get_model('matching', 'Branch')
+    Preference = apps.get_model('matching', 'Preference')
+    StudentProfile = apps.get_model('matching', 'StudentProfile')
+    order = list(Branch.objects.order_by('college', 'branch').values_list('id', flat=True))
+    students = StudentProfile.objects.filter(preferences__isnull=True).values_list('id', flat=True)
+    for student_id in list(students):
+        Preference.objects.bulk_create(
+            Preference(student_id=student_id, branch_id=bid, rank=rank)
+            for rank, bid in enumerate(order, start=1)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0010_matchingjob_branch'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_default_lists, fill_default_lists),
+    ]
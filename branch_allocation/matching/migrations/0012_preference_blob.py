@@ -0,0 +1,71 @@
+import sys
+from array import array
+from itertools import groupby
+
+from django.db import migrations, models
+
+
+def _pack(ids):
+    values = array('i', ids)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+def _unpack(blob):
+    values = array('i')
+    values.frombytes(blob)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def pack_lists(apps, schema_editor):
+    """
+    Move stored lists out of Preference rows into packed blobs, whatever
+    PREFERENCE_STORAGE says; `manage.py convert_preferences --to rows`
+    moves them back for row storage.
+    """
+    StudentProfile = apps.get_model('matching', 'StudentProfile')
+    Preference = apps.get_model('matching', 'Preference')
+    rows = Preference.objects.order_by('student_id', 'rank').values_list('student_id', 'branch_id').iterator()
+    batch = []
+    for sid, group in groupby(rows, key=lambda row: row[0]):
+        batch.append(StudentProfile(id=sid, preference_blob=_pack([bid for _, bid in group])))
+        if len(batch) == 1000:
+            StudentProfile.objects.bulk_update(batch, ['preference_blob'])
+            batch = []
+    StudentProfile.objects.bulk_update(batch, ['preference_blob'])
+    Preference.objects.all().delete()
+
+
+def unpack_lists(apps, schema_editor):
+    StudentProfile = apps.get_model('matching', 'StudentProfile')
+    Preference = apps.get_model('matching', 'Preference')
+    Branch = apps.get_model('matching', 'Branch')
+    known = set(Branch.objects.values_list('id', flat=True))
+    profiles = StudentProfile.objects.filter(preference_blob__isnull=False).values_list('id', 'preference_blob')
+    batch = []
+    for sid, blob in profiles.iterator():
+        ranked = [bid for bid in _unpack(blob) if bid in known]
+        batch.extend(Preference(student_id=sid, branch_id=bid, rank=rank) for rank, bid in enumerate(ranked, start=1))
+        if len(batch) >= 5000:
+            Preference.objects.bulk_create(batch)
+            batch = []
+    Preference.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0011_implicit_default_preferences'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentprofile',
+            name='preference_blob',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.RunPython(pack_lists, unpack_lists),
+    ]
@@ -0,0 +1,70 @@
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def intern_blobs(apps, schema_editor):
+    """Point every student at a shared PreferenceList holding their packed list."""
+    StudentProfile = apps.get_model('matching', 'StudentProfile')
+    PreferenceList = apps.get_model('matching', 'PreferenceList')
+    lists = {}
+    batch = []
+    profiles = StudentProfile.objects.filter(preference_blob__isnull=False).values_list('id', 'preference_blob')
+    for sid, blob in profiles.iterator():
+        blob = bytes(blob)
+        if not blob:
+            continue
+        digest = hashlib.sha1(blob).hexdigest()
+        if digest not in lists:
+            lists[digest] = PreferenceList.objects.create(digest=digest, blob=blob, length=len(blob) // 4).pk
+        batch.append(StudentProfile(id=sid, preference_list_id=lists[digest]))
+        if len(batch) == 1000:
+            StudentProfile.objects.bulk_update(batch, ['preference_list'])
+            batch = []
+    StudentProfile.objects.bulk_update(batch, ['preference_list'])
+
+
+def copy_blobs(apps, schema_editor):
+    StudentProfile = apps.get_model('matching', 'StudentProfile')
+    PreferenceList = apps.get_model('matching', 'PreferenceList')
+    blobs = {}
+    batch = []
+    profiles = StudentProfile.objects.filter(preference_list__isnull=False).values_list('id', 'preference_list_id')
+    for sid, list_id in profiles.iterator():
+        if list_id not in blobs:
+            blobs[list_id] = bytes(PreferenceList.objects.get(pk=list_id).blob)
+        batch.append(StudentProfile(id=sid, preference_blob=blobs[list_id]))
+        if len(batch) == 1000:
+            StudentProfile.objects.bulk_update(batch, ['preference_blob'])
+            batch = []
+    StudentProfile.objects.bulk_update(batch, ['preference_blob'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0012_preference_blob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PreferenceList',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=40, unique=True)),
+                ('blob', models.BinaryField()),
+                ('length', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='studentprofile',
+            name='preference_list',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='students', to='matching.preferencelist'),
+        ),
+        migrations.RunPython(intern_blobs, copy_blobs),
+        migrations.RemoveField(
+            model_name='studentprofile',
+            name='preference_blob',
+        ),
+    ]
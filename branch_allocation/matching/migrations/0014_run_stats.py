@@ -0,0 +1,26 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0013_shared_preference_lists'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matchingresult',
+            name='stats',
+            field=models.JSONField(blank=True, default=dict, help_text="{'seconds', 'phases': {phase: {'seconds', 'rss_kb', 'max_rss_kb'}}, input sizes, kernel counters}"),
+        ),
+        migrations.CreateModel(
+            name='MatchingProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('result', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='profile', to='matching.matchingresult')),
+            ],
+        ),
+    ]
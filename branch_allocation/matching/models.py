@@ -7,6 +7,8 @@ class Branch(models.Model):
     college = models.CharField(max_length=200)
     branch = models.CharField(max_length=200)
     seats = models.PositiveIntegerField(default=5)
+    # Used by home-state / other-state seat quotas
+    state = models.CharField(max_length=100, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -19,12 +21,46 @@ class Branch(models.Model):
     def label(self):
         return f"{self.college} — {self.branch}"
 
+    def sync_seats(self):
+        """Keep `seats` equal to the gender-neutral total of the seat matrix."""
+        quotas = self.quotas.exclude(pool=SeatQuota.FEMALE_ONLY)
+        if self.quotas.exists():
+            self.seats = quotas.aggregate(total=models.Sum('seats'))['total'] or 0
+            self.save(update_fields=['seats'])
+
 
 class StudentProfile(models.Model):
     """Extended profile for student users."""
+    OPEN = 'OPEN'
+    CATEGORY_CHOICES = [
+        (OPEN, 'General (OPEN)'),
+        ('EWS', 'EWS'),
+        ('OBC-NCL', 'OBC-NCL'),
+        ('SC', 'SC'),
+        ('ST', 'ST'),
+    ]
+    GENDER_CHOICES = [
+        ('', 'Not specified'),
+        ('M', 'Male'),
+        ('F', 'Female'),
+    ]
+
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     air_rank = models.PositiveIntegerField(null=True, blank=True, help_text="All India Rank")
+    category = models.CharField(max_length=10, choices=CATEGORY_CHOICES, default=OPEN)
+    gender = models.CharField(max_length=1, choices=GENDER_CHOICES, blank=True)
+    home_state = models.CharField(max_length=100, blank=True)
     has_submitted = models.BooleanField(default=False)
+    # Stored preference list with PREFERENCE_STORAGE = 'packed' (see matching/preferences.py)
+    preference_list = models.ForeignKey(
+        'PreferenceList', on_delete=models.PROTECT, related_name='students', null=True, blank=True, editable=False,
+    )
+    # Bumped on every save; incremental matching uses it to find changed students
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        # Keyset pagination of student lists
+        indexes = [models.Index(fields=['air_rank', 'id'], name='student_air_id_idx')]
 
     def __str__(self):
         return f"{self.user.get_full_name() or self.user.username} (AIR {self.air_rank})"
@@ -36,10 +72,94 @@ class StudentProfile(models.Model):
         return self.user.username
 
 
+class SeatQuota(models.Model):
+    """
+    One bucket of a branch's seat matrix.
+
+    A branch with no quotas has a single OPEN bucket of `Branch.seats`.
+    Female-only seats are supernumerary and never de-reserved; unfilled
+    seats of any other bucket move to the `dereserve_to` category of the
+    same pool and domicile once its own candidates are exhausted.
+    """
+    GENDER_NEUTRAL = 'GN'
+    FEMALE_ONLY = 'FO'
+    POOL_CHOICES = [
+        (GENDER_NEUTRAL, 'Gender-neutral'),
+        (FEMALE_ONLY, 'Female-only (supernumerary)'),
+    ]
+    ALL_INDIA = 'AI'
+    HOME_STATE = 'HS'
+    OTHER_STATE = 'OS'
+    DOMICILE_CHOICES = [
+        (ALL_INDIA, 'All India'),
+        (HOME_STATE, 'Home state'),
+        (OTHER_STATE, 'Other state'),
+    ]
+
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='quotas')
+    category = models.CharField(max_length=10, choices=StudentProfile.CATEGORY_CHOICES, default=StudentProfile.OPEN)
+    pool = models.CharField(max_length=2, choices=POOL_CHOICES, default=GENDER_NEUTRAL)
+    domicile = models.CharField(max_length=2, choices=DOMICILE_CHOICES, default=ALL_INDIA)
+    seats = models.PositiveIntegerField(default=0)
+    dereserve_to = models.CharField(max_length=10, choices=StudentProfile.CATEGORY_CHOICES, blank=True)
+
+    class Meta:
+        ordering = ['branch', 'category', 'pool', 'domicile']
+        unique_together = ['branch', 'category', 'pool', 'domicile']
+
+    def __str__(self):
+        return f"{self.branch} [{self.code}] × {self.seats}"
+
+    @property
+    def code(self):
+        return quota_code(self.category, self.pool, self.domicile)
+
+    def clean(self):
+        from django.core.exceptions import ValidationError
+        if self.dereserve_to and self.pool == self.FEMALE_ONLY:
+            raise ValidationError('Female-only seats are supernumerary and cannot be de-reserved.')
+        if self.dereserve_to == self.category:
+            raise ValidationError('A quota cannot de-reserve to its own category.')
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.branch.sync_seats()
+
+    def delete(self, *args, **kwargs):
+        branch = self.branch
+        result = super().delete(*args, **kwargs)
+        branch.sync_seats()
+        return result
+
+
+def quota_code(category, pool=SeatQuota.GENDER_NEUTRAL, domicile=SeatQuota.ALL_INDIA):
+    """Short label for a seat bucket, e.g. 'OBC-NCL', 'OPEN-FO', 'SC-HS'."""
+    code = category
+    if pool != SeatQuota.GENDER_NEUTRAL:
+        code += f"-{pool}"
+    if domicile != SeatQuota.ALL_INDIA:
+        code += f"-{domicile}"
+    return code
+
+
+class PreferenceList(models.Model):
+    """
+    A packed preference list shared by every student who submitted it:
+    branch ids as 32-bit little-endian integers, interned by the SHA-1
+    of the blob. See matching/preferences.py.
+    """
+    digest = models.CharField(max_length=40, unique=True)
+    blob = models.BinaryField()
+    length = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"{self.length} branches ({self.digest[:8]})"
+
+
 class Preference(models.Model):
     """
     Ordered preference list: one row per student-branch pair.
-    rank=1 means most preferred.
+    rank=1 means most preferred. Only used with PREFERENCE_STORAGE = 'rows'.
     """
     student = models.ForeignKey(StudentProfile, on_delete=models.CASCADE, related_name='preferences')
     branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='preferences')
@@ -63,6 +183,18 @@ class MatchingResult(models.Model):
     total_matched = models.PositiveIntegerField(default=0)
     total_unmatched = models.PositiveIntegerField(default=0)
     total_unfilled = models.PositiveIntegerField(default=0)
+    # Input state the run was computed from, used to warm-start the next run
+    snapshot_at = models.DateTimeField(null=True, blank=True)
+    seat_snapshot = models.JSONField(
+        default=dict, blank=True,
+        help_text="{'branch_id:quota': [seats, seats after de-reservation, filled]}",
+    )
+    catalog_digest = models.CharField(max_length=40, blank=True)
+    # How the run went, see matching/profiling.py
+    stats = models.JSONField(
+        default=dict, blank=True,
+        help_text="{'seconds', 'phases': {phase: {'seconds', 'rss_kb', 'max_rss_kb'}}, input sizes, kernel counters}",
+    )
 
     class Meta:
         ordering = ['-run_at']
@@ -71,18 +203,175 @@ class MatchingResult(models.Model):
         return f"Matching run {self.run_at.strftime('%Y-%m-%d %H:%M')} — {self.total_matched} matched"
 
 
+class MatchingProfile(models.Model):
+    """cProfile capture of a matching run (MATCHING_PROFILE), in pstats' file format."""
+    result = models.OneToOneField(MatchingResult, on_delete=models.CASCADE, related_name='profile')
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Profile of run #{self.result_id}"
+
+
+class MatchingJob(models.Model):
+    """
+    A matching run, or another bulk change to the matching input,
+    executed in the background (see jobs.py), with the phase it is in,
+    progress within that phase and how long each phase took. At most one
+    job is queued or running at a time.
+    """
+    FULL = 'full'
+    INCREMENTAL = 'incremental'
+    ROUND = 'round'
+    ADD_BRANCH = 'add_branch'
+    KIND_CHOICES = [
+        (FULL, 'Stable matching'),
+        (INCREMENTAL, 'Re-run changes only'),
+        (ROUND, 'Next counselling round'),
+        (ADD_BRANCH, 'Preference list update'),
+    ]
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=12, choices=KIND_CHOICES, default=FULL)
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default=QUEUED)
+    # True while queued or running, NULL after; the unique index keeps runs exclusive
+    active = models.BooleanField(null=True, unique=True, default=True, editable=False)
+    phase = models.CharField(max_length=20, blank=True)
+    done = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    timings = models.JSONField(default=dict, blank=True, help_text="{phase: seconds}")
+    error = models.TextField(blank=True)
+    result = models.ForeignKey(MatchingResult, on_delete=models.SET_NULL, related_name='jobs', null=True, blank=True)
+    # The new branch, for ADD_BRANCH jobs
+    branch = models.ForeignKey(Branch, on_delete=models.SET_NULL, related_name='jobs', null=True, blank=True)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Bumped on every progress write; a job that stops updating is stale
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.get_kind_display()} job #{self.pk} — {self.status}"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+    def as_dict(self):
+        return {
+            'id': self.pk,
+            'kind': self.kind,
+            'status': self.status,
+            'phase': self.phase,
+            'done': self.done,
+            'total': self.total,
+            'timings': self.timings,
+            'error': self.error,
+            'result_id': self.result_id,
+            'branch_id': self.branch_id,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
 class Allotment(models.Model):
     """One allotment per student in a matching result."""
     result = models.ForeignKey(MatchingResult, on_delete=models.CASCADE, related_name='allotments')
     student = models.ForeignKey(StudentProfile, on_delete=models.CASCADE, related_name='allotments')
     branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='allotments', null=True, blank=True)
     preference_rank = models.PositiveIntegerField(null=True, blank=True)
+    quota = models.CharField(max_length=32, blank=True, help_text="Seat bucket, e.g. OPEN or OBC-NCL-FO")
     is_matched = models.BooleanField(default=False)
 
     class Meta:
         unique_together = ['result', 'student']
+        indexes = [
+            # Per-branch (and unmatched, branch NULL) result pages, in merit order
+            models.Index(fields=['result', 'branch', 'id'], name='allotment_result_branch_idx'),
+        ]
 
     def __str__(self):
         if self.is_matched:
             return f"{self.student} → {self.branch} (pref #{self.preference_rank})"
         return f"{self.student} → UNMATCHED"
+
+
+class BranchSummary(models.Model):
+    """
+    Cutoffs of one seat bucket in a matching result, written with the
+    result so pages read one row per bucket instead of every allotment.
+    AIRs ignore matched students without a rank.
+    """
+    result = models.ForeignKey(MatchingResult, on_delete=models.CASCADE, related_name='branch_summaries')
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='summaries')
+    quota = models.CharField(max_length=32, blank=True)
+    seats = models.PositiveIntegerField(default=0)
+    filled = models.PositiveIntegerField(default=0)
+    opening_air = models.PositiveIntegerField(null=True, blank=True)
+    closing_air = models.PositiveIntegerField(null=True, blank=True)
+    mean_preference_rank = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['branch', 'quota']
+        unique_together = ['result', 'branch', 'quota']
+
+    def __str__(self):
+        return f"{self.branch} [{self.quota}]: {self.opening_air}–{self.closing_air}"
+
+
+class CounsellingRound(models.Model):
+    """
+    One round of multi-round counselling.
+    Round 1 is a full matching run; later rounds start from the
+    previous round's allotments and the students' seat choices.
+    """
+    number = models.PositiveIntegerField(unique=True)
+    result = models.OneToOneField(MatchingResult, on_delete=models.CASCADE, related_name='counselling_round')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['number']
+
+    def __str__(self):
+        return f"Round {self.number}"
+
+
+class SeatChoice(models.Model):
+    """A student's decision on the seat they were allotted in a round."""
+    FREEZE = 'freeze'
+    FLOAT = 'float'
+    SLIDE = 'slide'
+    WITHDRAW = 'withdraw'
+    CHOICES = [
+        (FREEZE, 'Freeze — accept this seat, no further rounds'),
+        (FLOAT, 'Float — keep this seat, upgrade to any better choice'),
+        (SLIDE, 'Slide — keep this seat, upgrade within the same college'),
+        (WITHDRAW, 'Withdraw — give up this seat and leave counselling'),
+    ]
+    # Students who never respond keep their seat and stay in the running
+    DEFAULT = FLOAT
+
+    round = models.ForeignKey(CounsellingRound, on_delete=models.CASCADE, related_name='choices')
+    student = models.ForeignKey(StudentProfile, on_delete=models.CASCADE, related_name='seat_choices')
+    choice = models.CharField(max_length=10, choices=CHOICES, default=DEFAULT)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['round', 'student']
+
+    def __str__(self):
+        return f"{self.student} — {self.round}: {self.choice}"
@@ -0,0 +1,535 @@
+"""
+Student preference lists.
+
+Students who never submitted a list store nothing: their list is the
+whole branch catalog in its default order (Branch.Meta ordering, i.e. by
+college and branch), worked out when needed. Once a student saves, their
+list is stored and new branches are appended to it.
+
+Stored lists live in one of two places, chosen by PREFERENCE_STORAGE:
+
+- 'packed' (default): the branch ids as 32-bit little-endian integers
+  in a PreferenceList, read and written as a unit. Lists are interned
+  by content hash, so students who submit the same list share one
+  PreferenceList; saving points the student at another one.
+- 'rows': one Preference row per (student, branch) with its rank
+
+Everything outside this module goes through the accessors below
+(stored_order, iter_stored_lists, iter_stored_heads, store_lists,
+save_order, append_branch) and never reads either directly. Readers
+skip ids of branches deleted since a list was stored.
+
+A student's list as shown on the preferences page is their stored list,
+followed by every branch they have not ranked yet. With row storage,
+saving rewrites only the rows whose rank changed. The page can submit
+either the full order or just the moves the student made since loading
+it, checked against a token of the order it started from.
+
+A new branch goes to the end of every stored list with append_branch(),
+run as a background job. Saving a list deletes the one the student had
+if nobody else uses it; prune_lists() clears up after bulk changes.
+"""
+import hashlib
+import sys
+import zlib
+from array import array
+from itertools import groupby, islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import BinaryField, Count, F, Max, Window
+from django.db.models.functions import RowNumber, Substr
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .algorithm import no_progress
+from .models import Branch, Preference, PreferenceList, StudentProfile
+
+PACKED = 'packed'
+ROWS = 'rows'
+# Packed lists: one 32-bit signed integer per branch id
+_TYPECODE = 'i'
+_ITEMSIZE = 4
+
+DEFAULT_ORDER_KEY = 'branch_default_order'
+
+
+class StaleOrder(Exception):
+    """Raised when moves were made against an order that has since changed."""
+
+
+def default_order(refresh=False):
+    """All branch ids in default preference order, cached for BRANCH_IDS_CACHE_TTL seconds."""
+    order = None if refresh else cache.get(DEFAULT_ORDER_KEY)
+    if order is None:
+        order = tuple(Branch.objects.values_list('id', flat=True))
+        cache.set(DEFAULT_ORDER_KEY, order, getattr(settings, 'BRANCH_IDS_CACHE_TTL', 60))
+    return order
+
+
+def branch_ids(refresh=False):
+    """The set of all branch ids."""
+    return frozenset(default_order(refresh))
+
+
+def _valid_ids(values):
+    # Submitted ids as ints, in order, without duplicates or unknown branches
+    ids = []
+    for value in values:
+        try:
+            ids.append(int(value))
+        except (TypeError, ValueError):
+            continue
+    known = branch_ids()
+    if not known.issuperset(ids):
+        known = branch_ids(refresh=True)  # a branch added since the set was cached
+    return list(dict.fromkeys(bid for bid in ids if bid in known))
+
+
+def storage():
+    """The configured PREFERENCE_STORAGE backend, PACKED or ROWS."""
+    return getattr(settings, 'PREFERENCE_STORAGE', PACKED)
+
+
+def pack(ids):
+    """Branch ids → packed bytes."""
+    values = array(_TYPECODE, ids)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+def unpack(blob):
+    """Packed bytes → array of branch ids."""
+    values = array(_TYPECODE)
+    values.frombytes(blob)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def _known(ids):
+    # Drop ids of branches deleted since the list was packed
+    known = branch_ids()
+    if not known.issuperset(ids):
+        known = branch_ids(refresh=True)
+    return [bid for bid in ids if bid in known]
+
+
+def intern_lists(lists):
+    """
+    PreferenceList ids of many lists of branch ids, in order, creating
+    the ones that don't exist yet; None for an empty list.
+    """
+    blobs = [pack(ids) for ids in lists]
+    digests = [hashlib.sha1(blob).hexdigest() if blob else None for blob in blobs]
+    wanted = {digest: blob for digest, blob in zip(digests, blobs) if digest}
+    known = dict(PreferenceList.objects.filter(digest__in=wanted).values_list('digest', 'id'))
+    missing = [
+        PreferenceList(digest=digest, blob=blob, length=len(blob) // _ITEMSIZE)
+        for digest, blob in wanted.items()
+        if digest not in known
+    ]
+    if missing:
+        # Another process may intern the same list meanwhile
+        PreferenceList.objects.bulk_create(missing, ignore_conflicts=True)
+        known.update(
+            PreferenceList.objects
+            .filter(digest__in=[new.digest for new in missing])
+            .values_list('digest', 'id')
+        )
+    return [known.get(digest) for digest in digests]
+
+
+def prune_lists(ids=None):
+    """
+    Delete shared lists no student points at any more, only among `ids`
+    if given; returns how many.
+    """
+    lists = PreferenceList._meta.db_table
+    student = StudentProfile._meta.db_table
+    sql = (
+        f"DELETE FROM {lists} WHERE NOT EXISTS "
+        f"(SELECT 1 FROM {student} s WHERE s.preference_list_id = {lists}.id)"
+    )
+    params = []
+    if ids is not None:
+        ids = list(ids)
+        if not ids:
+            return 0
+        sql += f" AND id IN ({', '.join(['%s'] * len(ids))})"
+        params = ids
+    # One statement, so a list can't gain a student between check and delete
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def stored_order(profile):
+    """The student's stored list as branch ids, empty if they never saved one."""
+    if storage() == PACKED:
+        if profile.preference_list_id is None:
+            return []
+        return _known(unpack(profile.preference_list.blob))
+    return list(profile.preferences.order_by('rank').values_list('branch_id', flat=True))
+
+
+def iter_stored_lists(students=None, chunk_size=None):
+    """
+    (student id, list key, branch ids) of every stored list, in student
+    id order. `students` (ids or a queryset of them) narrows it down;
+    students without a stored list are skipped. Deleted branches are not
+    filtered.
+
+    Students sharing a list get the same key and the same array, which
+    must not be modified; the key is None for lists that aren't shared
+    (row storage).
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'PREFERENCE_BLOB_BATCH_SIZE', 1000)
+    if storage() == PACKED:
+        yield from _iter_packed(students, chunk_size)
+        return
+
+    rows = Preference.objects.all()
+    if students is not None:
+        rows = rows.filter(student__in=students)
+    rows = (
+        rows.order_by('student_id', 'rank')
+        .values_list('student_id', 'branch_id')
+        .iterator(chunk_size=getattr(settings, 'MATCHING_LOAD_CHUNK_SIZE', 20000))
+    )
+    for sid, group in groupby(rows, key=lambda row: row[0]):
+        yield sid, None, [bid for _, bid in group]
+
+
+def _iter_packed(students, chunk_size):
+    profiles = StudentProfile.objects.filter(preference_list__isnull=False)
+    if students is not None:
+        profiles = profiles.filter(id__in=students)
+    profiles = profiles.order_by('id').values_list('id', 'preference_list_id').iterator(chunk_size=chunk_size)
+    shared = {}
+    while True:
+        chunk = list(islice(profiles, chunk_size))
+        if not chunk:
+            return
+        missing = {list_id for _, list_id in chunk if list_id not in shared}
+        if missing:
+            shared.update(
+                (list_id, unpack(blob))
+                for list_id, blob in PreferenceList.objects.filter(id__in=missing).values_list('id', 'blob')
+            )
+        for sid, list_id in chunk:
+            yield sid, list_id, shared[list_id]
+
+
+def iter_stored_heads(students, limit, chunk_size=None):
+    """
+    (student id, first `limit` branch ids, list length) of each stored
+    list among `students`, in student id order, without reading whole
+    lists. Deleted branches are not filtered.
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'MATCHING_PERSIST_BATCH_SIZE', 5000)
+    if storage() == PACKED:
+        heads = (
+            StudentProfile.objects
+            .filter(id__in=students, preference_list__isnull=False)
+            .annotate(head=Substr('preference_list__blob', 1, limit * _ITEMSIZE, output_field=BinaryField()))
+            .order_by('id')
+            .values_list('id', 'head', 'preference_list__length')
+        )
+        for sid, head, total in heads.iterator(chunk_size=chunk_size):
+            yield sid, list(unpack(head)), total
+        return
+
+    rows = (
+        Preference.objects
+        .filter(student__in=students)
+        .annotate(
+            position=Window(RowNumber(), partition_by=[F('student_id')], order_by=[F('rank').asc()]),
+            total=Window(Count('id'), partition_by=[F('student_id')]),
+        )
+        .filter(position__lte=limit)
+        .order_by('student_id', 'rank')
+        .values_list('student_id', 'branch_id', 'total')
+    )
+    for sid, group in groupby(rows.iterator(chunk_size=chunk_size), key=lambda row: row[0]):
+        group = list(group)
+        yield sid, [bid for _, bid, _ in group], group[0][2]
+
+
+def _point_at_lists(lists, updated_at=None):
+    # {student id: branch ids} → shared lists. One executemany, as
+    # bulk_update's CASE expressions cost more than the rows themselves.
+    list_ids = intern_lists(lists.values())
+    table = StudentProfile._meta.db_table
+    with connection.cursor() as cursor:
+        if updated_at is None:
+            cursor.executemany(
+                f"UPDATE {table} SET preference_list_id = %s WHERE id = %s",
+                list(zip(list_ids, lists)),
+            )
+        else:
+            stamp = connection.ops.adapt_datetimefield_value(updated_at)
+            cursor.executemany(
+                f"UPDATE {table} SET preference_list_id = %s, updated_at = %s WHERE id = %s",
+                [(list_id, stamp, sid) for sid, list_id in zip(lists, list_ids)],
+            )
+
+
+def store_lists(lists):
+    """
+    Replace the stored lists of many students at once ({student id:
+    branch ids}; an empty list means the default), bumping updated_at.
+    """
+    with transaction.atomic():
+        if storage() == PACKED:
+            now = timezone.now()
+            batch_size = getattr(settings, 'PREFERENCE_BLOB_BATCH_SIZE', 1000)
+            items = list(lists.items())
+            for start in range(0, len(items), batch_size):
+                _point_at_lists(dict(items[start:start + batch_size]), updated_at=now)
+            return
+        StudentProfile.objects.filter(id__in=list(lists)).update(updated_at=timezone.now())
+        Preference.objects.filter(student__in=list(lists)).delete()
+        Preference.objects.bulk_create(
+            [
+                Preference(student_id=sid, branch_id=bid, rank=rank)
+                for sid, ids in lists.items()
+                for rank, bid in enumerate(ids, start=1)
+            ],
+            batch_size=getattr(settings, 'MATCHING_PERSIST_BATCH_SIZE', 5000),
+        )
+
+
+def has_stored_lists():
+    """Whether any student has a stored list."""
+    if storage() == PACKED:
+        return StudentProfile.objects.filter(preference_list__isnull=False).exists()
+    return Preference.objects.exists()
+
+
+def preference_list(profile):
+    """Branch ids the student ranks, in order: stored, or else the default."""
+    return stored_order(profile) or list(default_order())
+
+
+def current_order(profile):
+    """Branch ids in the order the preferences page shows them."""
+    ranked = stored_order(profile)
+    listed = set(ranked)
+    return ranked + [bid for bid in default_order() if bid not in listed]
+
+
+def order_token(order):
+    """Short fingerprint of an order, sent back with moves made against it."""
+    return f"{len(order)}:{zlib.crc32(','.join(map(str, order)).encode()):08x}"
+
+
+def apply_moves(order, moves):
+    """
+    Apply moves, each a [branch_id, new 0-based position] pair in the order
+    they were made, to a copy of `order`. Raises ValueError on a bad move.
+    """
+    order = list(order)
+    for move in moves:
+        try:
+            branch_id, position = int(move[0]), int(move[1])
+            order.remove(branch_id)
+        except (TypeError, ValueError, IndexError):
+            raise ValueError(f"Bad move {move!r}")
+        if not 0 <= position <= len(order):
+            raise ValueError(f"Bad move {move!r}")
+        order.insert(position, branch_id)
+    return order
+
+
+def save_order(profile, ordered_ids, base_token=None, moves=None):
+    """
+    Store `ordered_ids` (or `moves` applied to the current order, if the
+    current order still matches `base_token`) as the student's list and
+    mark it submitted. Returns (positions or rows written, token of the
+    saved order).
+    """
+    with transaction.atomic():
+        if moves is not None:
+            base = current_order(profile)
+            if order_token(base) != base_token:
+                raise StaleOrder()
+            ordered_ids = apply_moves(base, moves)
+        ordered_ids = _valid_ids(ordered_ids)
+
+        if storage() == PACKED:
+            old = stored_order(profile)
+            changed = sum(1 for a, b in zip(old, ordered_ids) if a != b) + abs(len(old) - len(ordered_ids))
+            previous = profile.preference_list_id
+            if changed:
+                profile.preference_list_id = intern_lists([ordered_ids])[0]
+            if changed or not profile.has_submitted:
+                profile.has_submitted = True
+                profile.save(update_fields=['preference_list', 'has_submitted', 'updated_at'])
+            if previous is not None and previous != profile.preference_list_id:
+                # Drop the old list if this student was its last user
+                prune_lists([previous])
+            return changed, order_token(ordered_ids)
+
+        stored = dict(profile.preferences.values_list('branch_id', 'rank'))
+        wanted = {bid: rank for rank, bid in enumerate(ordered_ids, start=1)}
+        stale = [bid for bid, rank in stored.items() if wanted.get(bid) != rank]
+        fresh = [
+            Preference(student=profile, branch_id=bid, rank=rank)
+            for bid, rank in wanted.items()
+            if stored.get(bid) != rank
+        ]
+        # Delete before insert so (student, rank) stays unique throughout
+        if stale:
+            profile.preferences.filter(branch_id__in=stale).delete()
+        Preference.objects.bulk_create(fresh)
+
+        if stale or fresh or not profile.has_submitted:
+            profile.has_submitted = True
+            profile.save()
+    return len(stale) + len(fresh), order_token(ordered_ids)
+
+
+def append_branch(branch, progress=no_progress, chunk_size=None):
+    """
+    Rank `branch` last in every stored list that doesn't have it yet
+    (default lists pick it up by themselves).
+
+    With row storage each chunk of MATCHING_LOAD_CHUNK_SIZE student ids
+    is a single set-based INSERT. Packed storage extends each shared list
+    once, in batches of PREFERENCE_BLOB_BATCH_SIZE lists, and moves its
+    students over with one UPDATE, giving them a new updated_at so
+    cached allotment pages notice. Every chunk commits on its own, so
+    progress shows as it happens and an interrupted run can simply be
+    repeated. Reports ('append', students or lists done, total) to
+    `progress`; returns how many students' lists were extended.
+    """
+    if storage() == PACKED:
+        return _append_packed(branch, progress, chunk_size)
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'MATCHING_LOAD_CHUNK_SIZE', 20000)
+    pref = Preference._meta.db_table
+    student = StudentProfile._meta.db_table
+    sql = (
+        f"INSERT INTO {pref} (student_id, branch_id, rank) "
+        f"SELECT s.id, %s, MAX(p.rank) + 1 "
+        f"FROM {student} s JOIN {pref} p ON p.student_id = s.id "
+        f"WHERE s.id >= %s AND s.id < %s "
+        f"AND NOT EXISTS (SELECT 1 FROM {pref} q WHERE q.student_id = s.id AND q.branch_id = %s) "
+        f"GROUP BY s.id"
+    )
+
+    total = StudentProfile.objects.count()
+    progress('append', 0, total)
+    ids = StudentProfile.objects.order_by('id').values_list('id', flat=True)
+    added = done = 0
+    low = ids.first()
+    while low is not None:
+        chunk = list(ids.filter(id__gte=low)[:chunk_size + 1])
+        high = chunk[chunk_size] if len(chunk) > chunk_size else chunk[-1] + 1
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, [branch.pk, low, high, branch.pk])
+            added += cursor.rowcount
+        done += min(len(chunk), chunk_size)
+        progress('append', done, total)
+        low = chunk[chunk_size] if len(chunk) > chunk_size else None
+    return added
+
+
+def _append_packed(branch, progress, chunk_size):
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'PREFERENCE_BLOB_BATCH_SIZE', 1000)
+    lists = PreferenceList.objects.filter(id__in=StudentProfile.objects.values('preference_list_id'))
+    # Lists created on the way already end with the branch
+    lists = lists.filter(id__lte=PreferenceList.objects.aggregate(top=Max('id'))['top'] or 0)
+    total = lists.count()
+    progress('append', 0, total)
+    added = done = last = 0
+    while True:
+        chunk = list(lists.filter(id__gt=last).order_by('id').values_list('id', 'blob')[:chunk_size])
+        if not chunk:
+            break
+        extended = []
+        for list_id, blob in chunk:
+            ids = unpack(blob)
+            if branch.pk not in ids:
+                ids.append(branch.pk)
+                extended.append((list_id, ids))
+        new_ids = intern_lists([ids for _, ids in extended])
+        now = timezone.now()
+        with transaction.atomic():
+            # Students who saved another list meanwhile are left alone
+            for (list_id, _), new_id in zip(extended, new_ids):
+                added += StudentProfile.objects.filter(preference_list_id=list_id).update(
+                    preference_list_id=new_id, updated_at=now,
+                )
+        done += len(chunk)
+        last = chunk[-1][0]
+        progress('append', done, total)
+    prune_lists()
+    return added
+
+
+def convert_storage(to, progress=no_progress, chunk_size=None):
+    """
+    Move every stored list into backend `to` (PACKED or ROWS), emptying
+    the other, in one transaction; run it before switching
+    PREFERENCE_STORAGE. Reports ('convert', lists done) to `progress`;
+    returns lists moved.
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'PREFERENCE_BLOB_BATCH_SIZE', 1000)
+    moved = 0
+    progress('convert', 0)
+    with transaction.atomic():
+        if to == PACKED:
+            rows = (
+                Preference.objects
+                .order_by('student_id', 'rank')
+                .values_list('student_id', 'branch_id')
+                .iterator(chunk_size=getattr(settings, 'MATCHING_LOAD_CHUNK_SIZE', 20000))
+            )
+            batch = {}
+            for sid, group in groupby(rows, key=lambda row: row[0]):
+                batch[sid] = [bid for _, bid in group]
+                if len(batch) == chunk_size:
+                    _point_at_lists(batch)
+                    moved += len(batch)
+                    batch = {}
+                    progress('convert', moved)
+            _point_at_lists(batch)
+            moved += len(batch)
+            Preference.objects.all().delete()
+        elif to == ROWS:
+            known = branch_ids(refresh=True)
+            Preference.objects.all().delete()
+            batch = []
+            for sid, _, ids in _iter_packed(None, chunk_size):
+                ranked = [bid for bid in ids if bid in known]
+                batch.extend(
+                    Preference(student_id=sid, branch_id=bid, rank=rank)
+                    for rank, bid in enumerate(ranked, start=1)
+                )
+                moved += 1
+                if len(batch) >= getattr(settings, 'MATCHING_PERSIST_BATCH_SIZE', 5000):
+                    Preference.objects.bulk_create(batch)
+                    batch = []
+                    progress('convert', moved)
+            Preference.objects.bulk_create(batch)
+            StudentProfile.objects.filter(preference_list__isnull=False).update(preference_list=None)
+            prune_lists()
+        else:
+            raise ValueError(f"Unknown preference storage {to!r}")
+    progress('convert', moved)
+    return moved
+
+
+@receiver(post_save, sender=Branch)
+@receiver(post_delete, sender=Branch)
+def _branch_changed(sender, **kwargs):
+    cache.delete(DEFAULT_ORDER_KEY)
@@ -0,0 +1,131 @@
+"""
+Per-run statistics recorded on every MatchingResult.
+
+RunRecorder wraps a run's progress callback and, each time the run moves
+to a new phase (load, compute, persist, verify, activate), closes the
+previous one with its wall time and the process's memory: resident set
+size at the end of the phase and the peak resident set size so far. Peak
+figures are process-wide high-water marks, so a phase only shows a new
+peak if it raised it.
+
+The kernel adds its counters (proposals, rejections, longest rejection
+chain) to `recorder.kernel`. save() stores everything, with the input
+sizes, as MatchingResult.stats.
+
+Two opt-in captures cost real time and are off by default:
+- MATCHING_TRACE_MEMORY: tracemalloc's peak of Python allocations per
+  phase (runs several times slower)
+- MATCHING_PROFILE: a cProfile of the whole run, kept as a
+  MatchingProfile that loads with pstats.Stats
+"""
+import cProfile
+import marshal
+import sys
+import time
+import tracemalloc
+
+from django.conf import settings
+
+from .models import MatchingProfile, MatchingResult
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+
+def _rss_kb():
+    # Current resident set size; Linux only
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * (resource.getpagesize() if resource else 4096) // 1024
+
+
+def _max_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak  # bytes on macOS, KiB elsewhere
+
+
+class RunRecorder:
+    """
+    Progress callback recording each phase of a run before passing the
+    call on to `progress`. Call finish() once the run is over, then
+    save() with its result.
+    """
+
+    def __init__(self, progress, trace_memory=None, profile=None):
+        self.progress = progress
+        self.phases = {}
+        self.kernel = {}
+        self.phase = None
+        self.started = None
+        self.began = time.perf_counter()
+        if trace_memory is None:
+            trace_memory = getattr(settings, 'MATCHING_TRACE_MEMORY', False)
+        if profile is None:
+            profile = getattr(settings, 'MATCHING_PROFILE', False)
+        # Leave tracemalloc alone if someone else is tracing
+        self.trace_memory = trace_memory and not tracemalloc.is_tracing()
+        if self.trace_memory:
+            tracemalloc.start()
+        self.profiler = cProfile.Profile() if profile else None
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    def __call__(self, phase, done=0, total=0):
+        if phase != self.phase:
+            now = time.perf_counter()
+            self._close_phase(now)
+            self.phase, self.started = phase, now
+        self.progress(phase, done, total)
+
+    def _close_phase(self, now):
+        if self.phase is None:
+            return
+        rss, max_rss = _rss_kb(), _max_rss_kb()
+        if rss is not None and max_rss is not None:
+            max_rss = max(rss, max_rss)  # the kernel updates its high-water mark lazily
+        entry = {'seconds': round(now - self.started, 4), 'rss_kb': rss, 'max_rss_kb': max_rss}
+        if self.trace_memory:
+            entry['python_peak_kb'] = tracemalloc.get_traced_memory()[1] // 1024
+            tracemalloc.reset_peak()
+        self.phases[self.phase] = entry
+
+    def finish(self):
+        """Close the last phase and stop any capture."""
+        self._close_phase(time.perf_counter())
+        self.phase = None
+        self.seconds = round(time.perf_counter() - self.began, 4)
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self.trace_memory:
+            tracemalloc.stop()
+            self.trace_memory = False
+
+    def stats(self, data, **extra):
+        """The run's statistics for MatchingResult.stats, `data` being its MatchingInput."""
+        return {
+            'seconds': self.seconds,
+            'phases': self.phases,
+            'students': data.num_students,
+            'branches': data.num_branches,
+            'slots': data.num_slots,
+            'entries': len(data.indices),
+            **self.kernel,
+            **extra,
+        }
+
+    def save(self, result, data, **extra):
+        """Store stats, plus `extra` entries, (and the profile, if captured) on `result`."""
+        result.stats = self.stats(data, **extra)
+        MatchingResult.objects.filter(pk=result.pk).update(stats=result.stats)
+        if self.profiler is not None:
+            self.profiler.create_stats()
+            MatchingProfile.objects.update_or_create(
+                result=result, defaults={'data': marshal.dumps(self.profiler.stats)},
+            )
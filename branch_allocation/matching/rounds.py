@@ -0,0 +1,295 @@
+"""
+Multi-round counselling (freeze / float / slide).
+
+After each round a student holding a seat chooses to:
+- freeze:   accept the seat and leave counselling
+- float:    keep the seat, take any better choice that opens up
+- slide:    keep the seat, take a better branch at the same college only
+- withdraw: give the seat up and leave counselling
+
+The next round is seeded from the previous round's allotments: each
+student's list is cut down to what their choice still allows (a frozen
+seat is a one-entry list, a floater stops at their current seat) and the
+retained seat becomes a guarantee, so nobody can lose it and every
+student either keeps their seat or moves up. Only upgrade candidates and
+students still without a seat propose past their first entry.
+
+Freeze and withdraw are final for all later rounds. Students without a
+seat keep competing for vacated seats with their full list; students
+registered after round 1 sit out.
+
+A round warm-starts from the previous one with kernel.rematch(): every
+retained seat is already held, so only withdrawn seats, seat changes,
+students edited since the last round and sliders who now float (their
+list grows back) set chains off, and only allotments that moved are
+written.
+"""
+from array import array
+
+from django.db import transaction
+
+from .algorithm import (
+    load_matching_input, persist_matching, activate_result, run_gale_shapley, no_progress,
+)
+from .kernel import gale_shapley, rematch, dereserve, Applicants, index_applicants, UNMATCHED
+from .models import Branch, CounsellingRound, SeatChoice, StudentProfile
+from .profiling import RunRecorder
+from .verify import verify_run
+
+
+def current_round():
+    """The latest CounsellingRound, or None before round 1."""
+    return CounsellingRound.objects.select_related('result').order_by('-number').first()
+
+
+class RoundPlan:
+    """
+    A round's kernel input: a CSR restricted to what each student may
+    still be allotted, `home` with each student's retained slot (or -1),
+    and `origin` mapping entries back to the full MatchingInput.
+
+    `prior` holds each student's entry (in the full MatchingInput) in the
+    previous round, or UNMATCHED; `fresh` the students with no allotment
+    there at all.
+    """
+
+    def __init__(self, indptr, indices, origin, seats, home, prior=None, fresh=()):
+        self.indptr = indptr
+        self.indices = indices
+        self.origin = origin
+        self.seats = seats
+        self.home = home
+        self.prior = prior
+        self.fresh = fresh
+
+
+def plan_round(data, previous):
+    """Build the RoundPlan for the round after `previous`."""
+    n, m = data.num_students, data.num_slots
+    indptr, indices = data.indptr, data.indices
+    student_pos = {sid: i for i, sid in enumerate(data.student_ids)}
+    slot_pos = {data.slot_key(j): j for j in range(m)}
+
+    colleges = dict(Branch.objects.values_list('id', 'college'))
+    college = [colleges[data.branch_ids[b]] for b in data.slot_branch]
+    choices = dict(previous.choices.values_list('student_id', 'choice'))
+    # Freeze and withdraw are final: they carry over from earlier rounds
+    final = dict(
+        SeatChoice.objects
+        .filter(round__number__lte=previous.number, choice__in=[SeatChoice.FREEZE, SeatChoice.WITHDRAW])
+        .values_list('student_id', 'choice')
+    )
+    choices.update(final)
+    registered = set(
+        CounsellingRound.objects.get(number=1).result.allotments.values_list('student_id', flat=True)
+    )
+
+    # (entry position or UNMATCHED, choice) per student in the last round
+    held = {}
+    prior = array('q', [UNMATCHED]) * n
+    seen = bytearray(n)
+    allotments = previous.result.allotments.values_list('student_id', 'branch_id', 'quota', 'preference_rank')
+    for sid, bid, quota, pref_rank in allotments:
+        i = student_pos.get(sid)
+        if i is None:
+            continue
+        seen[i] = 1
+        p = UNMATCHED
+        j = slot_pos.get(f"{bid}:{quota}") if bid is not None else None
+        if j is not None:
+            p = data.find_entry(i, j, pref_rank)
+            if p == UNMATCHED:
+                # List edited since the round; find the seat again
+                p = data.find_entry(i, j)
+        prior[i] = p
+        if sid not in registered or final.get(sid) == SeatChoice.WITHDRAW:
+            continue
+        if bid is None:
+            held[i] = (UNMATCHED, None)
+            continue
+        held[i] = (p, choices.get(sid, SeatChoice.DEFAULT))
+
+    new_indptr = array('q', [0])
+    new_indices = array('l')
+    origin = array('q')
+    home = array('l')
+    retained = [0] * m
+
+    for i in range(n):
+        start, end = indptr[i], indptr[i + 1]
+        p, choice = held.get(i, (UNMATCHED, SeatChoice.WITHDRAW))
+        if p == UNMATCHED:
+            # No seat (or it vanished from their list): compete with the full list
+            keep = range(start, end) if choice != SeatChoice.WITHDRAW else ()
+        elif choice == SeatChoice.WITHDRAW:
+            keep = ()
+        elif choice == SeatChoice.FREEZE:
+            keep = (p,)
+        elif choice == SeatChoice.SLIDE:
+            here = college[indices[p]]
+            keep = [q for q in range(start, p) if college[indices[q]] == here] + [p]
+        else:
+            keep = range(start, p + 1)
+
+        seat = -1
+        for q in keep:
+            if q == p:
+                seat = indices[q]
+                retained[seat] += 1
+            new_indices.append(indices[q])
+            origin.append(q)
+        new_indptr.append(len(new_indices))
+        home.append(seat)
+
+    # Seats de-reserved in earlier rounds stay where they went
+    seats = array('l', data.seats)
+    for key, counts in previous.result.seat_snapshot.items():
+        j = slot_pos.get(key)
+        if j is not None and len(counts) == 3:
+            seats[j] = max(0, seats[j] + counts[1] - counts[0])
+    # Retained seats are never taken back, even if seats were cut
+    seats = array('l', (max(seats[j], retained[j]) for j in range(m)))
+
+    fresh = {i for i in range(n) if not seen[i]}
+    return RoundPlan(new_indptr, new_indices, origin, seats, home, prior=prior, fresh=fresh)
+
+
+def _warm_round(data, previous, plan):
+    """
+    Map the previous round onto `plan` as kernel.rematch() arguments:
+    everyone keeping a seat starts on it, the last entry of their new
+    list, which is what rematch() asks of students with a home. Students
+    whose list may have grown are dirty instead: edited since the round,
+    or sliders who now float. Returns None when a full run is needed
+    (the slot layout changed).
+    """
+    result = previous.result
+    snapshot = result.seat_snapshot
+    if result.snapshot_at is None or result.catalog_digest != data.catalog:
+        return None
+    slot_pos = {data.slot_key(j): j for j in range(data.num_slots)}
+    if set(snapshot) != set(slot_pos):
+        return None
+
+    n, m = data.num_students, data.num_slots
+    indptr, home = plan.indptr, plan.home
+    student_pos = {sid: i for i, sid in enumerate(data.student_ids)}
+
+    edited = StudentProfile.objects.filter(updated_at__gt=result.snapshot_at).values_list('id', flat=True)
+    dirty = {student_pos[sid] for sid in edited if sid in student_pos}
+    # Lists were cut to the college of the seat last round; floating restores the rest
+    slid = (
+        SeatChoice.objects
+        .filter(round__number=previous.number - 1, choice=SeatChoice.SLIDE)
+        .values_list('student_id', flat=True)
+    )
+    # ...unless they chose again to slide (or to leave); no answer means float
+    kept = set(
+        previous.choices.filter(choice__in=[SeatChoice.SLIDE, SeatChoice.FREEZE, SeatChoice.WITHDRAW])
+        .values_list('student_id', flat=True)
+    )
+    dirty.update(student_pos[sid] for sid in slid if sid not in kept and sid in student_pos)
+
+    seed = array('q', [UNMATCHED]) * n
+    filled = [0] * m
+    vacated = set()
+    prior = plan.prior
+    for i in range(n):
+        if prior[i] != UNMATCHED:
+            j = data.indices[prior[i]]
+            filled[j] += 1
+            if home[i] < 0:
+                vacated.add(j)  # withdrawn, or no longer registered
+        if home[i] < 0:
+            continue
+        if i in dirty:
+            vacated.add(home[i])
+        else:
+            seed[i] = indptr[i + 1] - 1  # the retained seat ends the list
+
+    prev_seats = array('l', [0]) * m
+    for j in range(m):
+        _, old_effective, old_filled = snapshot[data.slot_key(j)]
+        prev_seats[j] = old_effective
+        # Fewer allotments than before means a student was deleted
+        if filled[j] < old_filled or plan.seats[j] > old_effective:
+            vacated.add(j)
+
+    return {
+        'seed': seed,
+        'dirty': dirty,
+        'vacated': vacated,
+        'prev_seats': prev_seats,
+    }
+
+
+def run_next_round(progress=no_progress):
+    """
+    Run the next counselling round and return its CounsellingRound.
+    Round 1 is a full matching run. Returns None without input data.
+    `progress` is reported to, the result verified and its stats recorded,
+    as in run_gale_shapley(); a round that fails verification is rolled
+    back.
+    """
+    previous = current_round()
+    if previous is None:
+        result = run_gale_shapley(progress=progress)
+        if result is None:
+            return None
+        return CounsellingRound.objects.create(number=1, result=result)
+
+    recorder = RunRecorder(progress)
+    try:
+        recorder('load')
+        data = load_matching_input()
+        if not data.num_students or not data.num_branches:
+            return None
+
+        recorder('compute')
+        plan = plan_round(data, previous)
+        warm = _warm_round(data, previous, plan)
+        # A round re-offers every seat given up, so chains reach most branches:
+        # index them all at once (lists end at the seat, so this is cheap)
+        applicants = Applicants(
+            plan.indptr, plan.indices, data.air,
+            index=index_applicants(plan.indptr, plan.indices, data.air, data.num_slots),
+        )
+
+        def resolve(seats, prev_seats, assignment, vacated):
+            return rematch(
+                plan.indptr, plan.indices, data.air, seats,
+                seed=assignment, dirty=(), vacated=vacated, prev_seats=prev_seats, home=plan.home,
+                stats=recorder.kernel, applicants=applicants,
+            )
+
+        if warm is None:
+            assignment = gale_shapley(
+                plan.indptr, plan.indices, data.air, plan.seats, home=plan.home, stats=recorder.kernel,
+            )
+        else:
+            assignment = rematch(
+                plan.indptr, plan.indices, data.air, plan.seats, home=plan.home,
+                stats=recorder.kernel, applicants=applicants, **warm,
+            )
+        seats, assignment = dereserve(plan.indices, plan.seats, assignment, data.dereserve, resolve)
+        for i, p in enumerate(assignment):
+            if p != UNMATCHED:
+                assignment[i] = plan.origin[p]
+        changed = None
+        if warm is not None:
+            changed = set(warm['dirty']) | plan.fresh
+            changed.update(i for i, p in enumerate(assignment) if p != plan.prior[i])
+
+        with transaction.atomic():
+            result = persist_matching(
+                data, assignment, seats, progress=recorder,
+                previous=previous.result if warm is not None else None, changed=changed,
+            )
+            verification = verify_run(result, data, plan, progress=recorder)
+            recorder('activate')
+            result = activate_result(result)
+            counselling_round = CounsellingRound.objects.create(number=previous.number + 1, result=result)
+    finally:
+        recorder.finish()
+    recorder.save(result, data, round=counselling_round.number, warm_start=warm is not None, verification=verification)
+    return counselling_round
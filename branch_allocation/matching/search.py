@@ -0,0 +1,148 @@
+"""
+Student name search.
+
+On SQLite with FTS5, names and usernames are mirrored into a full-text
+side table (created by migration 0008) and kept in sync by the signals
+below, so a search is an index lookup instead of LIKE scans over
+auth_user. Every word the admin types is matched as a prefix of a name
+or username word: "ram ku" finds "Ramesh Kumar".
+
+Elsewhere (or if FTS5 is missing) search falls back to one icontains
+filter per word, which matches substrings rather than prefixes.
+
+Whether the index exists is looked up once per process and forgotten
+after every migrate.
+"""
+import re
+from functools import lru_cache
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from .models import StudentProfile
+
+TABLE = 'matching_student_search'
+_WORD = re.compile(r'\w+')
+
+
+@lru_cache(maxsize=None)
+def index_available():
+    """Whether the FTS5 table exists on the default database."""
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = %s", [TABLE])
+        return cursor.fetchone() is not None
+
+
+def _match_expression(words):
+    # Quoted so FTS5 operators in user input are taken literally
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def filter_students(students, q):
+    """
+    Narrow a StudentProfile queryset to students matching `q`. A blank
+    `q` leaves it as is; one with no words in it (only punctuation)
+    matches nobody.
+    """
+    if not q.strip():
+        return students
+    words = _WORD.findall(q.lower())
+    if not words:
+        return students.none()
+    if index_available():
+        return students.filter(id__in=RawSQL(
+            f"SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s",
+            [_match_expression(words)],
+        ))
+    for word in words:
+        students = students.filter(
+            Q(user__first_name__icontains=word)
+            | Q(user__last_name__icontains=word)
+            | Q(user__username__icontains=word)
+        )
+    return students
+
+
+# ─────────────────────────────────────────────────────────────
+# Index maintenance
+# ─────────────────────────────────────────────────────────────
+
+def _index_rows(rows):
+    # rows: (student id, first name, last name, username)
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {TABLE} WHERE rowid = %s", [(row[0],) for row in rows])
+        cursor.executemany(
+            f"INSERT INTO {TABLE} (rowid, name, username) VALUES (%s, %s, %s)",
+            [(sid, f"{first} {last}".strip(), username) for sid, first, last, username in rows],
+        )
+
+
+def index_students(profile_ids):
+    """(Re)index the given students."""
+    if not index_available():
+        return
+    rows = list(
+        StudentProfile.objects
+        .filter(id__in=profile_ids)
+        .values_list('id', 'user__first_name', 'user__last_name', 'user__username')
+    )
+    _index_rows(rows)
+
+
+def rebuild_index(chunk_size=5000):
+    """Re-create every row of the index, e.g. after bulk imports."""
+    if not index_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+    rows = (
+        StudentProfile.objects
+        .order_by('id')
+        .values_list('id', 'user__first_name', 'user__last_name', 'user__username')
+        .iterator(chunk_size=chunk_size)
+    )
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == chunk_size:
+            _index_rows(batch)
+            count += len(batch)
+            batch = []
+    _index_rows(batch)
+    return count + len(batch)
+
+
+@receiver(post_migrate)
+def _migrated(sender, **kwargs):
+    # Migrations may have created or dropped the table
+    index_available.cache_clear()
+
+
+@receiver(post_save, sender=StudentProfile)
+def _profile_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        index_students([instance.id])
+
+
+@receiver(post_save, sender=User)
+def _user_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Names change on the user; a brand-new user has no profile yet
+    if created or raw:
+        return
+    if update_fields is not None and not {'first_name', 'last_name', 'username'} & set(update_fields):
+        return  # e.g. last_login on every sign-in
+    index_students(StudentProfile.objects.filter(user=instance).values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=StudentProfile)
+def _profile_deleted(sender, instance, **kwargs):
+    if index_available():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [instance.id])
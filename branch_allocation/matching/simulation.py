@@ -0,0 +1,223 @@
+"""
+What-if simulation of seat-matrix changes.
+
+Each scenario changes some seat counts and reports, per seat bucket,
+how fill and closing rank move against the current seat matrix. Nothing
+is written to the database.
+
+The preference arrays, and an index of every branch's applicants
+(kernel.index_applicants()), are built once and copied into shared
+memory; a process pool attaches to them and solves scenarios in
+parallel. Every scenario warm-starts from the baseline matching with
+kernel.rematch() against the shared index, so a worker's cost is the
+vacancy chains its scenarios replay, not a pass over every entry.
+
+This module only depends on the kernel: pool workers import it without
+Django being set up. Callers load the input with load_matching_input().
+"""
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from .kernel import (
+    gale_shapley, rematch, dereserve, index_applicants, Applicants, UNMATCHED, UNRANKED_AIR,
+)
+
+# Quota code of a branch's plain OPEN bucket (models.quota_code('OPEN'))
+OPEN = 'OPEN'
+
+
+class Scenario:
+    """
+    A named set of seat changes.
+
+    `changes` maps a branch id to a seat delta for its OPEN bucket, or a
+    'branch_id:quota' key (e.g. '12:OBC-NCL') to a delta for that bucket.
+    """
+
+    def __init__(self, name, changes):
+        self.name = name
+        self.changes = changes
+
+    def __repr__(self):
+        return f"Scenario({self.name!r}, {self.changes!r})"
+
+    def seats(self, data):
+        """The scenario's seat vector over data's slots."""
+        slot_pos = {data.slot_key(j): j for j in range(data.num_slots)}
+        open_slot = {
+            str(data.branch_ids[data.slot_branch[j]]): j
+            for j in range(data.num_slots)
+            if data.slot_quota[j] == OPEN
+        }
+
+        seats = array('l', data.seats)
+        for key, delta in self.changes.items():
+            key = str(key)
+            j = slot_pos.get(key) if ':' in key else open_slot.get(key)
+            if j is None:
+                raise ValueError(f"{self.name}: no seat bucket {key!r}")
+            seats[j] = max(0, seats[j] + int(delta))
+        return seats
+
+
+# ─────────────────────────────────────────────────────────────
+# Shared memory
+# ─────────────────────────────────────────────────────────────
+
+def _share(values):
+    """Copy an array into a new shared memory block; returns (block, descriptor)."""
+    block = shared_memory.SharedMemory(create=True, size=max(1, len(values) * values.itemsize))
+    view = block.buf.cast(values.typecode)
+    view[:len(values)] = values
+    view.release()
+    return block, (block.name, values.typecode, len(values))
+
+
+def _attach(descriptor):
+    name, typecode, length = descriptor
+    # Pool workers share the parent's resource tracker, so the parent's
+    # unlink() is the only cleanup needed
+    block = shared_memory.SharedMemory(name=name)
+    return block, block.buf.cast(typecode)[:length]
+
+
+# Per-worker state, set by _init_worker()
+_worker = {}
+
+
+def _init_worker(descriptors, base_seats, rules):
+    blocks = []
+    for field, descriptor in descriptors.items():
+        block, view = _attach(descriptor)
+        blocks.append(block)
+        _worker[field] = view
+    _worker['blocks'] = blocks
+    _worker['base_seats'] = base_seats
+    _worker['rules'] = rules
+    _worker['applicants'] = Applicants(
+        _worker['indptr'], _worker['indices'], _worker['air'],
+        index=(_worker['applicant_ptr'], _worker['applicant_entries']),
+    )
+
+
+def _resolver(indptr, indices, air, applicants):
+    # Re-solve after a seat change by warm-starting from the last assignment
+    def resolve(seats, prev_seats, assignment, vacated):
+        return rematch(
+            indptr, indices, air, seats,
+            seed=assignment, dirty=(), vacated=vacated, prev_seats=prev_seats, applicants=applicants,
+        )
+    return resolve
+
+
+def _solve(indptr, indices, air, base, base_seats, seats, rules, applicants):
+    """Matching under `seats`, warm-started from `base` (solved under base_seats)."""
+    resolve = _resolver(indptr, indices, air, applicants)
+    grown = {j for j in range(len(seats)) if seats[j] > base_seats[j]}
+    assignment = resolve(seats, base_seats, base, grown)
+    return dereserve(indices, seats, assignment, rules, resolve)
+
+
+def _outcome(indices, air, seats, assignment):
+    # Per slot: (seats, filled, closing AIR)
+    filled = [0] * len(seats)
+    closing = [None] * len(seats)
+    for i, p in enumerate(assignment):
+        if p != UNMATCHED:
+            j = indices[p]
+            filled[j] += 1
+            if air[i] != UNRANKED_AIR and (closing[j] is None or air[i] > closing[j]):
+                closing[j] = air[i]
+    return list(seats), filled, closing
+
+
+def _run_scenario(seats):
+    w = _worker
+    final_seats, assignment = _solve(
+        w['indptr'], w['indices'], w['air'], w['base'], w['base_seats'], seats, w['rules'], w['applicants'],
+    )
+    return _outcome(w['indices'], w['air'], final_seats, assignment)
+
+
+# ─────────────────────────────────────────────────────────────
+# API
+# ─────────────────────────────────────────────────────────────
+
+def _run_pool(data, base, index, scenario_seats, workers):
+    blocks = []
+    try:
+        descriptors = {}
+        for field, values in (
+            ('indptr', data.indptr), ('indices', data.indices), ('air', data.air), ('base', base),
+            ('applicant_ptr', index[0]), ('applicant_entries', index[1]),
+        ):
+            block, descriptors[field] = _share(values)
+            blocks.append(block)
+
+        pool = ProcessPoolExecutor(
+            max_workers=workers or None,
+            initializer=_init_worker,
+            initargs=(descriptors, data.seats, data.dereserve),
+        )
+        with pool:
+            return list(pool.map(_run_scenario, scenario_seats))
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+def _delta(new, old):
+    return None if new is None or old is None else new - old
+
+
+def simulate(data, scenarios, workers=None):
+    """
+    Evaluate `scenarios` (Scenario instances) against `data`.
+
+    Returns {'baseline': rows, 'scenarios': [{'name', 'rows'}]} where
+    each row describes one seat bucket: slot key, branch_id, quota,
+    seats, filled and closing_air, plus filled_delta / closing_delta
+    against the baseline in scenario rows. Buckets a scenario leaves
+    unchanged are omitted from its rows.
+    """
+    scenario_seats = [scenario.seats(data) for scenario in scenarios]
+
+    base = gale_shapley(data.indptr, data.indices, data.air, data.seats)
+    index = index_applicants(data.indptr, data.indices, data.air, data.num_slots)
+    applicants = Applicants(data.indptr, data.indices, data.air, index=index)
+    base_seats, base_final = dereserve(
+        data.indices, data.seats, base, data.dereserve,
+        _resolver(data.indptr, data.indices, data.air, applicants),
+    )
+    baseline = _outcome(data.indices, data.air, base_seats, base_final)
+    outcomes = _run_pool(data, base, index, scenario_seats, workers) if scenarios else []
+
+    def rows(outcome, compare):
+        out = []
+        for j in range(data.num_slots):
+            seats, filled, closing = outcome[0][j], outcome[1][j], outcome[2][j]
+            row = {
+                'slot': data.slot_key(j),
+                'branch_id': data.branch_ids[data.slot_branch[j]],
+                'quota': data.slot_quota[j],
+                'seats': seats,
+                'filled': filled,
+                'closing_air': closing,
+            }
+            if compare:
+                row['filled_delta'] = filled - baseline[1][j]
+                row['closing_delta'] = _delta(closing, baseline[2][j])
+                if seats == baseline[0][j] and not row['filled_delta'] and closing == baseline[2][j]:
+                    continue
+            out.append(row)
+        return out
+
+    return {
+        'baseline': rows(baseline, compare=False),
+        'scenarios': [
+            {'name': scenario.name, 'rows': rows(outcome, compare=True)}
+            for scenario, outcome in zip(scenarios, outcomes)
+        ],
+    }
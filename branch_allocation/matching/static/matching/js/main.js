@@ -39,18 +39,26 @@ let dragSrc = null;
 function initDragList(listId) {
   const list = document.getElementById(listId);
   if (!list) return;
+  // [branch id, new position] for every drag since the last save
+  list.moves = [];
+  let dragFrom = -1;
 
   list.addEventListener('dragstart', e => {
     const row = e.target.closest('.pref-row');
     if (!row) return;
     dragSrc = row;
+    dragFrom = [...list.querySelectorAll('.pref-row')].indexOf(row);
     setTimeout(() => row.classList.add('dragging'), 0);
     e.dataTransfer.effectAllowed = 'move';
   });
 
   list.addEventListener('dragend', e => {
     const row = e.target.closest('.pref-row');
-    if (row) row.classList.remove('dragging');
+    if (row) {
+      row.classList.remove('dragging');
+      const to = [...list.querySelectorAll('.pref-row')].indexOf(row);
+      if (to !== dragFrom) list.moves.push([Number(row.dataset.branchId), to]);
+    }
     list.querySelectorAll('.pref-row').forEach(r => r.classList.remove('drag-over'));
     dragSrc = null;
   });
@@ -84,6 +92,8 @@ function updateRanks(list) {
 }
 
 // ── Save preferences via AJAX ─────────────────────
+// Sends only the moves made since the last save; falls back to the full
+// order if the saved list changed in the meantime (e.g. another tab).
 function savePreferences() {
   const list = document.getElementById('pref-list');
   if (!list) return;
@@ -99,17 +109,23 @@ function savePreferences() {
   const btn = document.getElementById('save-btn');
   if (btn) { btn.disabled = true; btn.textContent = 'Saving…'; }
 
-  fetch(window.location.href, {
+  const post = payload => fetch(window.location.href, {
     method: 'POST',
     headers: {
       'Content-Type': 'application/json',
       'X-CSRFToken': getCookie('csrftoken'),
     },
-    body: JSON.stringify({ ordered_ids: orderedIds }),
-  })
+    body: JSON.stringify(payload),
+  });
+  const moves = list.moves || [];
+
+  (list.dataset.base ? post({ moves: moves, base: list.dataset.base }) : post({ ordered_ids: orderedIds }))
+  .then(r => r.status === 409 ? post({ ordered_ids: orderedIds }) : r)
   .then(r => r.json())
   .then(data => {
     if (data.success) {
+      list.dataset.base = data.base;
+      list.moves = (list.moves || []).slice(moves.length);
       showToast('✓ Preferences saved and submitted!', 'success');
       const pill = document.getElementById('pref-pill');
       if (pill) { pill.className = 'pill pill-green'; pill.textContent = '✓ Submitted'; }
@@ -123,6 +139,27 @@ function savePreferences() {
   });
 }
 
+// ── Background job status ─────────────────────────
+// Poll a running job's status box and reload the page once it finishes
+function pollJob(boxId) {
+  const box = document.getElementById(boxId);
+  if (!box) return;
+  const poll = () => fetch(box.dataset.url)
+    .then(r => r.json())
+    .then(job => {
+      if (job.status === 'done' || job.status === 'failed') {
+        window.location.reload();
+        return;
+      }
+      box.querySelector('.job-phase').textContent = job.phase || job.status;
+      box.querySelector('.job-count').textContent =
+        job.total ? ` (${job.done} / ${job.total})` : '';
+      setTimeout(poll, 1000);
+    })
+    .catch(() => setTimeout(poll, 3000));
+  setTimeout(poll, 1000);
+}
+
 // ── CSRF cookie helper ────────────────────────────
 function getCookie(name) {
   const v = document.cookie.match('(^|;)\\s*' + name + '\\s*=\\s*([^;]+)');
@@ -0,0 +1,262 @@
+"""
+Synthetic counselling data for scale testing.
+
+Generates N students × M branches with correlated preference lists,
+sampled with NumPy from a fixed seed, so the same arguments always give
+the same data:
+
+- colleges come in prestige tiers (the top 10%, the next 20%, the
+  rest), and prestige also falls off smoothly within a tier
+- disciplines have a popularity skew (computer science first, ocean
+  engineering last); every college offers the most popular ones first
+- a student's utility for a branch is college prestige + discipline
+  popularity + the student's own taste for the discipline + a home
+  state bonus + Gumbel noise, less a penalty for branches that likely
+  close above their AIR band; their list is their top-L branches
+- list length L depends on the AIR band: toppers list a few branches,
+  the tail lists many
+
+Records have the shapes matching/importer.py reads, so they go to the
+database through its bulk path (load()) or to files for
+`manage.py import_counselling` (write_files()).
+
+Needs NumPy (requirements-dev.txt), which the app itself does not.
+"""
+import csv
+import json
+import math
+import os
+
+import numpy as np
+
+from .algorithm import no_progress
+from .importer import import_records
+
+# (discipline, popularity) from most to least sought after
+DISCIPLINES = [
+    ('Computer Science & Engg', 3.0),
+    ('Mathematics & Computing', 2.6),
+    ('Artificial Intelligence', 2.5),
+    ('Electrical Engineering', 2.3),
+    ('Electronics & Communication', 2.1),
+    ('Engineering Physics', 1.6),
+    ('Mechanical Engineering', 1.4),
+    ('Aerospace Engineering', 1.2),
+    ('Chemical Engineering', 1.0),
+    ('Civil Engineering', 0.8),
+    ('Materials Science', 0.6),
+    ('Metallurgical Engineering', 0.5),
+    ('Biotechnology', 0.4),
+    ('Engineering Design', 0.3),
+    ('Mining Engineering', 0.2),
+    ('Ocean Engineering', 0.1),
+]
+# Average branches per college, and (share of colleges, prestige bonus) per tier
+BRANCHES_PER_COLLEGE = 8
+TIERS = [(0.1, 2.0), (0.2, 1.0), (0.7, 0.0)]
+STATES = [
+    'Maharashtra', 'Delhi', 'Tamil Nadu', 'West Bengal', 'Uttar Pradesh', 'Telangana', 'Karnataka',
+    'Gujarat', 'Rajasthan', 'Bihar', 'Madhya Pradesh', 'Kerala', 'Odisha', 'Punjab', 'Assam',
+]
+CATEGORIES = [('OPEN', 0.45), ('EWS', 0.10), ('OBC-NCL', 0.27), ('SC', 0.12), ('ST', 0.06)]
+FEMALE_SHARE = 0.2
+FIRST_NAMES = [
+    'Aarav', 'Ananya', 'Arjun', 'Diya', 'Ishaan', 'Kavya', 'Rohan', 'Priya', 'Vivek', 'Sneha',
+    'Karthik', 'Meera', 'Rahul', 'Nandini', 'Aditya', 'Pooja', 'Harsh', 'Riya', 'Siddharth', 'Lakshmi',
+]
+LAST_NAMES = [
+    'Sharma', 'Gupta', 'Iyer', 'Nair', 'Reddy', 'Patel', 'Singh', 'Jain', 'Das', 'Rao',
+    'Mehta', 'Verma', 'Pillai', 'Bose', 'Yadav', 'Mishra', 'Khanna', 'Agarwal', 'Menon', 'Joshi',
+]
+# Model weights: per-student discipline taste and utility noise scales,
+# home state bonus, and utility lost per unit of AIR band a branch is out of reach
+TASTE_SCALE = 0.3
+NOISE_SCALE = 0.25
+HOME_BONUS = 0.3
+REACH_PENALTY = 10.0
+# Utility matrix entries computed at once (students per chunk × branches)
+CHUNK_CELLS = 4_000_000
+
+
+class SyntheticData:
+    """
+    `num_students` students and `num_branches` branches generated from
+    `seed`. Seats total about `seat_ratio` × students; a `submitted`
+    share of students have a list, the rest keep the default order.
+    """
+
+    def __init__(self, num_students, num_branches, seed=0, seat_ratio=0.5, submitted=0.9):
+        if num_students < 1 or num_branches < 1:
+            raise ValueError('need at least one student and one branch')
+        self.num_students = num_students
+        self.num_branches = num_branches
+        self.seed = seed
+        colleges_rng, students_rng, self._lists_seed = np.random.SeedSequence(seed).spawn(3)
+        self._colleges(np.random.default_rng(colleges_rng), seat_ratio)
+        self._students(np.random.default_rng(students_rng), submitted)
+
+    def _colleges(self, rng, seat_ratio):
+        m = self.num_branches
+        colleges = max(math.ceil(m / len(DISCIPLINES)), round(m / BRANCHES_PER_COLLEGE), 1)
+        # Branch j: college j % colleges, its (j // colleges)-th most popular discipline
+        self.college = np.arange(m) % colleges
+        self.discipline = np.arange(m) // colleges
+
+        shares = np.array([share for share, _ in TIERS])
+        bounds = np.ceil(np.cumsum(shares) / shares.sum() * colleges)
+        tier = np.searchsorted(bounds, np.arange(colleges), side='right')
+        bonus = np.array([bonus for _, bonus in TIERS])[tier]
+        prestige = bonus - 1.5 * np.arange(colleges) / colleges + rng.normal(0, 0.1, colleges)
+        popularity = np.array([weight for _, weight in DISCIPLINES])
+
+        self.college_state = rng.integers(0, len(STATES), colleges)
+        self.score = (prestige[self.college] + popularity[self.discipline]).astype(np.float32)
+
+        # Intakes vary around the mean; every branch has a seat
+        weight = rng.gamma(4.0, 0.25, m)
+        total = max(m, round(seat_ratio * self.num_students))
+        self.seats = 1 + np.floor(weight / weight.sum() * (total - m)).astype(np.int64)
+        # Expected closing AIR band (rank / students) if branches fill best first
+        best_first = np.argsort(-self.score, kind='stable')
+        self.cutoff = np.empty(m, dtype=np.float32)
+        self.cutoff[best_first] = np.cumsum(self.seats[best_first]) / self.num_students
+
+    def _students(self, rng, submitted):
+        n = self.num_students
+        self.air = rng.permutation(n) + 1
+        self.category = rng.choice(len(CATEGORIES), n, p=[share for _, share in CATEGORIES])
+        self.female = rng.random(n) < FEMALE_SHARE
+        self.home_state = rng.integers(0, len(STATES), n)
+        self.first_name = rng.integers(0, len(FIRST_NAMES), n)
+        self.last_name = rng.integers(0, len(LAST_NAMES), n)
+        self.submitted = rng.random(n) < submitted
+
+        # Toppers list ~10 branches, the last ranks ~60
+        self.band = (self.air / n).astype(np.float32)
+        mean = 10 + 50 * np.sqrt(self.band)
+        self.length = np.clip(np.rint(mean * rng.lognormal(0, 0.3, n)), 1, self.num_branches).astype(np.int64)
+
+    # ─────────────────────────────────────────────────────────────
+    # Records
+    # ─────────────────────────────────────────────────────────────
+
+    def college_name(self, c):
+        return f"Institute {c + 1:04d}"
+
+    def branch_keys(self):
+        """(college, branch) of every branch, by position."""
+        return [
+            (self.college_name(c), DISCIPLINES[d][0]) for c, d in zip(self.college.tolist(), self.discipline.tolist())
+        ]
+
+    def username(self, i):
+        return f"s{i + 1:07d}"
+
+    def branch_records(self):
+        states = self.college_state[self.college].tolist()
+        return [
+            {'college': college, 'branch': branch, 'seats': seats, 'state': STATES[state]}
+            for (college, branch), seats, state in zip(self.branch_keys(), self.seats.tolist(), states)
+        ]
+
+    def student_records(self):
+        columns = zip(
+            self.first_name.tolist(), self.last_name.tolist(), self.air.tolist(),
+            self.category.tolist(), self.female.tolist(), self.home_state.tolist(),
+        )
+        for i, (first, last, air, category, female, state) in enumerate(columns):
+            yield {
+                'username': self.username(i),
+                'first_name': FIRST_NAMES[first],
+                'last_name': LAST_NAMES[last],
+                'air_rank': air,
+                'category': CATEGORIES[category][0],
+                'gender': 'F' if female else 'M',
+                'home_state': STATES[state],
+            }
+
+    def lists(self):
+        """Yield (student position, branch positions most preferred first) for each submitter."""
+        rng = np.random.default_rng(self._lists_seed)
+        n, m = self.num_students, self.num_branches
+        branch_state = self.college_state[self.college]
+        chunk = max(1, CHUNK_CELLS // m)
+        for start in range(0, n, chunk):
+            stop = min(n, start + chunk)
+            rows = stop - start
+            taste = rng.normal(0, TASTE_SCALE, (rows, len(DISCIPLINES))).astype(np.float32)
+            utility = rng.gumbel(0, NOISE_SCALE, (rows, m)).astype(np.float32)
+            utility += self.score
+            utility += taste[:, self.discipline]
+            utility += HOME_BONUS * (self.home_state[start:stop, None] == branch_state)
+            utility -= REACH_PENALTY * np.maximum(0, self.band[start:stop, None] - self.cutoff)
+
+            lengths = self.length[start:stop]
+            longest = int(lengths.max())
+            if longest < m:
+                top = np.argpartition(-utility, longest - 1, axis=1)[:, :longest]
+            else:
+                top = np.broadcast_to(np.arange(m), (rows, m))
+            order = np.argsort(-np.take_along_axis(utility, top, axis=1), axis=1, kind='stable')
+            ranked = np.take_along_axis(top, order, axis=1)
+
+            submitted = self.submitted[start:stop]
+            for k, (row, length) in enumerate(zip(ranked.tolist(), lengths.tolist())):
+                if submitted[k]:
+                    yield start + k, row[:length]
+
+    def preference_records(self):
+        keys = self.branch_keys()
+        for i, row in self.lists():
+            yield {'username': self.username(i), 'preferences': [keys[j] for j in row]}
+
+
+# ─────────────────────────────────────────────────────────────
+# Output
+# ─────────────────────────────────────────────────────────────
+
+def load(data, password_hash=None, batch_size=None, progress=no_progress):
+    """Write `data` to the database through the bulk import path; returns records per kind."""
+    return {
+        'branches': import_records('branches', data.branch_records(), batch_size=batch_size, progress=progress),
+        'students': import_records(
+            'students', data.student_records(), batch_size=batch_size, password_hash=password_hash, progress=progress,
+        ),
+        'preferences': import_records(
+            'preferences', data.preference_records(), batch_size=batch_size, progress=progress,
+        ),
+    }
+
+
+def write_files(data, directory, progress=no_progress):
+    """
+    Write branches.csv, students.csv and preferences.jsonl for
+    `manage.py import_counselling` into `directory`; returns their paths.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {
+        'branches': os.path.join(directory, 'branches.csv'),
+        'students': os.path.join(directory, 'students.csv'),
+        'preferences': os.path.join(directory, 'preferences.jsonl'),
+    }
+    for kind, records in (('branches', data.branch_records()), ('students', data.student_records())):
+        progress(kind, 0)
+        with open(paths[kind], 'w', newline='') as f:
+            writer = None
+            for done, record in enumerate(records, start=1):
+                if writer is None:
+                    writer = csv.DictWriter(f, fieldnames=list(record))
+                    writer.writeheader()
+                writer.writerow(record)
+        progress(kind, done)
+
+    # Each branch's JSON is built once and spliced into the lines
+    choices = [json.dumps(list(key)) for key in data.branch_keys()]
+    progress('preferences', 0)
+    done = 0
+    with open(paths['preferences'], 'w') as f:
+        for i, row in data.lists():
+            f.write(f'{{"username": "{data.username(i)}", "preferences": [{", ".join(choices[j] for j in row)}]}}\n')
+            done += 1
+    progress('preferences', done)
+    return paths
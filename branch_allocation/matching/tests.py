@@ -0,0 +1,1177 @@
+import csv
+import json
+import os
+import random
+import tempfile
+from array import array
+from concurrent.futures import Future
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+from importlib.util import find_spec
+from io import StringIO
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from collegmatch import metrics
+
+from . import allotment_cache, jobs, verify
+from .algorithm import load_matching_input, run_gale_shapley
+from .benchmarks import MIN_REPEAT, compare, measure
+from .importer import Checkpoint, import_file
+from .kernel import UNMATCHED, Applicants, dereserve, gale_shapley, index_applicants, rematch
+from .models import (
+    Branch, CounsellingRound, MatchingJob, MatchingProfile, MatchingResult, PreferenceList, SeatChoice,
+    StudentProfile,
+)
+from .profiling import RunRecorder
+from .preferences import (
+    PACKED, ROWS, StaleOrder, append_branch, apply_moves, convert_storage, current_order, default_order,
+    iter_stored_heads, iter_stored_lists, order_token, pack, preference_list, prune_lists, save_order,
+    store_lists, stored_order, unpack,
+)
+from .rounds import current_round, plan_round, run_next_round
+from .search import filter_students
+from .verify import VerificationError, check_matching, verify_result
+
+
+def _csr(lists):
+    indptr, indices = array('q', [0]), array('l')
+    for ranked in lists:
+        indices.extend(ranked)
+        indptr.append(len(indices))
+    return indptr, indices
+
+
+def _naive_da(lists, air, seats):
+    # Textbook deferred acceptance: branch of every student, or None
+    nxt = [0] * len(lists)
+    held = [[] for _ in seats]
+    free = list(range(len(lists)))
+    while free:
+        i = free.pop()
+        if nxt[i] == len(lists[i]):
+            continue
+        j = lists[i][nxt[i]]
+        nxt[i] += 1
+        held[j].append(i)
+        held[j].sort(key=lambda s: (air[s], s))
+        if len(held[j]) > seats[j]:
+            free.append(held[j].pop())
+    branch = [None] * len(lists)
+    for j, holders in enumerate(held):
+        for i in holders:
+            branch[i] = j
+    return branch
+
+
+def _branches(indices, assignment):
+    return [None if p == UNMATCHED else indices[p] for p in assignment]
+
+
+def _instance(rng, n, m):
+    lists = [rng.sample(range(m), rng.randint(0, m)) for _ in range(n)]
+    air = [rng.randint(1, n) for _ in range(n)]
+    seats = [rng.randint(0, 4) for _ in range(m)]
+    return lists, air, seats
+
+
+class KernelTests(SimpleTestCase):
+    """gale_shapley(), rematch() and dereserve() on small instances."""
+
+    def test_gale_shapley_matches_naive(self):
+        rng = random.Random(1)
+        for _ in range(300):
+            lists, air, seats = _instance(rng, rng.randint(1, 30), rng.randint(1, 6))
+            indptr, indices = _csr(lists)
+            assignment = gale_shapley(indptr, indices, air, seats)
+            self.assertEqual(_branches(indices, assignment), _naive_da(lists, air, seats))
+
+    def test_rematch_matches_gale_shapley(self):
+        rng = random.Random(2)
+        for trial in range(300):
+            n, m = rng.randint(1, 30), rng.randint(1, 6)
+            lists, air, seats = _instance(rng, n, m)
+            indptr, indices = _csr(lists)
+            before = gale_shapley(indptr, indices, air, seats)
+
+            # Edit some students' lists and AIRs, and move seats both ways
+            dirty = set(rng.sample(range(n), rng.randint(0, n // 3)))
+            for i in dirty:
+                lists[i] = rng.sample(range(m), rng.randint(0, m))
+                air[i] = rng.randint(1, n)
+            new_seats = [max(0, k + rng.randint(-2, 2)) for k in seats]
+            new_indptr, new_indices = _csr(lists)
+
+            seed = array('q', [UNMATCHED]) * n
+            vacated = {j for j in range(m) if new_seats[j] > seats[j]}
+            for i, p in enumerate(before):
+                if p == UNMATCHED:
+                    continue
+                if i in dirty:
+                    vacated.add(indices[p])
+                else:
+                    seed[i] = new_indptr[i] + p - indptr[i]
+            index = index_applicants(new_indptr, new_indices, air, m) if trial % 2 else None
+            applicants = Applicants(new_indptr, new_indices, air, index=index)
+            warm = rematch(
+                new_indptr, new_indices, air, new_seats, seed, dirty, vacated, seats, applicants=applicants,
+            )
+            self.assertEqual(list(warm), list(gale_shapley(new_indptr, new_indices, air, new_seats)))
+
+    def test_rematch_with_homes_is_student_optimal(self):
+        # Each holds a home seat and wants the other's; a freed seat must
+        # go round to both rather than stop at the better student
+        lists = [[0, 1], [1, 0, 2]]
+        indptr, indices = _csr(lists)
+        air, seats, home = [2, 1], [1, 1, 1], array('l', [1, 2])
+        seed = array('q', [1, 4])
+        warm = rematch(indptr, indices, air, seats, seed, (), {0}, seats, home=home)
+        self.assertEqual(list(warm), list(gale_shapley(indptr, indices, air, seats, home=home)))
+        self.assertEqual(_branches(indices, warm), [0, 1])
+
+    def test_dereserve_reaches_a_fixed_point(self):
+        # Branch 0 de-reserves to 1, and 1 on to 2
+        lists = [[0], [1], [1], [2], [2], [2]]
+        indptr, indices = _csr(lists)
+        air, rules = list(range(1, 7)), [(0, 1), (1, 2)]
+
+        def resolve(seats, prev_seats, assignment, vacated):
+            return gale_shapley(indptr, indices, air, seats)
+
+        seats, assignment = dereserve(indices, [3, 1, 1], gale_shapley(indptr, indices, air, [3, 1, 1]), rules, resolve)
+        self.assertEqual(list(seats), [1, 2, 2])
+        self.assertEqual(_branches(indices, assignment), [0, 1, 1, 2, 2, None])
+        self.assertEqual(list(assignment), list(gale_shapley(indptr, indices, air, seats)))
+        # Nothing moves from a fixed point
+        again, _ = dereserve(indices, seats, assignment, rules, resolve)
+        self.assertEqual(list(again), list(seats))
+
+        def warm(seats, prev_seats, assignment, vacated):
+            return rematch(indptr, indices, air, seats, assignment, (), vacated, prev_seats)
+
+        seats, warm_assignment = dereserve(indices, [3, 1, 1], gale_shapley(indptr, indices, air, [3, 1, 1]), rules, warm)
+        self.assertEqual(list(warm_assignment), list(assignment))
+
+
+class CheckMatchingTests(SimpleTestCase):
+    """verify.check_matching() on hand-made assignments."""
+
+    def test_blocking_pair(self):
+        indptr, indices = _csr([[0], [0]])
+        found = check_matching(indptr, indices, [1, 2], [1], array('q', [UNMATCHED, 1]))
+        self.assertEqual(found['blocking_pairs'], [(0, 0)])
+        self.assertEqual(found['rotations'], [])
+
+    def test_exposed_rotation(self):
+        # Stable (both hold or outrank at the branch the other wants), but
+        # swapping seats makes both better off
+        indptr, indices = _csr([[0, 1], [1, 0, 2]])
+        home = array('l', [1, 2])
+        found = check_matching(indptr, indices, [2, 1], [1, 1, 1], array('q', [1, 3]), home=home)
+        self.assertEqual(found['blocking_pairs'], [])
+        self.assertEqual(len(found['rotations']), 1)
+        self.assertEqual(set(found['rotations'][0]), {0, 1})
+
+    def test_gale_shapley_passes(self):
+        rng = random.Random(3)
+        for _ in range(100):
+            lists, air, seats = _instance(rng, rng.randint(1, 30), rng.randint(1, 6))
+            indptr, indices = _csr(lists)
+            found = check_matching(indptr, indices, air, seats, gale_shapley(indptr, indices, air, seats))
+            self.assertFalse(any(found[kind] for kind in ('over_capacity', 'blocking_pairs', 'rotations')))
+
+
+class MatchingRunTests(TestCase):
+    """run_gale_shapley() against a textbook deferred acceptance."""
+
+    def test_matches_naive(self):
+        rng = random.Random(1)
+        for trial in range(10):
+            Branch.objects.all().delete()
+            User.objects.all().delete()
+            m, n = rng.randint(1, 5), rng.randint(1, 20)
+            branches = [
+                Branch.objects.create(college='IIT Test', branch=f'B{trial}-{j}', seats=rng.randint(0, 3))
+                for j in range(m)
+            ]
+            # Distinct ranks, and one student without a rank, who comes last
+            ranks = rng.sample(range(1, 100), n - 1) + [None]
+            lists, students = [], []
+            for i, rank in enumerate(ranks):
+                user = User.objects.create(username=f'student{trial}-{i}')
+                students.append(StudentProfile.objects.create(user=user, air_rank=rank))
+                ranked = rng.sample(range(m), rng.randint(0, m))
+                store_lists({students[-1].id: [branches[j].id for j in ranked]})
+                # No list means every branch, in default (college, branch) order
+                lists.append(ranked or list(range(m)))
+
+            result = run_gale_shapley()
+            air = [rank or 1000 for rank in ranks]
+            expected = _naive_da(lists, air, [b.seats for b in branches])
+            allotted = dict(result.allotments.values_list('student_id', 'branch_id'))
+            with self.subTest(trial=trial):
+                self.assertEqual(
+                    [allotted[s.id] for s in students],
+                    [None if j is None else branches[j].id for j in expected],
+                )
+                self.assertEqual(result.total_matched, sum(j is not None for j in expected))
+
+
+class IncrementalRunTests(TestCase):
+    """run_gale_shapley(incremental=True) against a full run."""
+
+    def setUp(self):
+        rng = self.rng = random.Random(4)
+        self.branches = [
+            Branch.objects.create(college='IIT Test', branch=f'B{j}', seats=rng.randint(1, 3)) for j in range(5)
+        ]
+        for i in range(30):
+            self.add_student(f'student{i}')
+
+    def add_student(self, username):
+        profile = StudentProfile.objects.create(
+            user=User.objects.create(username=username), air_rank=self.rng.randint(1, 500),
+        )
+        self.set_list(profile)
+        return profile
+
+    def set_list(self, profile):
+        store_lists({profile.id: [branch.id for branch in self.rng.sample(self.branches, self.rng.randint(0, 5))]})
+
+    def rows(self, result):
+        return list(
+            result.allotments.order_by('id').values_list('student_id', 'branch_id', 'preference_rank', 'is_matched')
+        )
+
+    def test_matches_full_run(self):
+        rng = self.rng
+        run_gale_shapley()
+        for step in range(4):
+            students = list(StudentProfile.objects.all())
+            for profile in rng.sample(students, 3):
+                profile.air_rank = rng.randint(1, 500)
+                profile.save()
+            self.set_list(rng.choice(students))
+            rng.choice(students).user.delete()
+            self.add_student(f'new{step}')
+            for branch in rng.sample(self.branches, 2):
+                branch.seats = max(0, branch.seats + rng.choice([-1, 1, 2]))
+                branch.save()
+
+            warm = run_gale_shapley(incremental=True)
+            full = run_gale_shapley()
+            with self.subTest(step=step):
+                self.assertEqual(self.rows(warm), self.rows(full))
+                self.assertEqual(warm.total_matched, full.total_matched)
+
+
+class CounsellingRoundTests(TestCase):
+    """Warm-started counselling rounds against a full run of the same plan."""
+
+    def test_warm_round_matches_full_run(self):
+        rng = random.Random(6)
+        branches = [
+            Branch.objects.create(college=f'IIT {j % 2}', branch=f'B{j}', seats=rng.randint(1, 3)) for j in range(6)
+        ]
+        students = []
+        for i in range(40):
+            profile = StudentProfile.objects.create(
+                user=User.objects.create(username=f'student{i}'), air_rank=rng.randint(1, 500),
+            )
+            store_lists({profile.id: [branch.id for branch in rng.sample(branches, rng.randint(1, 6))]})
+            students.append(profile)
+        run_next_round()
+
+        for step in range(4):
+            previous = current_round()
+            for sid in previous.result.allotments.filter(is_matched=True).values_list('student_id', flat=True):
+                choice = rng.choice([SeatChoice.FREEZE, SeatChoice.FLOAT, SeatChoice.SLIDE, SeatChoice.SLIDE, None])
+                if rng.random() < 0.1:
+                    choice = SeatChoice.WITHDRAW
+                if choice is not None:
+                    SeatChoice.objects.create(round=previous, student_id=sid, choice=choice)
+            for profile in rng.sample(students, 2):
+                profile.air_rank = rng.randint(1, 500)
+                profile.save()
+            for branch in rng.sample(branches, 2):
+                branch.seats = max(0, branch.seats + rng.choice([-1, 1, 2]))
+                branch.save()
+
+            data = load_matching_input()
+            plan = plan_round(data, previous)
+            full = gale_shapley(plan.indptr, plan.indices, data.air, plan.seats, home=plan.home)
+            expected = [
+                None if p == UNMATCHED else data.branch_ids[data.slot_branch[plan.indices[p]]] for p in full
+            ]
+            result = run_next_round().result
+            allotted = dict(result.allotments.values_list('student_id', 'branch_id'))
+            with self.subTest(step=step):
+                self.assertEqual([allotted[sid] for sid in data.student_ids], expected)
+
+
+class MatchingJobTests(TestCase):
+    """Background job bookkeeping; jobs are run inline rather than on the pool."""
+
+    def setUp(self):
+        branch = Branch.objects.create(college='IIT Test', branch='B', seats=1)
+        for i in range(3):
+            profile = StudentProfile.objects.create(user=User.objects.create(username=f'student{i}'), air_rank=i + 1)
+            store_lists({profile.id: [branch.id]})
+
+    def test_lifecycle(self):
+        job = jobs.submit_job(MatchingJob.FULL)
+        self.assertEqual(job.status, MatchingJob.QUEUED)
+        with self.assertRaises(jobs.JobAlreadyRunning) as raised:
+            jobs.submit_job(MatchingJob.FULL)
+        self.assertEqual(raised.exception.job, job)
+
+        jobs.run_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, MatchingJob.DONE)
+        self.assertIsNone(job.active)
+        self.assertEqual(job.result.total_matched, 1)
+        self.assertEqual(set(job.timings), {'load', 'compute', 'persist', 'verify', 'activate', 'cache'})
+        self.assertEqual(jobs.job_status(job)['result_id'], job.result_id)
+        # Finished, so the next job may start
+        self.assertNotEqual(jobs.submit_job(MatchingJob.INCREMENTAL).pk, job.pk)
+
+    def test_failed_run(self):
+        StudentProfile.objects.all().delete()
+        job = jobs.submit_job(MatchingJob.FULL)
+        jobs.run_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, MatchingJob.FAILED)
+        self.assertEqual(job.error, 'Add students and branches first.')
+        self.assertIsNone(job.active)
+
+    def test_stale_job_expires(self):
+        job = jobs.submit_job(MatchingJob.FULL)
+        stale = timezone.now() - timedelta(seconds=901)
+        MatchingJob.objects.filter(pk=job.pk).update(updated_at=stale)
+
+        # Still queued on this process's pool: never expired
+        jobs._futures[job.pk] = Future()
+        try:
+            with self.assertRaises(jobs.JobAlreadyRunning):
+                jobs.submit_job(MatchingJob.FULL)
+        finally:
+            jobs._futures.pop(job.pk)
+
+        # Its worker is gone: expired, and a new job takes its place
+        fresh = jobs.submit_job(MatchingJob.FULL)
+        job.refresh_from_db()
+        self.assertEqual(job.status, MatchingJob.FAILED)
+        self.assertIsNone(job.active)
+        self.assertTrue(job.error.startswith('Abandoned'))
+        self.assertEqual(jobs.active_job(), fresh)
+
+
+class BranchSummaryTests(TestCase):
+    """Cutoffs written with each result."""
+
+    def test_cutoffs(self):
+        a, b, c = (Branch.objects.create(college='IIT Test', branch=name, seats=seats)
+                   for name, seats in [('A', 2), ('B', 1), ('C', 1)])
+        for name, rank, ranked in [
+            ('s1', 3, [a, b]), ('s2', 5, [a]), ('s3', 9, [a, b]), ('s4', None, [b, a]), ('s5', None, [c]),
+        ]:
+            profile = StudentProfile.objects.create(user=User.objects.create(username=name), air_rank=rank)
+            store_lists({profile.id: [branch.id for branch in ranked]})
+
+        expected = [
+            (a.id, 2, 2, 3, 5, 1.0),
+            (b.id, 1, 1, 9, 9, 2.0),
+            # Unranked students fill seats but set no cutoff
+            (c.id, 1, 1, None, None, 1.0),
+        ]
+        fields = ('branch_id', 'seats', 'filled', 'opening_air', 'closing_air', 'mean_preference_rank')
+        result = run_gale_shapley()
+        self.assertEqual(list(result.branch_summaries.order_by('branch_id').values_list(*fields)), expected)
+
+        # A warm run copies allotments but still writes its own summaries
+        StudentProfile.objects.filter(user__username='s2').update(air_rank=10)
+        StudentProfile.objects.get(user__username='s2').save()
+        warm = run_gale_shapley(incremental=True)
+        # s3 takes s2's seat at A, and B goes to s4
+        expected[0] = (a.id, 2, 2, 3, 9, 1.0)
+        expected[1] = (b.id, 1, 1, None, None, 1.0)
+        self.assertEqual(list(warm.branch_summaries.order_by('branch_id').values_list(*fields)), expected)
+
+
+class AdminPreferencesTests(TestCase):
+    """The admin preferences list: constant queries per page, keyset pages."""
+
+    def setUp(self):
+        cache.clear()
+        rng = random.Random(11)
+        branches = [Branch.objects.create(college='IIT Test', branch=f'B{j}', seats=1) for j in range(8)]
+        # Repeated ranks and unranked students, so the order needs its id tie-break
+        for i, rank in enumerate([5, 2, None, 7, 2, 9, None, 1, 5, 3, 8, None]):
+            profile = StudentProfile.objects.create(user=User.objects.create(username=f'student{i}'), air_rank=rank)
+            store_lists({profile.id: [branch.id for branch in rng.sample(branches, rng.randint(0, 8))]})
+        self.client.force_login(User.objects.create(username='admin', is_staff=True))
+
+    def page(self, **params):
+        response = self.client.get(reverse('admin_preferences'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def test_query_count_is_independent_of_page_size(self):
+        self.page()  # caches the default order
+        counts = []
+        for size in (2, 8):
+            with override_settings(ADMIN_PREFERENCES_PAGE_SIZE=size), CaptureQueriesContext(connection) as queries:
+                self.assertEqual(len(self.page()['student_data']), size)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_top5_and_totals(self):
+        order = list(default_order())
+        for row in self.page()['student_data']:
+            stored = stored_order(row['profile'])
+            self.assertEqual(row['is_default'], not stored)
+            prefs = stored or order
+            self.assertEqual([(p.rank, p.branch_id) for p in row['top5']], list(enumerate(prefs[:5], start=1)))
+            self.assertEqual(row['total_prefs'], len(prefs))
+
+    @override_settings(ADMIN_PREFERENCES_PAGE_SIZE=5)
+    def test_keyset_pages(self):
+        expected = sorted(
+            StudentProfile.objects.values_list('air_rank', 'id'),
+            key=lambda row: (row[0] is None, row[0] or 0, row[1]),
+        )
+        expected = [pk for _, pk in expected]
+
+        pages, context = [], self.page()
+        while True:
+            pages.append([row['profile'].id for row in context['student_data']])
+            if not context['next_cursor']:
+                break
+            context = self.page(after=context['next_cursor'])
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+
+        # ...and back again from the last page
+        for page in reversed(pages[:-1]):
+            context = self.page(before=context['prev_cursor'])
+            self.assertEqual([row['profile'].id for row in context['student_data']], page)
+        self.assertIsNone(context['prev_cursor'])
+
+
+class SearchTests(TestCase):
+    """filter_students() on names, blanks and punctuation."""
+
+    def test_search(self):
+        user = User.objects.create(username='air001_ramesh', first_name='Ramesh', last_name='Kumar')
+        StudentProfile.objects.create(user=user, air_rank=1)
+        students = StudentProfile.objects.all()
+        self.assertEqual(filter_students(students, 'ram ku').count(), 1)
+        self.assertEqual(filter_students(students, '  ').count(), 1)
+        self.assertEqual(filter_students(students, '"*-').count(), 0)
+
+    def test_index_follows_edits(self):
+        user = User.objects.create(username='air002', first_name='Suresh', last_name='Rao')
+        StudentProfile.objects.create(user=user, air_rank=2)
+        students = StudentProfile.objects.all()
+        user.first_name = 'Mahesh'
+        user.save()
+        self.assertEqual(filter_students(students, 'mahesh').count(), 1)
+        self.assertEqual(filter_students(students, 'suresh').count(), 0)
+        user.delete()
+        self.assertEqual(filter_students(students, 'mahesh').count(), 0)
+
+
+class ResultPagesTests(TestCase):
+    """Per-branch result pages and result exports."""
+
+    def setUp(self):
+        rng = random.Random(13)
+        self.branches = [Branch.objects.create(college='IIT Test', branch=f'B{j}', seats=4) for j in range(3)]
+        for i, rank in enumerate(rng.sample(range(1, 100), 20)):
+            profile = StudentProfile.objects.create(user=User.objects.create(username=f'student{i}'), air_rank=rank)
+            store_lists({profile.id: [branch.id for branch in rng.sample(self.branches, rng.randint(1, 3))]})
+        self.result = run_gale_shapley()
+        self.client.force_login(User.objects.create(username='admin', is_staff=True))
+
+    def walk(self, url):
+        # Every page forwards, then backwards from the last one
+        pages, context = [], self.client.get(url).context
+        while True:
+            pages.append([a.id for a in context['allotments']])
+            if not context['next_cursor']:
+                break
+            context = self.client.get(url, {'after': context['next_cursor']}).context
+        for page in reversed(pages[:-1]):
+            context = self.client.get(url, {'before': context['prev_cursor']}).context
+            self.assertEqual([a.id for a in context['allotments']], page)
+        self.assertIsNone(context['prev_cursor'])
+        return sum(pages, [])
+
+    @override_settings(RESULTS_PAGE_SIZE=3)
+    def test_pages_in_merit_order(self):
+        for branch in self.branches:
+            allotments = self.result.allotments.filter(branch=branch)
+            merit = [a.id for a in sorted(allotments, key=lambda a: a.student.air_rank)]
+            self.assertEqual(self.walk(reverse('admin_result_branch', args=[branch.id])), merit)
+        unmatched = self.result.allotments.filter(is_matched=False).order_by('id')
+        self.assertEqual(self.walk(reverse('admin_result_unmatched')), [a.id for a in unmatched])
+
+    def test_query_counts(self):
+        url = reverse('admin_result_branch', args=[self.branches[0].id])
+        counts = []
+        for size in (1, 4):
+            with override_settings(RESULTS_PAGE_SIZE=size), CaptureQueriesContext(connection) as queries:
+                self.assertEqual(len(self.client.get(url).context['allotments']), size)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+        # The summary page reads cutoffs, not allotments
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(reverse('admin_results'))
+        for branch in self.branches:
+            branch.seats = 8
+            branch.save()
+        run_gale_shapley()
+        with CaptureQueriesContext(connection) as after:
+            self.client.get(reverse('admin_results'))
+        self.assertEqual(len(before), len(after))
+
+    def test_export(self):
+        response = self.client.get(reverse('admin_results_export'))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0][:2], ['student_id', 'username'])
+        airs = [int(row[4]) for row in rows[1:]]
+        self.assertEqual(len(airs), 20)
+        self.assertEqual(airs, sorted(airs))
+
+        response = self.client.get(reverse('admin_results_export'), {'format': 'jsonl', 'result': self.result.pk})
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(
+            {(line['student_id'], line['branch_id']) for line in lines},
+            set(self.result.allotments.values_list('student_id', 'branch_id')),
+        )
+        self.assertEqual(self.client.get(reverse('admin_results_export'), {'format': 'xml'}).status_code, 400)
+
+
+class AllotmentCacheTests(TestCase):
+    """The student allotment page cache follows the published result."""
+
+    def setUp(self):
+        allotment_cache._cache().clear()
+        self.a = Branch.objects.create(college='IIT Test', branch='A', seats=1)
+        self.b = Branch.objects.create(college='IIT Test', branch='B', seats=1)
+        for name, rank in [('s1', 1), ('s2', 2)]:
+            profile = StudentProfile.objects.create(user=User.objects.create(username=name), air_rank=rank)
+            store_lists({profile.id: [self.a.id, self.b.id]})
+        self.profile = profile
+
+    def page(self):
+        self.profile.refresh_from_db()
+        return allotment_cache.allotment_page(self.profile)
+
+    def test_follows_the_published_result(self):
+        first = run_gale_shapley()
+        allotment_cache.warm(first)
+        page = self.page()
+        self.assertEqual(page['result'], {'id': first.pk})
+        self.assertEqual(page['allotment']['branch']['id'], self.b.id)
+        with self.assertNumQueries(0):
+            allotment_cache.allotment_page(self.profile)
+
+        self.a.seats = 2
+        self.a.save()
+        second = run_gale_shapley()
+        # Until the new result is warmed, the published pointer still names the old one
+        self.assertEqual(self.page()['result'], {'id': first.pk})
+        allotment_cache.warm(second)
+        page = self.page()
+        self.assertEqual(page['result'], {'id': second.pk})
+        self.assertEqual(page['allotment']['branch']['id'], self.a.id)
+        self.assertEqual(page['top_prefs'][0]['closing_air'], 2)
+
+    def test_edits_after_publication(self):
+        allotment_cache.warm(run_gale_shapley())
+        store_lists({self.profile.id: [self.b.id]})
+        self.assertEqual([pref['branch']['id'] for pref in self.page()['top_prefs']], [self.b.id])
+
+        self.b.branch = 'B renamed'
+        self.b.save()
+        self.assertEqual(self.page()['top_prefs'][0]['branch']['branch'], 'B renamed')
+
+    def test_rounds_and_deleted_results(self):
+        result = run_gale_shapley()
+        allotment_cache.warm(result)
+        self.assertIsNone(self.page()['round'])
+        counselling_round = CounsellingRound.objects.create(number=1, result=result)
+        self.assertEqual(self.page()['round'], {'id': counselling_round.pk, 'number': 1})
+
+        result.delete()
+        page = self.page()
+        self.assertIsNone(page['result'])
+        self.assertIsNone(page['allotment'])
+        # The preference summary stays without a result
+        self.assertEqual([pref['rank'] for pref in page['top_prefs']], [1, 2])
+
+
+class PreferenceViewTests(TestCase):
+    """POST /student/preferences/ with well-formed and malformed bodies."""
+
+    def setUp(self):
+        self.branches = [
+            Branch.objects.create(college='IIT Test', branch=name, seats=2)
+            for name in ('CSE', 'EE', 'ME')
+        ]
+        user = User.objects.create(username='student')
+        self.profile = StudentProfile.objects.create(user=user, air_rank=10)
+        self.client.force_login(user)
+
+    def post(self, payload):
+        return self.client.post(
+            reverse('student_preferences'), data=json.dumps(payload), content_type='application/json',
+        )
+
+    def test_moves(self):
+        order = current_order(self.profile)
+        moved = order[2]
+        response = self.post({'moves': [[moved, 0]], 'base': order_token(order)})
+        self.assertEqual(response.status_code, 200)
+        self.profile.refresh_from_db()
+        self.assertEqual(stored_order(self.profile)[0], moved)
+
+    def test_malformed_bodies(self):
+        base = order_token(current_order(self.profile))
+        bid = self.branches[0].pk
+        for payload in (
+            {'moves': True, 'base': base},
+            {'moves': 5, 'base': base},
+            {'moves': [5], 'base': base},
+            {'moves': [[bid]], 'base': base},
+            {'moves': [[bid, 0, 1]], 'base': base},
+            {'moves': [[str(bid), 0]], 'base': base},
+            {'moves': [[bid, True]], 'base': base},
+            {'ordered_ids': 5},
+            {'ordered_ids': {'a': 1}},
+            [1, 2],
+        ):
+            with self.subTest(payload=payload):
+                response = self.post(payload)
+                self.assertEqual(response.status_code, 400)
+                self.assertIs(response.json()['success'], False)
+        self.assertFalse(StudentProfile.objects.get(pk=self.profile.pk).has_submitted)
+
+
+class PreferenceMoveTests(TestCase):
+    """apply_moves() and save_order() against a changed order."""
+
+    def test_apply_moves(self):
+        self.assertEqual(apply_moves([1, 2, 3], [[3, 0], [1, 2]]), [3, 2, 1])
+        for moves in ([[4, 0]], [[1, 3]], [[1, -1]], [['x', 0]], [[1]]):
+            with self.subTest(moves=moves):
+                with self.assertRaises(ValueError):
+                    apply_moves([1, 2, 3], moves)
+
+    def test_stale_order(self):
+        for name in ('CSE', 'EE'):
+            Branch.objects.create(college='IIT Test', branch=name, seats=1)
+        user = User.objects.create(username='student')
+        profile = StudentProfile.objects.create(user=user, air_rank=1)
+        order = current_order(profile)
+        stale = order_token(order[::-1])
+        with self.assertRaises(StaleOrder):
+            save_order(profile, None, base_token=stale, moves=[[order[1], 0]])
+        save_order(profile, None, base_token=order_token(order), moves=[[order[1], 0]])
+        self.assertEqual(stored_order(profile), order[::-1])
+
+    @override_settings(PREFERENCE_STORAGE='rows')
+    def test_diff_save(self):
+        branches = [Branch.objects.create(college='IIT Test', branch=f'B{j}', seats=1) for j in range(6)]
+        user = User.objects.create(username='student')
+        profile = StudentProfile.objects.create(user=user, air_rank=1)
+        ids = [branch.id for branch in branches]
+        save_order(profile, ids)
+        kept = dict(profile.preferences.values_list('branch_id', 'id'))
+
+        # Swapping two branches rewrites their rows only
+        ids[1], ids[4] = ids[4], ids[1]
+        written, _ = save_order(profile, ids)
+        self.assertEqual(written, 4)
+        self.assertEqual(stored_order(profile), ids)
+        rows = dict(profile.preferences.values_list('branch_id', 'id'))
+        for bid in (ids[0], ids[2], ids[3], ids[5]):
+            self.assertEqual(rows[bid], kept[bid])
+
+
+class AppendBranchTests(TestCase):
+    """append_branch() over row storage, in chunks of students."""
+
+    @override_settings(PREFERENCE_STORAGE='rows')
+    def test_append(self):
+        old = [Branch.objects.create(college='IIT Test', branch=f'B{j}', seats=1) for j in range(3)]
+        profiles = []
+        for i in range(5):
+            user = User.objects.create(username=f'student{i}')
+            profiles.append(StudentProfile.objects.create(user=user, air_rank=i + 1))
+        new = Branch.objects.create(college='IIT Test', branch='NEW', seats=1)
+        save_order(profiles[0], [b.id for b in old])
+        save_order(profiles[1], [old[1].id])
+        save_order(profiles[2], [new.id, old[0].id])
+
+        reports = []
+        added = append_branch(new, progress=lambda *args: reports.append(args), chunk_size=2)
+        self.assertEqual(added, 2)
+        self.assertEqual(reports[0], ('append', 0, 5))
+        self.assertEqual(reports[-1], ('append', 5, 5))
+        self.assertEqual(stored_order(profiles[0]), [b.id for b in old] + [new.id])
+        self.assertEqual(stored_order(profiles[1]), [old[1].id, new.id])
+        self.assertEqual(stored_order(profiles[2]), [new.id, old[0].id])
+        self.assertEqual(stored_order(profiles[3]), [])
+        self.assertEqual(preference_list(profiles[3]), [b.id for b in old] + [new.id])
+
+        # Repeating an interrupted run adds nothing twice
+        self.assertEqual(append_branch(new, chunk_size=2), 0)
+
+
+class DefaultOrderTests(TestCase):
+    """Students who never submitted follow the cached default order."""
+
+    def setUp(self):
+        cache.clear()
+        self.branches = [
+            Branch.objects.create(college=college, branch=name, seats=1)
+            for college, name in (('NIT Z', 'CSE'), ('IIT A', 'ME'), ('IIT A', 'CSE'))
+        ]
+        self.default = [self.branches[2].id, self.branches[1].id, self.branches[0].id]
+        user = User.objects.create(username='student')
+        self.profile = StudentProfile.objects.create(user=user, air_rank=1)
+
+    def test_derived_list(self):
+        self.assertEqual(list(default_order()), self.default)
+        self.assertEqual(stored_order(self.profile), [])
+        self.assertEqual(preference_list(self.profile), self.default)
+        self.assertEqual(current_order(self.profile), self.default)
+
+        result = run_gale_shapley()
+        self.assertEqual(result.allotments.get().branch_id, self.default[0])
+
+        # A new branch joins every default list without touching stored ones
+        save_order(self.profile, self.default[:1])
+        other = StudentProfile.objects.create(user=User.objects.create(username='other'), air_rank=2)
+        added = Branch.objects.create(college='IIT A', branch='EE', seats=1)
+        self.assertEqual(append_branch(added), 1)
+        self.assertEqual(stored_order(other), [])
+        self.assertEqual(preference_list(other), self.default[:1] + [added.id] + self.default[1:])
+        self.profile.refresh_from_db()
+        self.assertEqual(stored_order(self.profile), [self.default[0], added.id])
+
+    @override_settings(BRANCH_IDS_CACHE_TTL=60)
+    def test_cache(self):
+        self.assertEqual(list(default_order()), self.default)
+        with self.assertNumQueries(0):
+            self.assertEqual(list(default_order()), self.default)
+
+        # Writes bypassing the signals are only seen on refresh ...
+        Branch.objects.filter(pk=self.branches[0].pk).update(college='IIT 0')
+        self.assertEqual(list(default_order()), self.default)
+        refreshed = [self.branches[0].id] + self.default[:2]
+        self.assertEqual(list(default_order(refresh=True)), refreshed)
+
+        # ... while saving or deleting a branch drops the cached order
+        self.branches[1].delete()
+        self.assertEqual(list(default_order()), [self.branches[0].id, self.branches[2].id])
+
+
+class PackedStorageTests(TestCase):
+    """Packed preference lists through the preferences accessors."""
+
+    def setUp(self):
+        cache.clear()
+        self.branches = [Branch.objects.create(college='IIT Test', branch=f'B{j}', seats=1) for j in range(6)]
+        self.ids = [branch.id for branch in self.branches]
+        self.profiles = [
+            StudentProfile.objects.create(user=User.objects.create(username=f'student{i}'), air_rank=i + 1)
+            for i in range(4)
+        ]
+
+    def profile(self, i):
+        return StudentProfile.objects.get(pk=self.profiles[i].pk)
+
+    def test_round_trip(self):
+        ids = [3, 1, 2 ** 31 - 1, 0]
+        self.assertEqual(len(pack(ids)), 16)
+        self.assertEqual(pack(ids)[:4], b'\x03\x00\x00\x00')
+        self.assertEqual(list(unpack(pack(ids))), ids)
+
+        lists = {self.profiles[0].id: self.ids[::-1], self.profiles[2].id: self.ids[2:4], self.profiles[3].id: []}
+        store_lists(lists)
+        self.assertEqual(stored_order(self.profile(0)), self.ids[::-1])
+        self.assertEqual(stored_order(self.profile(1)), [])
+        self.assertEqual(stored_order(self.profile(3)), [])
+        self.assertEqual(
+            [(sid, list(ids)) for sid, _, ids in iter_stored_lists(chunk_size=1)],
+            [(self.profiles[0].id, self.ids[::-1]), (self.profiles[2].id, self.ids[2:4])],
+        )
+        self.assertEqual(
+            list(iter_stored_heads([p.id for p in self.profiles], 3)),
+            [(self.profiles[0].id, self.ids[:2:-1], 6), (self.profiles[2].id, self.ids[2:4], 2)],
+        )
+
+        # Deleted branches drop out of stored_order
+        self.branches[3].delete()
+        self.assertEqual(stored_order(self.profile(2)), self.ids[2:3])
+
+    def test_save_and_append(self):
+        profile = self.profile(0)
+        self.assertEqual(save_order(profile, self.ids[:3])[0], 3)
+        self.assertEqual(save_order(profile, self.ids[:3])[0], 0)
+        self.assertEqual(save_order(profile, [self.ids[1], self.ids[0], self.ids[2]])[0], 2)
+        save_order(self.profile(1), self.ids[:2] + self.ids[5:])
+
+        stamps = dict(StudentProfile.objects.values_list('id', 'updated_at'))
+        reports = []
+        added = append_branch(self.branches[5], progress=lambda *args: reports.append(args), chunk_size=1)
+        self.assertEqual(added, 1)
+        self.assertEqual(reports, [('append', 0, 2), ('append', 1, 2), ('append', 2, 2)])
+        self.assertEqual(stored_order(self.profile(0)), [self.ids[1], self.ids[0], self.ids[2], self.ids[5]])
+        self.assertEqual(stored_order(self.profile(1)), self.ids[:2] + self.ids[5:])
+        self.assertEqual(stored_order(self.profile(2)), [])
+        # Only the extended list counts as edited, for the allotment page cache
+        self.assertGreater(self.profile(0).updated_at, stamps[self.profiles[0].id])
+        self.assertEqual(self.profile(1).updated_at, stamps[self.profiles[1].id])
+
+    def test_convert(self):
+        lists = {self.profiles[0].id: self.ids[::-1], self.profiles[2].id: self.ids[2:4]}
+        store_lists(lists)
+        self.assertEqual(convert_storage(ROWS), 2)
+        with override_settings(PREFERENCE_STORAGE=ROWS):
+            self.assertEqual({sid: list(ids) for sid, _, ids in iter_stored_lists()}, lists)
+            self.assertEqual(convert_storage(PACKED), 2)
+        self.assertEqual({sid: list(ids) for sid, _, ids in iter_stored_lists()}, lists)
+
+
+class SharedListTests(TestCase):
+    """Packed lists are interned, shared between students and pruned."""
+
+    def setUp(self):
+        cache.clear()
+        self.ids = [Branch.objects.create(college='IIT Test', branch=f'B{j}', seats=1).id for j in range(4)]
+        self.profiles = [
+            StudentProfile.objects.create(user=User.objects.create(username=f'student{i}'), air_rank=i + 1)
+            for i in range(3)
+        ]
+
+    def profile(self, i):
+        return StudentProfile.objects.get(pk=self.profiles[i].pk)
+
+    def test_interning(self):
+        store_lists({self.profiles[0].id: self.ids[:2], self.profiles[1].id: self.ids[:2]})
+        save_order(self.profile(2), self.ids[:2])
+        self.assertEqual(PreferenceList.objects.count(), 1)
+        self.assertEqual(len({self.profile(i).preference_list_id for i in range(3)}), 1)
+
+        # Moving away from a shared list keeps it for the others ...
+        save_order(self.profile(2), self.ids[::-1])
+        self.assertEqual(PreferenceList.objects.count(), 2)
+        # ... and the last student to leave a list deletes it in the same save
+        save_order(self.profile(2), self.ids[1:])
+        self.assertEqual(
+            set(PreferenceList.objects.values_list('id', flat=True)),
+            {self.profile(0).preference_list_id, self.profile(2).preference_list_id},
+        )
+        self.assertEqual(stored_order(self.profile(2)), self.ids[1:])
+
+    def test_append_and_prune(self):
+        store_lists({
+            self.profiles[0].id: self.ids[:2], self.profiles[1].id: self.ids[:2], self.profiles[2].id: self.ids[1:],
+        })
+        added = Branch.objects.create(college='IIT Test', branch='NEW', seats=1)
+        self.assertEqual(append_branch(added), 3)
+        self.assertEqual(stored_order(self.profile(0)), self.ids[:2] + [added.id])
+        self.assertEqual(self.profile(0).preference_list_id, self.profile(1).preference_list_id)
+        # The lists from before the branch was added are pruned straight away
+        self.assertEqual(PreferenceList.objects.count(), 2)
+
+        store_lists({self.profiles[2].id: self.ids[:1]})
+        self.assertEqual(PreferenceList.objects.count(), 3)
+        self.assertEqual(prune_lists(), 1)
+        self.assertEqual(prune_lists(), 0)
+        self.assertEqual(stored_order(self.profile(2)), self.ids[:1])
+
+
+class ImportCheckpointTests(TestCase):
+    """import_file() resumes after the last committed batch."""
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+
+    def write(self, name, text):
+        path = os.path.join(self.folder.name, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_resume(self):
+        path = self.write('students.jsonl', ''.join(
+            json.dumps({'username': f'student{k}', 'air_rank': k + 1}) + '\n' for k in range(5)
+        ))
+        checkpoint_path = os.path.join(self.folder.name, 'checkpoint.json')
+
+        class Interrupted(Exception):
+            pass
+
+        def crash(kind, done):
+            if done == 2:
+                raise Interrupted()
+
+        with self.assertRaises(Interrupted):
+            import_file('students', path, checkpoint=Checkpoint(checkpoint_path), batch_size=2, progress=crash)
+        self.assertEqual(StudentProfile.objects.count(), 2)
+
+        done = import_file('students', path, checkpoint=Checkpoint(checkpoint_path), batch_size=2)
+        self.assertEqual(done, 3)
+        self.assertEqual(sorted(StudentProfile.objects.values_list('air_rank', flat=True)), [1, 2, 3, 4, 5])
+
+    def test_csv_preferences(self):
+        import_file('branches', self.write('branches.csv', 'college,branch,seats\nIIT A,CSE,2\nIIT A,EE,1\nIIT B,ME,1\n'))
+        import_file('students', self.write('students.csv', 'username,air_rank\ns1,1\ns2,2\n'))
+        # Each student's rows are next to each other, in any rank order
+        path = self.write(
+            'preferences.csv',
+            'username,rank,college,branch\ns1,2,IIT A,EE\ns1,1,IIT B,ME\ns2,1,IIT A,CSE\n',
+        )
+        self.assertEqual(import_file('preferences', path, batch_size=1), 2)
+
+        branch = dict(Branch.objects.values_list('branch', 'id'))
+        s1 = StudentProfile.objects.get(user__username='s1')
+        self.assertTrue(s1.has_submitted)
+        self.assertEqual(stored_order(s1), [branch['ME'], branch['EE']])
+        self.assertEqual(stored_order(StudentProfile.objects.get(user__username='s2')), [branch['CSE']])
+
+        # Importing a record again updates it
+        import_file('branches', self.write('more.csv', 'college,branch,seats\nIIT A,CSE,4\n'))
+        self.assertEqual(Branch.objects.count(), 3)
+        self.assertEqual(Branch.objects.get(branch='CSE').seats, 4)
+
+
+@skipUnless(find_spec('numpy'), 'needs NumPy (requirements-dev.txt)')
+class SyntheticDataTests(SimpleTestCase):
+    """The synthetic data generator is a pure function of its seed."""
+
+    def generate(self, seed):
+        from .synthetic import SyntheticData
+        data = SyntheticData(300, 40, seed=seed)
+        return data.branch_records(), list(data.student_records()), list(data.preference_records())
+
+    def test_seed(self):
+        branches, students, lists = self.generate(7)
+        self.assertEqual((branches, students, lists), self.generate(7))
+        self.assertNotEqual(lists, self.generate(8)[2])
+
+        self.assertEqual(len(branches), 40)
+        self.assertEqual(sorted(s['air_rank'] for s in students), list(range(1, 301)))
+        keys = {(b['college'], b['branch']) for b in branches}
+        for record in lists:
+            self.assertTrue(record['preferences'])
+            self.assertTrue(keys.issuperset(record['preferences']))
+            self.assertEqual(len(set(record['preferences'])), len(record['preferences']))
+
+
+class BenchmarkCompareTests(SimpleTestCase):
+    """compare() flags timings only beyond tolerance and measured noise."""
+
+    def result(self, fastest, spread=0.0, repeat=MIN_REPEAT, peak_kb=1000, queries=10, phases=None):
+        result = {
+            'wall': fastest + spread / 2, 'min': fastest, 'spread': spread, 'repeat': repeat,
+            'peak_kb': peak_kb, 'queries': queries,
+        }
+        if phases:
+            result['phase_min'] = {phase: seconds for phase, (seconds, _) in phases.items()}
+            result['phase_spread'] = {phase: noise for phase, (_, noise) in phases.items()}
+        return result
+
+    def regressions(self, before, after):
+        return [(metric, old, new) for _, metric, old, new in compare({'b': before}, {'b': after}, tolerance=0.1)]
+
+    def test_noise_threshold(self):
+        # 20% slower, but within the spread either run saw between repeats
+        self.assertEqual(self.regressions(self.result(1.0, spread=0.05), self.result(1.2, spread=0.3)), [])
+        self.assertEqual(self.regressions(self.result(1.0, spread=0.3), self.result(1.2)), [])
+        # Beyond both the tolerance and the spread
+        self.assertEqual(self.regressions(self.result(1.0, spread=0.05), self.result(1.2, spread=0.1)), [
+            ('wall', 1.0, 1.2),
+        ])
+        # Within the tolerance, or a few milliseconds
+        self.assertEqual(self.regressions(self.result(1.0), self.result(1.09)), [])
+        self.assertEqual(self.regressions(self.result(0.01), self.result(0.013)), [])
+
+    def test_phases_and_repeats(self):
+        before = self.result(1.0, phases={'load': (0.2, 0.01), 'compute': (0.5, 0.01)})
+        after = self.result(1.0, phases={'load': (0.2, 0.01), 'compute': (0.7, 0.01)})
+        self.assertEqual(self.regressions(before, after), [('wall[compute]', 0.5, 0.7)])
+
+        # Too few repeats on either side: timings are not compared, the rest still is
+        before = self.result(1.0, repeat=MIN_REPEAT - 1)
+        after = self.result(2.0, peak_kb=2000, queries=11)
+        self.assertEqual(self.regressions(before, after), [('peak_kb', 1000, 2000), ('queries', 10, 11)])
+        self.assertEqual(compare({}, {'b': after}), [])
+
+    def test_measure(self):
+        calls = []
+        result = measure(lambda: calls.append(1) or {'a': 0.0}, repeat=3, setup=lambda: calls.append(0))
+        self.assertEqual(calls, [0, 1] * 4)
+        self.assertEqual(result['repeat'], 3)
+        self.assertEqual(result['queries'], 0)
+        self.assertEqual(set(result['phase_min']), {'a'})
+        self.assertGreaterEqual(result['spread'], 0)
+
+
+class MetricsTests(TestCase):
+    """Request metrics recorded by the middleware and served at /metrics."""
+
+    def setUp(self):
+        branch = Branch.objects.create(college='IIT Test', branch='B', seats=2)
+        for i in range(3):
+            profile = StudentProfile.objects.create(user=User.objects.create(username=f'student{i}'), air_rank=i + 1)
+            store_lists({profile.id: [branch.id]})
+        run_gale_shapley()
+        self.admin = User.objects.create(username='admin', is_staff=True)
+
+    def series(self, histogram, view):
+        # (observations, sum) recorded for GET requests to `view`
+        _, total, count = histogram.values.get((('method', 'GET'), ('view', view)), (None, 0, 0))
+        return count, total
+
+    def test_metrics_view(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 302)
+        self.client.force_login(self.admin)
+        count, _ = self.series(metrics.REQUEST_DURATION, 'admin_results')
+        self.assertEqual(self.client.get(reverse('admin_results')).status_code, 200)
+        self.assertEqual(self.series(metrics.REQUEST_DURATION, 'admin_results')[0], count + 1)
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('# TYPE collegmatch_request_duration_seconds histogram', text)
+        self.assertIn('# TYPE collegmatch_matching_runs_total counter', text)
+        self.assertIn(f'collegmatch_request_queries_count{{method="GET",view="admin_results"}} {count + 1}', text)
+        self.assertIn('collegmatch_request_queries_bucket{method="GET",view="admin_results",le="+Inf"}', text)
+
+    def test_streaming_response(self):
+        self.client.force_login(self.admin)
+        count, queries = self.series(metrics.REQUEST_QUERIES, 'admin_results_export')
+        response = self.client.get(reverse('admin_results_export'))
+        # Recorded only once the body has been sent ...
+        self.assertEqual(self.series(metrics.REQUEST_QUERIES, 'admin_results_export'), (count, queries))
+        with CaptureQueriesContext(connection) as streamed:
+            body = b''.join(response.streaming_content)
+        response.close()
+        self.assertEqual(len(body.splitlines()), 4)
+        self.assertTrue(streamed.captured_queries)
+        # ... counting the queries run while producing it
+        after = self.series(metrics.REQUEST_QUERIES, 'admin_results_export')
+        self.assertEqual(after[0], count + 1)
+        self.assertGreaterEqual(after[1] - queries, len(streamed) + 1)
+
+
+class RunRecorderTests(TestCase):
+    """Phase timings and kernel counters stored with each run."""
+
+    def test_phases(self):
+        calls = []
+        recorder = RunRecorder(lambda *args: calls.append(args), trace_memory=True, profile=False)
+        for call in [('load',), ('compute',), ('persist', 0, 2), ('persist', 2, 2), ('activate',)]:
+            recorder(*call)
+        recorder.kernel['proposals'] = 7
+        recorder.finish()
+        self.assertEqual(
+            calls, [('load', 0, 0), ('compute', 0, 0), ('persist', 0, 2), ('persist', 2, 2), ('activate', 0, 0)],
+        )
+        self.assertEqual(list(recorder.phases), ['load', 'compute', 'persist', 'activate'])
+        for entry in recorder.phases.values():
+            self.assertGreaterEqual(entry['seconds'], 0)
+            self.assertIn('python_peak_kb', entry)
+        self.assertGreaterEqual(recorder.seconds, sum(entry['seconds'] for entry in recorder.phases.values()))
+
+        data = SimpleNamespace(num_students=3, num_branches=2, num_slots=2, indices=[0, 1, 1])
+        stats = recorder.stats(data, round=2)
+        self.assertEqual(
+            (stats['students'], stats['entries'], stats['proposals'], stats['round']), (3, 3, 7, 2),
+        )
+
+    def test_run_stats(self):
+        branches = [Branch.objects.create(college='IIT Test', branch=f'B{j}', seats=1) for j in range(2)]
+        for i in range(4):
+            profile = StudentProfile.objects.create(user=User.objects.create(username=f'student{i}'), air_rank=i + 1)
+            store_lists({profile.id: [branches[0].id, branches[1].id]})
+
+        result = run_gale_shapley(profile=True)
+        stats = result.stats
+        self.assertEqual(list(stats['phases']), ['load', 'compute', 'persist', 'verify', 'activate'])
+        self.assertEqual((stats['students'], stats['branches'], stats['warm_start']), (4, 2, False))
+        # B0 turns down students 2-4 and B1 students 3 and 4
+        self.assertEqual((stats['proposals'], stats['rejections']), (7, 5))
+        self.assertTrue(MatchingProfile.objects.filter(result=result).exists())
+
+        warm = run_gale_shapley(incremental=True)
+        self.assertIs(warm.stats['warm_start'], True)
+        self.assertFalse(MatchingProfile.objects.filter(result=warm).exists())
+
+        self.client.force_login(User.objects.create(username='admin', is_staff=True))
+        rows = self.client.get(reverse('admin_results_stats')).json()
+        self.assertEqual([row['id'] for row in rows], [warm.pk, result.pk])
+        self.assertEqual([row['has_profile'] for row in rows], [False, True])
+
+
+class VerifyRunTests(TestCase):
+    """Results checked before they go live, and by verify_matching."""
+
+    def setUp(self):
+        branches = [Branch.objects.create(college='IIT Test', branch=f'B{j}', seats=1) for j in range(2)]
+        self.students = []
+        for i in range(3):
+            profile = StudentProfile.objects.create(user=User.objects.create(username=f'student{i}'), air_rank=i + 1)
+            store_lists({profile.id: [branches[0].id, branches[1].id]})
+            self.students.append(profile)
+
+    def test_verified_run(self):
+        result = run_gale_shapley()
+        verification = result.stats['verification']
+        self.assertTrue(verification['ok'])
+        self.assertEqual((verification['checked'], verification['blocking_pairs']), (3, 0))
+        call_command('verify_matching', '--resolve', stdout=StringIO())
+
+    def test_failed_run_rolled_back(self):
+        first = run_gale_shapley()
+        check = verify.check_matching
+
+        def blocked(*args, **kwargs):
+            found = check(*args, **kwargs)
+            found['blocking_pairs'] = [(0, 0)]
+            return found
+
+        with mock.patch.object(verify, 'check_matching', blocked):
+            with self.assertRaises(VerificationError) as caught:
+                run_gale_shapley()
+        self.assertEqual(caught.exception.report['blocking_pairs'], 1)
+        self.assertEqual(list(MatchingResult.objects.values_list('pk', 'is_active')), [(first.pk, True)])
+
+    def test_tampered_result(self):
+        result = run_gale_shapley()
+        result.allotments.filter(student=self.students[0]).delete()
+        report = verify_result(result)
+        self.assertFalse(report['ok'])
+        self.assertEqual(report['missing_students'], 1)
+        with self.assertRaises(CommandError):
+            call_command('verify_matching', stdout=StringIO())
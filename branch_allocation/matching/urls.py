@@ -12,7 +12,14 @@ urlpatterns = [
     path('admin-portal/student-ranks/', views.admin_student_ranks, name='admin_student_ranks'),
     path('admin-portal/preferences/', views.admin_preferences, name='admin_preferences'),
     path('admin-portal/preferences/<int:student_id>/', views.admin_student_detail, name='admin_student_detail'),
+    path('admin-portal/students/search/', views.admin_student_search, name='admin_student_search'),
     path('admin-portal/results/', views.admin_results, name='admin_results'),
+    path('admin-portal/results/branch/<int:branch_id>/', views.admin_result_branch, name='admin_result_branch'),
+    path('admin-portal/results/unmatched/', views.admin_result_branch, name='admin_result_unmatched'),
+    path('admin-portal/results/export/', views.admin_results_export, name='admin_results_export'),
+    path('admin-portal/results/stats/', views.admin_results_stats, name='admin_results_stats'),
+    path('admin-portal/results/<int:result_id>/profile/', views.admin_results_profile, name='admin_results_profile'),
+    path('admin-portal/jobs/<int:job_id>/', views.admin_job_status, name='admin_job_status'),
 
     # Student
     path('student/preferences/', views.student_preferences, name='student_preferences'),
@@ -0,0 +1,373 @@
+"""
+Stability and optimality checks of a stored MatchingResult.
+
+verify_result() maps the result's allotments back onto the kernel input
+the run saw (for a later counselling round, the round's RoundPlan) and
+checks:
+
+- seat caps: no slot holds more students than its seats after
+  de-reservation, and the result's totals, seat_snapshot and
+  BranchSummary rows agree with its allotments
+- every student has exactly one allotment row, every seat is an entry
+  of the student's list, and nobody lost a seat retained from the
+  previous round
+- stability: no blocking pair, i.e. no student who prefers a slot that
+  has a free seat or whose closing (weakest) holder ranks below them
+- student optimality: no exposed rotation. For each full slot take the
+  best-ranked student below its closing rank who prefers it; following
+  slot → that student's slot round a cycle would let everyone on it move
+  up to another stable matching. Every stable matching but the
+  student-optimal one exposes such a cycle.
+
+Closing ranks are worked out once per slot, so each student costs one
+comparison per entry ahead of their seat (the entries a run proposed to
+and was turned down on): O(total preference entries) overall, in plain
+Python over the same arrays as the kernel.
+
+With resolve=True the kernel also re-runs on the same input and the
+allotments must equal its output exactly.
+
+Run without the run's MatchingInput, the check loads today's input.
+Students saved since the run's snapshot are left out of the checks as
+proposers (their seats still count), which also rules out the rotation
+check; a catalog change makes the check impossible.
+
+verify_run() does this for every run before its result goes live
+(MATCHING_VERIFY).
+"""
+import logging
+from array import array
+from time import perf_counter
+
+from django.conf import settings
+
+from .algorithm import load_matching_input, no_progress, _summarize
+from .kernel import UNMATCHED, gale_shapley, _priority
+from .models import BranchSummary, CounsellingRound, StudentProfile
+
+logger = logging.getLogger(__name__)
+
+# Examples kept in a report per kind of problem
+MAX_EXAMPLES = 5
+# (report key, one, many) of each kind of problem
+PROBLEMS = [
+    ('over_capacity', 'slot over capacity', 'slots over capacity'),
+    ('summary_mismatches', 'summary mismatch', 'summary mismatches'),
+    ('missing_students', 'student without an allotment', 'students without an allotment'),
+    ('duplicate_allotments', 'duplicate allotment', 'duplicate allotments'),
+    ('off_list', 'seat off the student\'s list', 'seats off the students\' lists'),
+    ('lost_guarantees', 'retained seat lost', 'retained seats lost'),
+    ('blocking_pairs', 'blocking pair', 'blocking pairs'),
+    ('rotations', 'exposed rotation', 'exposed rotations'),
+    ('differs_from_rerun', 'student placed unlike a re-run', 'students placed unlike a re-run'),
+]
+
+
+class VerificationError(Exception):
+    """A matching result failed verify_result()."""
+
+    def __init__(self, result, report):
+        self.result = result
+        self.report = report
+        super().__init__(f"Matching result #{result.pk} failed verification: {describe(report)}.")
+
+
+def describe(report):
+    """One line naming what a report found wrong."""
+    found = []
+    for kind, one, many in PROBLEMS:
+        count = report.get(kind) or 0
+        if count:
+            found.append(f"{count} {one if count == 1 else many}")
+    return ', '.join(found) or 'no problems'
+
+
+# ─────────────────────────────────────────────────────────────
+# Checks on kernel arrays
+# ─────────────────────────────────────────────────────────────
+
+def check_matching(indptr, indices, air, seats, assignment, home=None, skip=None, taken=None):
+    """
+    Check a kernel `assignment` against its input (laid out as in
+    kernel.py, `home` as in gale_shapley()). Students with skip[i] set are
+    not checked as proposers; taken[j] counts seats of slot j held by
+    students not in `assignment`. Rotations are only looked for when
+    nobody is skipped and there is no blocking pair. Returns {'entries': entries compared,
+    'over_capacity', 'lost_guarantees', 'blocking_pairs', 'rotations':
+    lists of (student or slot, ...) tuples}.
+    """
+    n, m = len(indptr) - 1, len(seats)
+    key = _priority(air)
+    shift = (max(key) // n + 1) * n if home is not None and n else 0
+
+    # Holders and the closing (largest) key of every slot
+    filled = list(taken) if taken is not None else [0] * m
+    closing = [-1 - shift] * m
+    for i, p in enumerate(assignment):
+        if p == UNMATCHED:
+            continue
+        j = indices[p]
+        filled[j] += 1
+        # A skipped holder's rank may have changed since the run
+        if skip is None or not skip[i]:
+            k = key[i] - shift if shift and home[i] == j else key[i]
+            if k > closing[j]:
+                closing[j] = k
+
+    over = [(j, filled[j], seats[j]) for j in range(m) if filled[j] > seats[j]]
+    lost = []
+    if home is not None:
+        lost = [(i, home[i]) for i in range(n) if home[i] >= 0 and assignment[i] == UNMATCHED]
+
+    # A student blocks with a slot they prefer if their key is below its
+    # limit: the closing key of a full slot, above every key while a seat is free
+    unbounded = n * (max(key) // n + 2) if n else 1
+    limit = [closing[j] if filled[j] >= seats[j] else unbounded for j in range(m)]
+
+    blocking = []
+    # Per slot: the best-ranked student who prefers it but ranks below its closing holder
+    rival = [-1] * m
+    rival_key = [unbounded] * m
+    entries = 0
+    for i in range(n):
+        if skip is not None and skip[i]:
+            continue
+        p = assignment[i]
+        start, end = indptr[i], indptr[i + 1] if p == UNMATCHED else p
+        entries += end - start
+        ki = key[i]
+        h = home[i] if shift else -1
+        for j in indices[start:end]:
+            k = ki - shift if j == h else ki
+            if k < limit[j]:
+                blocking.append((i, j))
+            elif k < rival_key[j]:
+                rival[j], rival_key[j] = i, k
+
+    rotations = []
+    if not blocking and (skip is None or not any(skip)):
+        # Slot → slot of its rival; unmatched rivals end a path
+        nxt = [-1] * m
+        for j in range(m):
+            i = rival[j]
+            if i >= 0 and assignment[i] != UNMATCHED:
+                nxt[j] = indices[assignment[i]]
+        # 0: unvisited, 1: on the current path, 2: done
+        state = bytearray(m)
+        for s in range(m):
+            path = []
+            j = s
+            while j >= 0 and not state[j]:
+                state[j] = 1
+                path.append(j)
+                j = nxt[j]
+            if j >= 0 and state[j] == 1:
+                rotations.append(tuple(path[path.index(j):]))
+            for j in path:
+                state[j] = 2
+
+    return {
+        'entries': entries,
+        'over_capacity': over,
+        'lost_guarantees': lost,
+        'blocking_pairs': blocking,
+        'rotations': rotations,
+    }
+
+
+# ─────────────────────────────────────────────────────────────
+# Stored results
+# ─────────────────────────────────────────────────────────────
+
+def _round_number(result):
+    try:
+        return result.counselling_round.number
+    except CounsellingRound.DoesNotExist:
+        return None
+
+
+def verify_result(result, data=None, plan=None, resolve=False):
+    """
+    Check `result` as described in the module docstring; returns a
+    report: 'ok', a count per PROBLEMS kind, 'examples' of each problem
+    found, 'checked' and 'skipped' students ('stale': how many of those
+    changed since the run), 'entries' compared and 'seconds' taken.
+
+    Pass the run's own `data` (and `plan`, for a later round) to skip
+    loading them; otherwise today's input is loaded and students saved
+    since the run are skipped. Raises ValueError if the branches or
+    quotas changed since the run.
+    """
+    from .rounds import plan_round  # imports this module
+
+    started = perf_counter()
+    changed = ()
+    if data is None:
+        data = load_matching_input()
+        if result.catalog_digest and result.catalog_digest != data.catalog:
+            raise ValueError('Branches or quotas changed since this run; it can no longer be checked.')
+        number = _round_number(result)
+        if number is not None and number > 1:
+            previous = CounsellingRound.objects.select_related('result').get(number=number - 1)
+            plan = plan_round(data, previous)
+        if result.snapshot_at is not None:
+            changed = StudentProfile.objects.filter(updated_at__gt=result.snapshot_at).values_list('id', flat=True)
+
+    n, m = data.num_students, data.num_slots
+    student_pos = {sid: i for i, sid in enumerate(data.student_ids)}
+    slot_pos = {data.slot_key(j): j for j in range(m)}
+    skip = bytearray(n)
+    for sid in changed:
+        i = student_pos.get(sid)
+        if i is not None:
+            skip[i] = 1
+    stale = sum(skip)
+    examples = []
+
+    def problem(kind, text):
+        if sum(1 for k, _ in examples if k == kind) < MAX_EXAMPLES:
+            examples.append((kind, text))
+
+    # Allotments as entry positions in `data`; students whose seat can't
+    # be placed are left out of the rest, but the seat stays taken
+    assignment = array('q', [UNMATCHED]) * n
+    taken = [0] * m
+    seen = bytearray(n)
+    duplicates = off_list = missing = 0
+    allotments = result.allotments.values_list('student_id', 'branch_id', 'quota', 'preference_rank')
+    for sid, bid, quota, pref_rank in allotments.iterator(chunk_size=20000):
+        i = student_pos.get(sid)
+        if i is None:
+            continue  # student created after the input was loaded
+        if seen[i]:
+            duplicates += 1
+            problem('duplicate_allotments', f"student #{sid} has more than one allotment")
+            continue
+        seen[i] = 1
+        if bid is None:
+            continue
+        key = f"{bid}:{quota}"
+        j = slot_pos.get(key)
+        p = UNMATCHED if j is None else data.find_entry(i, j, pref_rank)
+        if p == UNMATCHED:
+            if not skip[i]:
+                off_list += 1
+                problem('off_list', f"student #{sid} holds {key} as choice {pref_rank}, which is not on their list")
+            skip[i] = 1
+            if j is not None:
+                taken[j] += 1
+        assignment[i] = p
+    for i in range(n):
+        if not seen[i] and not skip[i]:
+            missing += 1
+            problem('missing_students', f"student #{data.student_ids[i]} has no allotment row")
+            skip[i] = 1
+
+    # Seats after de-reservation, as the run stored them
+    seats = array('l', data.seats)
+    for key, counts in result.seat_snapshot.items():
+        j = slot_pos.get(key)
+        if j is not None and len(counts) == 3:
+            seats[j] = counts[1]
+
+    # Stored totals, seat_snapshot and summaries against the allotments;
+    # only meaningful when every allotment was placed
+    mismatches = 0
+    if not any(skip):
+        fields = ('seats', 'filled', 'opening_air', 'closing_air')
+        expected = {(s.branch_id, s.quota): s for s in _summarize(data, assignment, seats)}
+        matched = sum(s.filled for s in expected.values())
+        if (result.total_matched, result.total_unmatched) != (matched, n - matched):
+            mismatches += 1
+            problem('summary_mismatches', f"totals say {result.total_matched} matched, allotments {matched}")
+        for stored in BranchSummary.objects.filter(result=result):
+            want = expected.pop((stored.branch_id, stored.quota), None)
+            if want is None:
+                continue
+            got, want = (tuple(getattr(s, f) for f in fields) for s in (stored, want))
+            counts = result.seat_snapshot.get(f"{stored.branch_id}:{stored.quota}")
+            if got != want or counts is None or counts[1:] != [want[0], want[1]]:
+                mismatches += 1
+                problem('summary_mismatches', f"{stored.branch_id}:{stored.quota} is stored as {got}, "
+                                              f"its allotments give {want}")
+        for bid, quota in expected:
+            mismatches += 1
+            problem('summary_mismatches', f"{bid}:{quota} has no summary")
+
+    # The kernel input the run solved
+    if plan is not None:
+        back = array('q', [UNMATCHED]) * len(data.indices)
+        for q, p in enumerate(plan.origin):
+            back[p] = q
+        for i, p in enumerate(assignment):
+            if p == UNMATCHED:
+                continue
+            q = back[p]
+            if q == UNMATCHED:
+                if not skip[i]:
+                    off_list += 1
+                    problem('off_list', f"student #{data.student_ids[i]} holds a seat their round did not offer them")
+                skip[i] = 1
+                taken[data.indices[p]] += 1
+            assignment[i] = q
+        indptr, indices, home = plan.indptr, plan.indices, plan.home
+    else:
+        indptr, indices, home = data.indptr, data.indices, None
+
+    found = check_matching(indptr, indices, data.air, seats, assignment, home=home, skip=skip, taken=taken)
+    slot = data.slot_key
+    for j, filled, cap in found['over_capacity']:
+        problem('over_capacity', f"{slot(j)} holds {filled} students for {cap} seats")
+    for i, j in found['lost_guarantees']:
+        problem('lost_guarantees', f"student #{data.student_ids[i]} lost their retained seat at {slot(j)}")
+    for i, j in found['blocking_pairs']:
+        problem('blocking_pairs', f"student #{data.student_ids[i]} and {slot(j)} would both rather have each other")
+    for cycle in found['rotations']:
+        problem('rotations', f"students can all move up along {' → '.join(slot(j) for j in cycle)}")
+
+    differs = None
+    if resolve:
+        differs = 0
+        rerun = gale_shapley(indptr, indices, data.air, seats, home=home)
+        for i in range(n):
+            if rerun[i] != assignment[i] and not skip[i]:
+                differs += 1
+                got, want = ('none' if p == UNMATCHED else slot(indices[p]) for p in (assignment[i], rerun[i]))
+                problem('differs_from_rerun', f"student #{data.student_ids[i]} holds {got}, a re-run gives {want}")
+
+    skipped = sum(skip)
+    report = {
+        'over_capacity': len(found['over_capacity']),
+        'summary_mismatches': mismatches,
+        'missing_students': missing,
+        'duplicate_allotments': duplicates,
+        'off_list': off_list,
+        'lost_guarantees': len(found['lost_guarantees']),
+        'blocking_pairs': len(found['blocking_pairs']),
+        'rotations': len(found['rotations']),
+        'differs_from_rerun': differs,
+        'checked': n - skipped,
+        'skipped': skipped,
+        'stale': stale,
+        'entries': found['entries'],
+        'examples': [text for _, text in examples],
+        'seconds': round(perf_counter() - started, 4),
+    }
+    report['ok'] = not any(report[kind] for kind, _, _ in PROBLEMS)
+    return report
+
+
+def verify_run(result, data, plan=None, progress=no_progress):
+    """
+    Verify a run's staging `result` against its own input before it is
+    activated, as phase 'verify'. Returns the report, or None when
+    MATCHING_VERIFY is off; raises VerificationError if it failed.
+    """
+    if not getattr(settings, 'MATCHING_VERIFY', True):
+        return None
+    progress('verify')
+    report = verify_result(result, data, plan)
+    if not report['ok']:
+        logger.error('Matching result #%s failed verification: %s', result.pk, '; '.join(report['examples']))
+        raise VerificationError(result, report)
+    return report
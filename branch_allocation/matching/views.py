@@ -1,18 +1,41 @@
+import csv
+import itertools
 import json
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout, get_user_model
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_POST
+from django.conf import settings
 from django.db import transaction
+from django.db.models import F, Q
 
-from .models import Branch, StudentProfile, Preference, MatchingResult, Allotment
+from collegmatch import metrics
+
+from .models import (
+    Branch, StudentProfile, Preference, MatchingResult, MatchingProfile, SeatChoice, MatchingJob,
+)
 from .forms import StudentSignupForm, StudentLoginForm, BranchForm, AdminStudentForm, AdminStudentRankForm
-from .algorithm import run_gale_shapley
+from .allotment_cache import allotment_page
+from .importer import import_students, import_preferences
+from .jobs import submit_job, job_status, JobAlreadyRunning
+from .preferences import (
+    save_order, order_token, default_order, stored_order, iter_stored_heads, StaleOrder,
+)
+from .rounds import current_round
+from .search import filter_students
 
 User = get_user_model()
 
+# Results page buttons → background job kind
+JOB_ACTIONS = {
+    'run_matching': MatchingJob.FULL,
+    'run_incremental': MatchingJob.INCREMENTAL,
+    'run_round': MatchingJob.ROUND,
+}
+
 
 def is_admin(user):
     return user.is_staff or user.is_superuser
@@ -43,6 +66,7 @@ def login_view(request):
             signup_form = StudentSignupForm(request.POST)
             if signup_form.is_valid():
                 user, profile = signup_form.save()
+                metrics.inc('signups')
                 login(request, user)
                 messages.success(request, f'Welcome, {profile.display_name()}! Your account has been created.')
                 return redirect('student_preferences')
@@ -111,15 +135,15 @@ def admin_setup(request):
         if action == 'add_branch':
             branch_form = BranchForm(request.POST)
             if branch_form.is_valid():
-                new_branch = branch_form.save()
-                # Add to end of all existing students' pref lists
-                for profile in StudentProfile.objects.all():
-                    max_rank = profile.preferences.count()
-                    Preference.objects.get_or_create(
-                        student=profile, branch=new_branch,
-                        defaults={'rank': max_rank + 1}
-                    )
-                messages.success(request, f'Branch "{new_branch}" added.')
+                try:
+                    with transaction.atomic():
+                        new_branch = branch_form.save()
+                        # Added to the end of every student's list in the background
+                        submit_job(MatchingJob.ADD_BRANCH, user=request.user, branch=new_branch)
+                except JobAlreadyRunning:
+                    messages.error(request, 'Wait for the running job to finish before adding a branch.')
+                    return redirect('admin_setup')
+                messages.success(request, f'Branch "{new_branch}" added; updating preference lists.')
                 return redirect('admin_setup')
             else:
                 messages.error(request, 'Please fix the errors below.')
@@ -174,33 +198,58 @@ def admin_setup(request):
         'student_form': student_form,
         'submitted_count': submitted_count,
         'total_seats': total_seats,
+        'job': MatchingJob.objects.first(),
     })
 
 
 @login_required
 @user_passes_test(is_admin, login_url='/login/')
 def admin_preferences(request):
-    """Admin: view all students' preference submissions."""
+    """
+    Admin: view all students' preference submissions.
+
+    Students are listed by (air_rank, id), unranked last, one page at a
+    time with keyset pagination: the page after (or before) a cursor is
+    an index range scan, however deep it is. Top-5 preferences and list
+    lengths for the whole page come from one windowed query.
+    """
     q = request.GET.get('q', '').strip()
-    students = StudentProfile.objects.select_related('user').order_by('air_rank')
-    if q:
-        students = students.filter(
-            user__first_name__icontains=q
-        ) | StudentProfile.objects.filter(
-            user__last_name__icontains=q
-        ) | StudentProfile.objects.filter(
-            user__username__icontains=q
-        )
-        students = students.distinct().order_by('air_rank')
-
-    student_data = []
-    for profile in students:
-        top5 = profile.preferences.order_by('rank').select_related('branch')[:5]
-        student_data.append({
+    page_size = getattr(settings, 'ADMIN_PREFERENCES_PAGE_SIZE', 50)
+
+    students = filter_students(StudentProfile.objects.select_related('user'), q)
+
+    after = _parse_cursor(request.GET.get('after'))
+    before = _parse_cursor(request.GET.get('before')) if after is None else None
+    if before is not None:
+        page = list(students.filter(_before_cursor(*before)).order_by(*STUDENT_ORDER_DESC)[:page_size + 1])
+        has_prev, has_next = len(page) > page_size, True
+        page = page[:page_size][::-1]
+    else:
+        if after is not None:
+            students = students.filter(_after_cursor(*after))
+        page = list(students.order_by(*STUDENT_ORDER)[:page_size + 1])
+        has_prev, has_next = after is not None, len(page) > page_size
+        page = page[:page_size]
+
+    heads = {sid: (head, total) for sid, head, total in iter_stored_heads([profile.id for profile in page], 5)}
+    # Students without a stored list show the default order
+    order = default_order()
+    branches = Branch.objects.in_bulk(set(order[:5]).union(*(head for head, _ in heads.values())))
+
+    def top5(ids):
+        return [Preference(branch=branches[bid], rank=rank) for rank, bid in enumerate(ids, start=1) if bid in branches]
+
+    default_top5 = top5(order[:5])
+
+    student_data = [
+        {
             'profile': profile,
-            'top5': top5,
-            'total_prefs': profile.preferences.count(),
-        })
+            'top5': top5(heads[profile.id][0]) if profile.id in heads else default_top5,
+            'total_prefs': heads[profile.id][1] if profile.id in heads else len(order),
+            'is_default': profile.id not in heads,
+        }
+        for profile in page
+    ]
 
     submitted = StudentProfile.objects.filter(has_submitted=True).count()
     total = StudentProfile.objects.count()
@@ -211,9 +260,63 @@ def admin_preferences(request):
         'total': total,
         'pending': total - submitted,
         'q': q,
+        'prev_cursor': _cursor(page[0]) if page and has_prev else None,
+        'next_cursor': _cursor(page[-1]) if page and has_next else None,
     })
 
 
+@login_required
+@user_passes_test(is_admin, login_url='/login/')
+def admin_student_search(request):
+    """Admin: JSON autocomplete of students by name or username prefix."""
+    q = request.GET.get('q', '').strip()
+    if not q:
+        return JsonResponse({'results': []})
+    limit = getattr(settings, 'STUDENT_SEARCH_LIMIT', 10)
+    students = filter_students(StudentProfile.objects.all(), q).order_by(*STUDENT_ORDER)[:limit]
+    return JsonResponse({'results': [
+        {
+            'id': sid,
+            'name': f"{first} {last}".strip() or username,
+            'username': username,
+            'air_rank': air_rank,
+        }
+        for sid, first, last, username, air_rank in students.values_list(
+            'id', 'user__first_name', 'user__last_name', 'user__username', 'air_rank',
+        )
+    ]})
+
+
+# Keyset order for student lists: AIR, unranked last, then id
+STUDENT_ORDER = [F('air_rank').asc(nulls_last=True), 'id']
+STUDENT_ORDER_DESC = [F('air_rank').desc(nulls_first=True), '-id']
+
+
+def _cursor(profile):
+    # "air:id", with an empty air for unranked students
+    return f"{profile.air_rank or ''}:{profile.id}"
+
+
+def _parse_cursor(value):
+    try:
+        air, pk = (value or '').split(':')
+        return (int(air) if air else None), int(pk)
+    except ValueError:
+        return None
+
+
+def _after_cursor(air, pk):
+    if air is None:
+        return Q(air_rank__isnull=True, id__gt=pk)
+    return Q(air_rank__gt=air) | Q(air_rank=air, id__gt=pk) | Q(air_rank__isnull=True)
+
+
+def _before_cursor(air, pk):
+    if air is None:
+        return Q(air_rank__isnull=False) | Q(air_rank__isnull=True, id__lt=pk)
+    return Q(air_rank__lt=air) | Q(air_rank=air, id__lt=pk)
+
+
 @login_required
 @user_passes_test(is_admin, login_url='/login/')
 def admin_student_ranks(request):
@@ -225,7 +328,7 @@ def admin_student_ranks(request):
         if rank_form.is_valid():
             profile = rank_form.cleaned_data['student']
             profile.air_rank = rank_form.cleaned_data['air_rank']
-            profile.save(update_fields=['air_rank'])
+            profile.save(update_fields=['air_rank', 'updated_at'])
             messages.success(request, f'Updated AIR rank for "{profile.user.get_full_name() or profile.user.username}".')
             return redirect('admin_student_ranks')
         messages.error(request, 'Fix the rank form errors.')
@@ -242,10 +345,22 @@ def admin_student_ranks(request):
 def admin_student_detail(request, student_id):
     """Admin: view full preference list for one student."""
     profile = get_object_or_404(StudentProfile, id=student_id)
-    prefs = profile.preferences.order_by('rank').select_related('branch')
+    ranked = stored_order(profile)
+    is_default = not ranked
+    if is_default:
+        # No stored list: the student ranks the catalog in its default order
+        prefs = [Preference(branch=branch, rank=rank) for rank, branch in enumerate(Branch.objects.all(), start=1)]
+    else:
+        branches = Branch.objects.in_bulk(ranked)
+        prefs = [
+            Preference(branch=branches[bid], rank=rank)
+            for rank, bid in enumerate(ranked, start=1)
+            if bid in branches
+        ]
     return render(request, 'matching/admin_student_detail.html', {
         'profile': profile,
         'prefs': prefs,
+        'is_default': is_default,
     })
 
 
@@ -253,53 +368,234 @@ def admin_student_detail(request, student_id):
 @user_passes_test(is_admin, login_url='/login/')
 def admin_results(request):
     """Admin: run matching and view results."""
-    if request.method == 'POST' and request.POST.get('action') == 'run_matching':
-        result = run_gale_shapley()
-        if result:
-            messages.success(request, f'✅ Stable matching complete! {result.total_matched} students matched.')
-        else:
-            messages.error(request, 'Add students and branches first.')
+    action = request.POST.get('action') if request.method == 'POST' else None
+    if action in JOB_ACTIONS:
+        try:
+            job = submit_job(JOB_ACTIONS[action], user=request.user)
+            messages.info(request, f'⏳ {job.get_kind_display()} started — this page updates when it finishes.')
+        except JobAlreadyRunning:
+            messages.error(request, 'A matching run is already in progress.')
         return redirect('admin_results')
 
     result = MatchingResult.objects.filter(is_active=True).first()
-    allotments_by_branch = {}
-    unmatched = []
+    summaries = {}
 
     if result:
-        for allotment in result.allotments.select_related('student__user', 'branch').order_by('branch__college', 'branch__branch'):
-            if allotment.is_matched and allotment.branch:
-                key = allotment.branch.id
-                if key not in allotments_by_branch:
-                    allotments_by_branch[key] = {'branch': allotment.branch, 'allotments': []}
-                allotments_by_branch[key]['allotments'].append(allotment)
-            elif not allotment.is_matched:
-                unmatched.append(allotment)
+        for summary in result.branch_summaries.all():
+            summaries.setdefault(summary.branch_id, []).append(summary)
 
     branches = Branch.objects.all()
     branch_results = []
     for branch in branches:
-        allots = allotments_by_branch.get(branch.id, {}).get('allotments', [])
+        rows = summaries.get(branch.id, [])
+        seats = sum(row.seats for row in rows) if rows else branch.seats
+        filled = sum(row.filled for row in rows)
+        opening = [row.opening_air for row in rows if row.opening_air is not None]
+        closing = [row.closing_air for row in rows if row.closing_air is not None]
         branch_results.append({
             'branch': branch,
-            'allotments': allots,
-            'filled': len(allots),
-            'empty': branch.seats - len(allots),
+            'seats': seats,
+            'filled': filled,
+            'empty': seats - filled,
+            'opening_air': min(opening) if opening else None,
+            'closing_air': max(closing) if closing else None,
+            'quotas': rows if len(rows) > 1 else [],
         })
 
     return render(request, 'matching/admin_results.html', {
         'result': result,
         'branch_results': branch_results,
-        'unmatched': unmatched,
+        'counselling_round': current_round(),
+        'job': MatchingJob.objects.first(),
+        'has_profile': result is not None and MatchingProfile.objects.filter(result=result).exists(),
+    })
+
+
+@login_required
+@user_passes_test(is_admin, login_url='/login/')
+def admin_job_status(request, job_id):
+    """Admin: JSON progress of a background matching job, for polling."""
+    job = get_object_or_404(MatchingJob, pk=job_id)
+    return JsonResponse(job_status(job))
+
+
+def _parse_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+@login_required
+@user_passes_test(is_admin, login_url='/login/')
+def admin_result_branch(request, branch_id=None):
+    """
+    Admin: one page of a branch's allotments in the active result, or of
+    the unmatched students when `branch_id` is None.
+
+    Allotments are written in merit order, so paging by id (?after= /
+    ?before=) lists students by AIR and walks the (result, branch, id)
+    index instead of loading the whole result.
+    """
+    result = MatchingResult.objects.filter(is_active=True).first()
+    if not result:
+        return redirect('admin_results')
+    branch = get_object_or_404(Branch, pk=branch_id) if branch_id is not None else None
+    page_size = getattr(settings, 'RESULTS_PAGE_SIZE', 100)
+
+    allotments = result.allotments.filter(branch=branch).select_related('student__user')
+    after = _parse_id(request.GET.get('after'))
+    before = _parse_id(request.GET.get('before')) if after is None else None
+    if before is not None:
+        page = list(allotments.filter(id__lt=before).order_by('-id')[:page_size + 1])
+        has_prev, has_next = len(page) > page_size, True
+        page = page[:page_size][::-1]
+    else:
+        if after is not None:
+            allotments = allotments.filter(id__gt=after)
+        page = list(allotments.order_by('id')[:page_size + 1])
+        has_prev, has_next = after is not None, len(page) > page_size
+        page = page[:page_size]
+
+    summaries = list(result.branch_summaries.filter(branch=branch)) if branch else []
+    return render(request, 'matching/admin_result_branch.html', {
+        'result': result,
+        'branch': branch,
+        'summaries': summaries if len(summaries) > 1 else [],
+        'filled': sum(row.filled for row in summaries) if branch else result.total_unmatched,
+        'seats': sum(row.seats for row in summaries),
+        'allotments': page,
+        'prev_cursor': page[0].id if page and has_prev else None,
+        'next_cursor': page[-1].id if page and has_next else None,
     })
 
 
+# Export columns, as Allotment.values_list() lookups
+EXPORT_FIELDS = [
+    ('student_id', 'student_id'),
+    ('username', 'student__user__username'),
+    ('first_name', 'student__user__first_name'),
+    ('last_name', 'student__user__last_name'),
+    ('air_rank', 'student__air_rank'),
+    ('category', 'student__category'),
+    ('matched', 'is_matched'),
+    ('branch_id', 'branch_id'),
+    ('college', 'branch__college'),
+    ('branch', 'branch__branch'),
+    ('quota', 'quota'),
+    ('preference_rank', 'preference_rank'),
+]
+
+
+class _Echo:
+    """File-like object for csv.writer that hands rows back instead of buffering them."""
+
+    def write(self, value):
+        return value
+
+
+@login_required
+@user_passes_test(is_admin, login_url='/login/')
+def admin_results_export(request):
+    """
+    Admin: stream a whole matching result (the active one, or ?result=id)
+    as CSV or, with ?format=jsonl, one JSON object per line.
+
+    Rows are read with a server-side iterator in chunks of
+    RESULTS_EXPORT_CHUNK_SIZE and written out as they arrive, so memory
+    stays flat however many students there are.
+    """
+    result_id = _parse_id(request.GET.get('result'))
+    if result_id is not None:
+        result = get_object_or_404(MatchingResult, pk=result_id)
+    else:
+        result = MatchingResult.objects.filter(is_active=True).first()
+        if not result:
+            messages.error(request, 'Run the matching first.')
+            return redirect('admin_results')
+
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in ('csv', 'jsonl'):
+        return HttpResponseBadRequest('format must be csv or jsonl')
+
+    names = [name for name, _ in EXPORT_FIELDS]
+    rows = (
+        result.allotments
+        .order_by('id')
+        .values_list(*[lookup for _, lookup in EXPORT_FIELDS])
+        .iterator(chunk_size=getattr(settings, 'RESULTS_EXPORT_CHUNK_SIZE', 5000))
+    )
+    if fmt == 'jsonl':
+        lines = (json.dumps(dict(zip(names, row))) + '\n' for row in rows)
+        content_type = 'application/x-ndjson'
+    else:
+        writer = csv.writer(_Echo())
+        lines = itertools.chain([writer.writerow(names)], (writer.writerow(row) for row in rows))
+        content_type = 'text/csv'
+
+    response = StreamingHttpResponse(lines, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="matching-result-{result.pk}.{fmt}"'
+    return response
+
+
+@login_required
+@user_passes_test(is_admin, login_url='/login/')
+def admin_results_stats(request):
+    """
+    Admin: download the stats of every matching run (see profiling.py),
+    newest first, or of one with ?result=id, as JSON.
+    """
+    runs = MatchingResult.objects.order_by('-run_at')
+    result_id = _parse_id(request.GET.get('result'))
+    if result_id is not None:
+        runs = runs.filter(pk=result_id)
+    rows = [
+        {**row, 'run_at': row['run_at'].isoformat(), 'has_profile': row.pop('profile') is not None}
+        for row in runs.values(
+            'id', 'run_at', 'is_active', 'total_matched', 'total_unmatched', 'total_unfilled', 'stats', 'profile',
+        )
+    ]
+    response = JsonResponse(rows, safe=False, json_dumps_params={'indent': 1})
+    name = f'matching-stats-{result_id}' if result_id is not None else 'matching-stats'
+    response['Content-Disposition'] = f'attachment; filename="{name}.json"'
+    return response
+
+
+@login_required
+@user_passes_test(is_admin, login_url='/login/')
+def admin_results_profile(request, result_id):
+    """Admin: download a run's cProfile capture, for pstats.Stats or snakeviz."""
+    profile = get_object_or_404(MatchingProfile, result_id=result_id)
+    response = HttpResponse(bytes(profile.data), content_type='application/octet-stream')
+    response['Content-Disposition'] = f'attachment; filename="matching-run-{result_id}.prof"'
+    return response
+
+
 # ─────────────────────────────────────────────────────────────
 # STUDENT VIEWS
 # ─────────────────────────────────────────────────────────────
 
+def _valid_body(ordered_ids, moves):
+    # ordered_ids a list; moves, if sent, a list of [branch_id, position] int pairs
+    if not isinstance(ordered_ids, list):
+        return False
+    if moves is None:
+        return True
+    return isinstance(moves, list) and all(
+        isinstance(move, list) and len(move) == 2 and all(type(value) is int for value in move)
+        for move in moves
+    )
+
+
 @login_required
 def student_preferences(request):
-    """Student: view and update their preference list."""
+    """
+    Student: view and update their preference list.
+
+    POST takes {"ordered_ids": [...]} or, for just the rows dragged since
+    the page loaded, {"moves": [[branch_id, position], ...], "base": token};
+    see preferences.save_order().
+    """
     if request.user.is_staff:
         return redirect('admin_setup')
 
@@ -310,66 +606,88 @@ def student_preferences(request):
         try:
             data = json.loads(request.body)
             ordered_ids = data.get('ordered_ids', [])
+            moves = data.get('moves')
         except (json.JSONDecodeError, AttributeError):
-            return JsonResponse({'error': 'Invalid data'}, status=400)
+            return JsonResponse({'success': False, 'error': 'Invalid data'}, status=400)
+        if not _valid_body(ordered_ids, moves):
+            return JsonResponse({'success': False, 'error': 'Invalid data'}, status=400)
 
-        if not ordered_ids:
+        if not ordered_ids and moves is None:
             return JsonResponse({'error': 'Empty preference list'}, status=400)
 
-        with transaction.atomic():
-            Preference.objects.filter(student=profile).delete()
-            prefs_to_create = []
-            for rank, branch_id in enumerate(ordered_ids, start=1):
-                try:
-                    branch = Branch.objects.get(id=int(branch_id))
-                    prefs_to_create.append(Preference(student=profile, branch=branch, rank=rank))
-                except (Branch.DoesNotExist, ValueError):
-                    continue
-            Preference.objects.bulk_create(prefs_to_create)
-            profile.has_submitted = True
-            profile.save()
+        try:
+            changed, token = save_order(profile, ordered_ids, base_token=data.get('base'), moves=moves)
+        except StaleOrder:
+            return JsonResponse({'error': 'Your list changed since this page was loaded.'}, status=409)
+        except ValueError as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
 
-        return JsonResponse({'success': True, 'message': 'Preferences saved!'})
+        metrics.inc('preference_saves')
+        return JsonResponse({'success': True, 'message': 'Preferences saved!', 'changed': changed, 'base': token})
 
     # GET: build ordered pref list
-    existing_prefs = list(
-        profile.preferences.order_by('rank').select_related('branch')
-    )
-    existing_branch_ids = {p.branch_id for p in existing_prefs}
+    by_id = {branch.id: branch for branch in branches}
+    ranked = [bid for bid in stored_order(profile) if bid in by_id]
+    listed = set(ranked)
 
-    # Append any branches not yet in their list (e.g. added after signup)
-    extra_branches = [b for b in branches if b.id not in existing_branch_ids]
-    ordered_branches = [p.branch for p in existing_prefs] + extra_branches
+    # Append any branches not yet in their list (e.g. added since they saved it)
+    extra_branches = [b for b in by_id.values() if b.id not in listed]
+    ordered_branches = [by_id[bid] for bid in ranked] + extra_branches
 
     return render(request, 'matching/student_preferences.html', {
         'profile': profile,
         'ordered_branches': ordered_branches,
+        'order_token': order_token([b.id for b in ordered_branches]),
         'total_branches': branches.count(),
     })
 
 
 @login_required
 def student_allotment(request):
-    """Student: view their allotment result."""
+    """Student: view their allotment result (served from allotment_cache)."""
     if request.user.is_staff:
         return redirect('admin_setup')
 
     profile = get_object_or_404(StudentProfile, user=request.user)
-    result = MatchingResult.objects.filter(is_active=True).first()
-    allotment = None
-
-    if result:
-        allotment = Allotment.objects.filter(result=result, student=profile).select_related('branch').first()
-
-    top_prefs = profile.preferences.order_by('rank').select_related('branch')[:15]
-    total_prefs = profile.preferences.count()
+    page = allotment_page(profile)
+    allotment = page['allotment']
+
+    # Seat choice for the next counselling round, if this result is the latest round
+    counselling_round = page['round']
+    seat_choice = None
+    if counselling_round and allotment and allotment['is_matched']:
+        choices = dict(
+            SeatChoice.objects
+            .filter(student=profile)
+            .filter(Q(round_id=counselling_round['id']) | Q(choice=SeatChoice.FREEZE))
+            .values_list('round_id', 'choice')
+        )
+        if SeatChoice.FREEZE in choices.values():
+            counselling_round = None  # frozen seats are final
+        else:
+            seat_choice = choices.get(counselling_round['id'])
+    else:
+        counselling_round = None
+    if counselling_round and request.method == 'POST' and request.POST.get('action') == 'seat_choice':
+        choice = request.POST.get('choice')
+        if choice in dict(SeatChoice.CHOICES):
+            SeatChoice.objects.update_or_create(
+                round_id=counselling_round['id'], student=profile, defaults={'choice': choice},
+            )
+            messages.success(request, 'Your seat choice has been saved.')
+        else:
+            messages.error(request, 'Please pick a valid option.')
+        return redirect('student_allotment')
 
     return render(request, 'matching/student_allotment.html', {
         'profile': profile,
-        'result': result,
+        'result': page['result'],
         'allotment': allotment,
-        'top_prefs': top_prefs,
-        'total_prefs': total_prefs,
+        'counselling_round': counselling_round,
+        'seat_choice': seat_choice or SeatChoice.DEFAULT,
+        'seat_choice_options': SeatChoice.CHOICES,
+        'top_prefs': page['top_prefs'],
+        'total_prefs': page['total_prefs'],
     })
 
 
@@ -560,23 +878,13 @@ def _load_demo_data():
         'air450_v4': bp([32,35,37,39,41,43,45,47,49,51,53,55,57,59,60], 18),
     }
 
-    profiles = []
-    prefs_to_create = []
+    students = []
+    lists = []
 
     for i, (first, last) in enumerate(student_names):
         air = i + 1
         username = f"air{air:03d}_{first.lower()}"
-        # Make username unique if collision
-        if User.objects.filter(username=username).exists():
-            username = f"{username}_{air}"
-        user = User.objects.create_user(
-            username=username,
-            password='jee2025',
-            first_name=first,
-            last_name=last,
-        )
-        profile = StudentProfile.objects.create(user=user, air_rank=air, has_submitted=True)
-        profiles.append(profile)
+        students.append({'username': username, 'first_name': first, 'last_name': last, 'air_rank': air})
 
         # Pick preference pattern
         v = air % 5
@@ -592,10 +900,11 @@ def _load_demo_data():
             key = f'air450_v{v}'
 
         ordered_indices = pref_patterns.get(key, all_ids)
-        for rank, branch_idx in enumerate(ordered_indices, start=1):
-            if branch_idx < len(branches):
-                prefs_to_create.append(
-                    Preference(student=profile, branch=branches[branch_idx], rank=rank)
-                )
-
-    Preference.objects.bulk_create(prefs_to_create, ignore_conflicts=True)
+        lists.append({'username': username, 'preferences': [
+            [branches[branch_idx].college, branches[branch_idx].branch]
+            for branch_idx in ordered_indices if branch_idx < len(branches)
+        ]})
+
+    # One password hash for everyone instead of one per student
+    import_students(students, password_hash=make_password('jee2025'))
+    import_preferences(lists)